@@ -10,7 +10,11 @@ python manage.py collectstatic --noinput
 echo "🚀 Starting Django with Gunicorn..."
 # Gunicorn を worker=2にして安定稼働
 # workerを1から2に変更(片方が重くなった場合、もう片方で処理)
+# 詳細画面の票数のリアルタイム更新(Server-Sent Events)は接続を開いたままにするので、
+# 1リクエストでワーカーが塞がらないようスレッドで処理する(gthread)
 exec gunicorn sample.wsgi:application \
     --workers 2 \
+    --worker-class gthread \
+    --threads 32 \
     --bind 0.0.0.0:8000 \
     --forwarded-allow-ips="*"
\ No newline at end of file
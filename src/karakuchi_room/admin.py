@@ -1,15 +1,84 @@
 from django.contrib import admin
 
-from karakuchi_room.models import User, Survey, Option, Vote, Tag, TagSurvey
+from karakuchi_room.models import (
+    User,
+    Survey,
+    Option,
+    Vote,
+    Tag,
+    TagSurvey,
+    soft_delete_cascade,
+)
 
+from django.contrib import messages
+from django.db import transaction
 from django.forms import ValidationError
 from django.forms.models import BaseInlineFormSet
 
+from karakuchi_room.ai_filters import ModerationUnavailable, moderate_batch
+from karakuchi_room.moderation import VERDICT_FIELDS, record_verdict
+
+
+# 管理画面の削除も論理削除にする
+# 一覧画面の「選択したものを削除」は QuerySet.delete()（物理削除）になるので、
+# 子のデータも含めてまとめて論理削除する soft_delete_cascade() に差し替える
+# （User の objects は UserManager なので、QuerySet のメソッドではなく関数で呼ぶ）
+class SoftDeleteAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        soft_delete_cascade(queryset)
+
+
 # 管理画面でテストデータを入れるために実装
-(admin.site.register(User),)
-(admin.site.register(Option),)
-(admin.site.register(Vote),)
-(admin.site.register(Tag),)
+(admin.site.register(User, SoftDeleteAdmin),)
+(admin.site.register(Option, SoftDeleteAdmin),)
+(admin.site.register(Tag, SoftDeleteAdmin),)
+
+
+# 投票のコメントを管理画面から審査し直せるようにする
+# 選択したコメントは OpenAI にまとめて問い合わせる（1件ずつ問い合わせるより呼び出し回数が少ない）
+@admin.register(Vote)
+class VoteAdmin(SoftDeleteAdmin):
+    list_display = ("id", "survey", "user", "comment", "moderation_status")
+    # アンケート名・投票者名を行ごとに読まないよう JOIN で一緒に読む
+    list_select_related = ("survey", "user")
+    list_filter = ("moderation_status",)
+    actions = ["moderate_comments"]
+
+    @admin.action(description="選択した投票のコメントを審査し直す")
+    def moderate_comments(self, request, queryset):
+        # 循環 import を避けるためここで import する
+        from karakuchi_room.results import discard_snapshot
+
+        votes = [vote for vote in queryset if (vote.comment or "").strip()]
+        if not votes:
+            return
+
+        try:
+            verdicts = moderate_batch(
+                [vote.comment for vote in votes], fail_policy="raise"
+            )
+        except ModerationUnavailable as e:
+            self.message_user(
+                request, f"コメントを審査できませんでした: {e}", messages.ERROR
+            )
+            return
+
+        for vote, flagged in zip(votes, verdicts):
+            vote.moderation_status = (
+                Vote.MODERATION_REJECTED if flagged else Vote.MODERATION_APPROVED
+            )
+            record_verdict(vote, vote.comment, flagged)
+
+        with transaction.atomic():
+            Vote.all_objects.bulk_update(votes, ["moderation_status", *VERDICT_FIELDS])
+            for survey_id in {vote.survey_id for vote in votes}:
+                discard_snapshot(survey_id)
+
+        rejected = sum(verdicts)
+        self.message_user(
+            request,
+            f"{len(votes)}件のコメントを審査しました（非公開: {rejected}件）",
+        )
 
 
 # 管理画面でSurvey編集画面に表示される「中間テーブルの編集フォーム」の定義
@@ -47,5 +116,5 @@ class OptionInline(admin.TabularInline):
 
 # Surveyを管理画面に登録している
 @admin.register(Survey)
-class SurveyAdmin(admin.ModelAdmin):
+class SurveyAdmin(SoftDeleteAdmin):
     inlines = [TagSurveyInline, OptionInline]
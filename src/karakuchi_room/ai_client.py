@@ -0,0 +1,117 @@
+# OpenAI のクライアントを全ての AI 呼び出し（誹謗中傷チェック・コメントの書き換え）で共有する
+# リクエストのたびに OpenAI() を作ると、毎回 TLS の接続からやり直しになるため、
+# httpx のコネクションプール(keep-alive)付きのクライアントを1つ作って使い回す
+#
+# Gunicorn は起動後にワーカーを fork するので、親プロセスで作った接続を子に持ち込まないよう
+# プロセスID が変わっていたら作り直す（初回の呼び出し時に作るので、通常は親では作られない）
+#
+# OPENAI_BASE_URL を設定すると接続先を変えられる（fake_openai_server で起動した代わりのサーバーなど）
+#
+# 複数の問い合わせを同時に投げて、先に返った方以外を取り消したい処理（誹謗中傷チェック）は
+# AsyncOpenAI を使う。プロセスごとに1つのイベントループを専用スレッドで動かし、
+# run_async() でそこに処理を渡す（取り消すと、実行中の HTTP リクエストも切断される）
+import asyncio
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI
+
+_client = None
+_pid = None
+_lock = threading.Lock()
+
+# AsyncOpenAI はイベントループのスレッドの中でだけ作り・使う
+_loop = None
+_loop_pid = None
+_async_client = None
+
+
+def _http_options():
+    return {
+        "limits": httpx.Limits(
+            max_connections=getattr(settings, "OPENAI_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=getattr(settings, "OPENAI_MAX_KEEPALIVE", 10),
+            keepalive_expiry=getattr(settings, "OPENAI_KEEPALIVE_EXPIRY", 30),
+        ),
+        "timeout": httpx.Timeout(
+            getattr(settings, "OPENAI_TIMEOUT", 30),
+            connect=getattr(settings, "OPENAI_CONNECT_TIMEOUT", 5),
+        ),
+    }
+
+
+def _client_options():
+    base_url = getattr(settings, "OPENAI_BASE_URL", None)
+    return {
+        # 代わりのサーバーに繋ぐ時は API キーがなくてもよい
+        "api_key": os.environ["API_KEY"]
+        if base_url is None
+        else os.environ.get("API_KEY", "local"),
+        "base_url": base_url,
+        "max_retries": getattr(settings, "OPENAI_MAX_RETRIES", 2),
+    }
+
+
+def build_http_client():
+    """接続数・keep-alive・タイムアウトを設定した httpx のクライアント"""
+    return httpx.Client(**_http_options())
+
+
+def get_client():
+    """このプロセスで共有する OpenAI クライアントを返す（最初の呼び出しで作る）"""
+    global _client, _pid
+    pid = os.getpid()
+    if _client is None or _pid != pid:
+        with _lock:
+            if _client is None or _pid != pid:
+                # fork 前に作られていた場合は親の接続を閉じずに手放す（親はまだ使っている）
+                _client = OpenAI(http_client=build_http_client(), **_client_options())
+                _pid = pid
+    return _client
+
+
+def get_loop():
+    """AsyncOpenAI を動かすイベントループ（プロセスごとに1つ、最初の呼び出しで専用スレッドを起動する）"""
+    global _loop, _loop_pid, _async_client
+    pid = os.getpid()
+    if _loop is None or _loop_pid != pid:
+        with _lock:
+            if _loop is None or _loop_pid != pid:
+                # fork 前のループのスレッドは子プロセスにはないので作り直す
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="openai-async", daemon=True
+                ).start()
+                _loop, _loop_pid, _async_client = loop, pid, None
+    return _loop
+
+
+def get_async_client():
+    """このプロセスで共有する AsyncOpenAI クライアント（get_loop() のループの中で呼ぶ）"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(**_http_options()), **_client_options()
+        )
+    return _async_client
+
+
+def run_async(coro):
+    """コルーチンを共有のイベントループで実行し、concurrent.futures.Future を返す"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def close_client():
+    """接続を閉じる（テストやコマンドの終了時用）"""
+    global _client, _pid, _async_client
+    with _lock:
+        if _client is not None and _pid == os.getpid():
+            _client.close()
+        _client = None
+        _pid = None
+
+        if _async_client is not None and _loop_pid == os.getpid():
+            asyncio.run_coroutine_threadsafe(_async_client.close(), _loop).result(5)
+        _async_client = None
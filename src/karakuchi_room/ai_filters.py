@@ -1,62 +1,30 @@
-from openai import OpenAI
-import os
-import re
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
 
-client = OpenAI(api_key=os.environ["API_KEY"])
+from django.conf import settings
+from django.db import connection
 
-# --------------------------
-# NGワード（弱攻撃含む）
-# --------------------------
-NG_PATTERNS = [
-    r"むかつく",
-    r"ムカつく",
-    r"ムカツク",
-    r"腹立つ",
-    r"ばか",
-    r"バカ",
-    r"馬鹿",
-    r"アホ",
-    r"ボケ",
-    r"死ね",
-    r"しね",
-    r"殺す",
-    r"ころす",
-]
-
-
-def contains_ng_word(text: str) -> bool:
-    """独自NGワードの検出"""
-    return any(re.search(p, text) for p in NG_PATTERNS)
-
-
-def is_offensive(text: str) -> bool:
-    """ChatGPT によるカスタム誹謗中傷チェック"""
-
-    if not text or not text.strip():
-        return False
-
-    # --------------------------
-    # ① NGワード辞書チェック（最優先）
-    # --------------------------
-    if contains_ng_word(text):
-        return True
+from . import metrics, verdict_cache
+from .ai_client import get_async_client, get_client, run_async
+from .caching import Batcher
+from .circuit_breaker import CircuitBreaker
+from .moderation_backends import get_backends
 
-    # --------------------------
-    # ② Moderation API
-    # --------------------------
-    moderation = client.moderations.create(model="omni-moderation-latest", input=text)
-    if moderation.results[0].flagged:
-        return True
-
-    # --------------------------
-    # ③ ChatGPT による弱攻撃判定
-    # --------------------------
-
-    prompt = f"""
-あなたは誹謗中傷検知AIです。
+logger = logging.getLogger(__name__)
 
-次の文章が以下のいずれかに該当する場合、必ず「NG」と判断してください。
+# --------------------------
+# 判定に使うモデルとプロンプト
+# --------------------------
+MODERATION_MODEL = "omni-moderation-latest"
+CHAT_MODEL = "gpt-4o-mini"
 
+# 判定基準（1件ずつ判定するプロンプトと、まとめて判定するプロンプトで共通）
+MODERATION_CRITERIA = """
 【NGとする】
 - 他者への侮辱（例：ばか、バカ、馬鹿、アホ、ボケなど全バリエーション）
 - 人格否定（例：お前は価値がない、無能など）
@@ -68,18 +36,449 @@ def is_offensive(text: str) -> bool:
 
 【OKとする】
 - 攻撃性のない批評（例：改善の余地があると思います）
+"""
+
+MODERATION_PROMPT = (
+    """
+あなたは誹謗中傷検知AIです。
 
+次の文章が以下のいずれかに該当する場合、必ず「NG」と判断してください。
+"""
+    + MODERATION_CRITERIA
+    + """
 必ず「OK」か「NG」だけを返してください。
 
 文章：
 {text}
 """
+)
+
+# 複数のコメントを1回で判定するプロンプト（コメントは1行に1件の JSON で渡す）
+MODERATION_BATCH_PROMPT = (
+    """
+あなたは誹謗中傷検知AIです。
+
+次の各コメントが以下のいずれかに該当する場合、そのコメントは必ず「NG」と判断してください。
+コメント同士は無関係なので、1件ずつ独立に判断してください。
+"""
+    + MODERATION_CRITERIA
+    + """
+次の JSON だけを返してください（全てのコメントの id を含めること）。
+{{"results": [{{"id": コメントのid, "verdict": "OK" または "NG"}}]}}
+
+コメント：
+{items}
+"""
+)
+
+# 判定ポリシーのバージョン（判定キャッシュのキーに含める）
+# モデル名やプロンプトを変えると自動で変わり、古い判定結果は使われなくなる
+# プロンプト以外の理由で判定をやり直したい時は先頭の番号を上げる
+MODERATION_POLICY_VERSION = "1:{}:{}:{}".format(
+    MODERATION_MODEL,
+    CHAT_MODEL,
+    hashlib.sha256(
+        (MODERATION_PROMPT + MODERATION_BATCH_PROMPT).encode("utf-8")
+    ).hexdigest()[:8],
+)
+
+
+class ModerationUnavailable(Exception):
+    """OpenAI での判定が期限内に終わらなかった・失敗した・ブレーカーで止めている"""
+
+
+# 同時に OpenAI に問い合わせる数の上限（プロセスごと）。(イベントループ, Semaphore)
+_semaphore = None
+
+# 連続で失敗したらしばらく OpenAI を呼ばない
+breaker = CircuitBreaker(
+    "moderation",
+    failure_threshold=getattr(settings, "MODERATION_CIRCUIT_FAILURES", 5),
+    reset_timeout=getattr(settings, "MODERATION_CIRCUIT_RESET", 30),
+)
+
+
+def _deadline():
+    # 判定全体にかけてよい時間（秒）
+    return getattr(settings, "MODERATION_DEADLINE", 10)
+
+
+def _api(timeout):
+    # 期限内に終わらない再試行はしない
+    # with_options は共有クライアントの接続プールをそのまま使う
+    return get_client().with_options(timeout=timeout, max_retries=0)
+
+
+def _async_api(timeout):
+    return get_async_client().with_options(timeout=timeout, max_retries=0)
+
+
+def _get_semaphore():
+    # Semaphore はイベントループごとに作る（fork 後はループが作り直される）
+    global _semaphore
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore[0] is not loop:
+        _semaphore = (
+            loop,
+            asyncio.Semaphore(getattr(settings, "MODERATION_MAX_CONCURRENCY", 8)),
+        )
+    return _semaphore[1]
+
+
+async def _limited(func, *args):
+    # 上限を超えた問い合わせは空くまで待つ（待っている間も期限の内）
+    async with _get_semaphore():
+        return await func(*args)
+
+
+def _run(coro, deadline):
+    """
+    共有のイベントループで実行して結果を待つ。
+    期限を過ぎたら取り消す（実行中の HTTP リクエストも切断され、接続とスレッドを手放す）
+    """
+    future = run_async(coro)
+    try:
+        return future.result(timeout=deadline)
+    except FuturesTimeoutError:
+        future.cancel()
+        raise TimeoutError("moderation deadline exceeded") from None
+
+
+def _chat_request(text):
+    return {
+        "model": CHAT_MODEL,
+        "messages": [{"role": "user", "content": MODERATION_PROMPT.format(text=text)}],
+    }
+
+
+def _chat_verdict(response):
+    return response.choices[0].message.content.strip() == "NG"
+
+
+def moderation_flagged(text: str, timeout: float) -> bool:
+    """② Moderation API"""
+    moderation = _api(timeout).moderations.create(model=MODERATION_MODEL, input=text)
+    return moderation.results[0].flagged
+
+
+def chat_flagged(text: str, timeout: float) -> bool:
+    """③ ChatGPT による弱攻撃判定"""
+    return _chat_verdict(_api(timeout).chat.completions.create(**_chat_request(text)))
+
+
+async def moderation_flagged_async(text, timeout):
+    """② Moderation API（取り消せる版）"""
+    moderation = await _async_api(timeout).moderations.create(
+        model=MODERATION_MODEL, input=text
+    )
+    return moderation.results[0].flagged
+
+
+async def chat_flagged_async(text, timeout):
+    """③ ChatGPT による弱攻撃判定（取り消せる版）"""
+    response = await _async_api(timeout).chat.completions.create(**_chat_request(text))
+    return _chat_verdict(response)
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+
+async def moderation_flagged_batch(texts, timeout):
+    """② Moderation API（配列で渡すと1回の呼び出しで全件を判定する）"""
+    moderation = await _async_api(timeout).moderations.create(
+        model=MODERATION_MODEL, input=texts
+    )
+    return [result.flagged for result in moderation.results]
+
+
+async def chat_flagged_batch(texts, timeout):
+    """③ ChatGPT に複数のコメントを1つのプロンプトで渡し、1件ずつの判定を JSON で返させる"""
+    items = "\n".join(
+        json.dumps({"id": i, "text": text}, ensure_ascii=False)
+        for i, text in enumerate(texts, 1)
+    )
+    response = await _async_api(timeout).chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[
+            {"role": "user", "content": MODERATION_BATCH_PROMPT.format(items=items)}
+        ],
+        response_format={"type": "json_object"},
+    )
+
+    verdicts = {
+        int(result["id"]): result["verdict"] == "NG"
+        for result in json.loads(response.choices[0].message.content)["results"]
+    }
+    # 判定が抜けたコメントがあれば、全体を判定できなかったものとして扱う
+    if set(verdicts) != set(range(1, len(texts) + 1)):
+        raise ValueError("batch verdicts do not match the comments")
+    return [verdicts[i] for i in range(1, len(texts) + 1)]
+
+
+async def _check_batch_async(texts, deadline):
+    size = getattr(settings, "MODERATION_BATCH_SIZE", 20)
+    chat_size = getattr(settings, "MODERATION_BATCH_CHAT_SIZE", 10)
+    max_chars = getattr(settings, "MODERATION_BATCH_CHAT_MAX_CHARS", 200)
+
+    calls = []  # (コメントの位置のリスト, Task)
+
+    def call(indexes, func, arg):
+        calls.append((indexes, asyncio.ensure_future(_limited(func, arg, deadline))))
+
+    for start in range(0, len(texts), size):
+        indexes = list(range(start, min(start + size, len(texts))))
+        call(indexes, moderation_flagged_batch, [texts[i] for i in indexes])
+
+    short = [i for i, text in enumerate(texts) if len(text) <= max_chars]
+    for start in range(0, len(short), chat_size):
+        indexes = short[start : start + chat_size]
+        call(indexes, chat_flagged_batch, [texts[i] for i in indexes])
+    for i, text in enumerate(texts):
+        if len(text) > max_chars:
+            call([i], chat_flagged_async, text)
+
+    tasks = [task for _, task in calls]
+    try:
+        # どれか1つでも失敗したら、残りを待たずに判定できなかったことにする
+        done, pending = await asyncio.wait(
+            tasks, timeout=deadline, return_when=asyncio.FIRST_EXCEPTION
+        )
+        for task in done:
+            task.result()
+        if pending:
+            raise TimeoutError("moderation deadline exceeded")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    flagged = [False] * len(texts)
+    for indexes, task in calls:
+        result = task.result()
+        if isinstance(result, bool):
+            result = [result]
+        for i, value in zip(indexes, result):
+            flagged[i] = flagged[i] or value
+    return flagged
+
+
+def check_batch(texts, deadline):
+    """
+    ②と③でまとめて判定する（どちらかがNGと言ったコメントはNG）
+      ② : MODERATION_BATCH_SIZE 件ずつ1回の呼び出しで
+      ③ : MODERATION_BATCH_CHAT_MAX_CHARS 文字以下の短いコメントを MODERATION_BATCH_CHAT_SIZE 件ずつ
+           1つのプロンプトで（長いコメントは取り違えを避けるため1件ずつ）
+    """
+    return _run(_check_batch_async(texts, deadline), deadline)
+
+
+def check_sequential(text: str, deadline: float) -> bool:
+    """②→③の順に問い合わせる（②でNGなら③は呼ばない）"""
+    started = time.monotonic()
+    if moderation_flagged(text, deadline):
+        return True
+
+    remaining = deadline - (time.monotonic() - started)
+    if remaining <= 0:
+        raise TimeoutError("moderation deadline exceeded")
+    return chat_flagged(text, remaining)
+
+
+async def _check_concurrent_async(text, deadline):
+    tasks = [
+        asyncio.ensure_future(_limited(moderation_flagged_async, text, deadline)),
+        asyncio.ensure_future(_limited(chat_flagged_async, text, deadline)),
+    ]
+    error = None
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline):
+            try:
+                if await next_done:
+                    return True
+            except TimeoutError:
+                raise
+            except Exception as e:
+                # もう一方がNGと言うかもしれないので最後まで待つ
+                error = e
+    finally:
+        # 残った方は取り消す（実行中のリクエストも切断される）
+        for task in tasks:
+            task.cancel()
+
+    if error is not None:
+        raise error
+    return False
+
+
+def check_concurrent(text: str, deadline: float) -> bool:
+    """②と③を同時に問い合わせ、どちらかがNGと言った時点で返す"""
+    return _run(_check_concurrent_async(text, deadline), deadline)
+
+
+def check_remote(text: str) -> bool:
+    """OpenAI の Moderation API と ChatGPT で判定する（ネットワークに出る）"""
+    if not breaker.allow_request():
+        raise ModerationUnavailable("circuit open")
+
+    if getattr(settings, "MODERATION_EXECUTION", "concurrent") == "sequential":
+        check = check_sequential
+    else:
+        check = check_concurrent
+
+    started = time.monotonic()
+    try:
+        flagged = check(text, _deadline())
+    except Exception as e:
+        breaker.record_failure()
+        metrics.incr("moderation.remote.failure")
+        raise ModerationUnavailable(str(e) or e.__class__.__name__) from e
+
+    breaker.record_success()
+    metrics.incr("moderation.remote.success")
+    metrics.observe("moderation.remote.ms", int((time.monotonic() - started) * 1000))
+    return flagged
+
+
+def check_remote_batch(texts) -> list:
+    """複数のコメントを OpenAI でまとめて判定する（1件なら check_remote と同じ）"""
+    if len(texts) == 1:
+        return [check_remote(texts[0])]
+    if not breaker.allow_request():
+        raise ModerationUnavailable("circuit open")
+
+    started = time.monotonic()
+    try:
+        flagged = check_batch(texts, _deadline())
+    except Exception as e:
+        breaker.record_failure()
+        metrics.incr("moderation.remote.failure")
+        raise ModerationUnavailable(str(e) or e.__class__.__name__) from e
+
+    breaker.record_success()
+    metrics.incr("moderation.remote.success")
+    metrics.observe("moderation.remote.batch_size", len(texts))
+    metrics.observe(
+        "moderation.remote.batch_ms", int((time.monotonic() - started) * 1000)
     )
+    return flagged
+
+
+def fail_verdict(fail_policy=None):
+    """OpenAI で判定できなかった時の判定（open なら問題なし、それ以外は NG）"""
+    fail_policy = fail_policy or getattr(settings, "MODERATION_FAIL_POLICY", "closed")
+    return fail_policy != "open"
+
+
+def moderate_batch(texts, fail_policy=None) -> list:
+    """
+    複数のコメントをまとめて誹謗中傷チェックし、コメントと同じ順番で判定(True=NG)を返す
+    MODERATION_BACKENDS の順に、まだ判定できていないコメントだけを次のバックエンドに渡す
+    （既定は NGワード辞書 → ローカルの分類器 → OpenAI。OpenAI にはまとめて問い合わせる）
+
+    OpenAI で判定できなかった時の扱いは fail_policy（省略時は MODERATION_FAIL_POLICY）で決める
+      open   : 問題なしとして通す
+      closed : NGとして扱う
+      raise  : ModerationUnavailable を送出する（審査ワーカーが再試行するため）
+    """
+    results = [False] * len(texts)
+    pending = [i for i, text in enumerate(texts) if text and text.strip()]
+
+    for backend in get_backends():
+        if not pending:
+            break
+
+        if backend.remote:
+            # 判定キャッシュ（同じコメントは OpenAI に問い合わせない）
+            remaining = []
+            for i in pending:
+                cached = verdict_cache.get_verdict(texts[i], MODERATION_POLICY_VERSION)
+                if cached is None:
+                    remaining.append(i)
+                else:
+                    results[i] = cached
+            pending = remaining
+            if not pending:
+                break
+
+        try:
+            verdicts = backend.check_batch([texts[i] for i in pending])
+        except ModerationUnavailable as e:
+            fail_policy = fail_policy or getattr(
+                settings, "MODERATION_FAIL_POLICY", "closed"
+            )
+            logger.warning(
+                "誹謗中傷チェックができませんでした (%s, %d件): %s",
+                fail_policy,
+                len(pending),
+                e,
+            )
+            if fail_policy == "raise":
+                raise
+            # 判定できなかった結果はキャッシュしない
+            for i in pending:
+                results[i] = fail_verdict(fail_policy)
+            return results
+
+        remaining = []
+        for i, flagged in zip(pending, verdicts):
+            if flagged is None:
+                remaining.append(i)
+                continue
+            metrics.incr(f"moderation.backend.{backend.name}")
+            if backend.remote:
+                # ローカルの分類器の学習データにもなる
+                verdict_cache.set_verdict(texts[i], MODERATION_POLICY_VERSION, flagged)
+            results[i] = flagged
+        pending = remaining
+
+    # どのバックエンドも判定できなかった（OpenAI を使わない設定の時など）は問題なしとする
+    if pending:
+        metrics.incr("moderation.backend.undecided", len(pending))
+    return results
+
+
+# 同時に来た誹謗中傷チェックをまとめて OpenAI に問い合わせる（MODERATION_BATCH_MAX_WAIT > 0 の時）
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _moderate_collected(texts):
+    try:
+        return moderate_batch(texts, fail_policy="raise")
+    finally:
+        # まとめて判定する処理は使い捨てのスレッドで動くので、開いたDB接続を閉じる
+        connection.close()
+
+
+def _get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = Batcher(
+                    _moderate_collected,
+                    batch_size=getattr(settings, "MODERATION_BATCH_SIZE", 20),
+                    max_wait=getattr(settings, "MODERATION_BATCH_MAX_WAIT", 0),
+                    name="moderation-batch",
+                )
+    return _batcher
+
+
+def is_offensive(text: str, fail_policy=None) -> bool:
+    """
+    誹謗中傷チェック（1件）。fail_policy は moderate_batch と同じ
+
+    MODERATION_BATCH_MAX_WAIT 秒（0 なら待たない）だけ他のリクエストのコメントを待ち、
+    まとめて判定する。待つ分だけ遅くなるが、OpenAI への呼び出し回数が減る
+    """
+    if not text or not text.strip():
+        return False
 
-    result = response.choices[0].message.content.strip()
+    if getattr(settings, "MODERATION_BATCH_MAX_WAIT", 0) <= 0:
+        return moderate_batch([text], fail_policy)[0]
 
-    return result == "NG"
+    try:
+        return _get_batcher().submit(text).result()
+    except ModerationUnavailable:
+        fail_policy = fail_policy or getattr(
+            settings, "MODERATION_FAIL_POLICY", "closed"
+        )
+        if fail_policy == "raise":
+            raise
+        return fail_verdict(fail_policy)
@@ -0,0 +1,170 @@
+# プロセス内(Gunicorn のワーカーごと)で使う小さなキャッシュ
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class LRUCache:
+    """
+    件数の上限(maxsize)と有効期限(ttl 秒)付きの LRU キャッシュ。
+    上限を超えたら一番長く使われていないものから捨てる。複数スレッドから使っても安全。
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key → (値, 期限)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            # 使われたものを末尾(最新)に移動する
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    """実行中の呼び出し1件（結果が出るまで他のスレッドを待たせる）"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._done.set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("single flight wait timed out")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class SingleFlight:
+    """
+    同じキーの呼び出しが同時に来たら、最初の1件だけを実行して残りはその結果を待つ。
+    （同じ文章で AI を何度も呼ばないようにする。プロセス内のスレッド間でのみ有効）
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """(呼び出し, 自分が実行役かどうか) を返す。実行役は終わったら finish を呼ぶ"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key, call, value=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.resolve(value, error)
+
+    def do(self, key, func):
+        """func() を実行して結果を返す（同じキーで実行中なら、その結果を待って返す）"""
+        call, leader = self.begin(key)
+        if not leader:
+            return call.result()
+        try:
+            value = func()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, value=value)
+        return value
+
+
+class Batcher:
+    """
+    別々のスレッドから submit された値を集めて、func(値のリスト) → 結果のリスト でまとめて処理する。
+    batch_size 件集まるか、最初の値から max_wait 秒経ったら処理を始める。
+    （待つ分だけ応答は遅くなるが、外部 API の呼び出し回数が減る。プロセス内のスレッド間でのみ有効）
+    """
+
+    def __init__(self, func, batch_size=20, max_wait=0.05, name="batcher"):
+        self.func = func
+        self.batch_size = max(batch_size, 1)
+        self.max_wait = max_wait
+        self.name = name
+        self._items = []  # (値, Future)
+        self._deadline = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, value):
+        """値を預けて Future を返す（結果は future.result() で受け取る）"""
+        future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._collect, name=self.name, daemon=True
+                )
+                self._thread.start()
+            if not self._items:
+                self._deadline = time.monotonic() + self.max_wait
+            self._items.append((value, future))
+            self._cond.notify()
+        return future
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                while len(self._items) < self.batch_size:
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._items[: self.batch_size]
+                self._items = self._items[self.batch_size :]
+                if self._items:
+                    self._deadline = time.monotonic() + self.max_wait
+
+            # 処理中も次の値を集められるように、まとめた分は別スレッドで処理する
+            threading.Thread(
+                target=self._run, args=(batch,), name=f"{self.name}-flush", daemon=True
+            ).start()
+
+    def _run(self, batch):
+        try:
+            results = self.func([value for value, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,64 @@
+# 外部API（OpenAI）が落ちている・遅い時に、呼び出しを一時的に止めるサーキットブレーカー
+#   closed    : 通常どおり呼び出す。連続で failure_threshold 回失敗したら open にする
+#   open      : reset_timeout 秒の間は呼び出さずにすぐ失敗扱いにする
+#   half-open : reset_timeout 秒たったら1回だけ試し、成功なら closed、失敗なら再び open
+# 状態はプロセス(Gunicorn のワーカー)ごとに持つ
+import threading
+import time
+
+from . import metrics
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow_request(self):
+        """今呼び出してよいかどうか"""
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    metrics.incr(f"{self.name}.circuit.rejected")
+                    return False
+                # 試しに1回だけ通す（結果が出るまで他の呼び出しは止めたまま）
+                self._state = STATE_HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == STATE_HALF_OPEN
+                or self._failures >= self.failure_threshold
+            ):
+                if self._state != STATE_OPEN:
+                    metrics.incr(f"{self.name}.circuit.opened")
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
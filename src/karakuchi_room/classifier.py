@@ -0,0 +1,111 @@
+# 誹謗中傷チェックのローカル分類器（文字 n-gram のナイーブベイズ）
+# OpenAI の判定キャッシュ(moderation_verdicts)に溜まったコメントと判定結果から学習し、
+# 自信を持って判定できるコメントは OpenAI に問い合わせずに済ませる
+# 学習は train_moderation_classifier コマンドで行い、結果は JSON ファイルに保存する
+import json
+import math
+import os
+from collections import Counter
+from pathlib import Path
+
+from .ng_words import normalize_text
+
+# 日本語は単語の区切りがないので、2〜3文字の並びを特徴にする
+NGRAM_SIZES = (2, 3)
+
+LABEL_NG = "ng"
+LABEL_OK = "ok"
+LABELS = (LABEL_NG, LABEL_OK)
+
+
+def ngrams(text, sizes=NGRAM_SIZES):
+    """正規化したコメントの文字 n-gram（短いコメントはコメント全体を1つの特徴にする）"""
+    text = "".join(normalize_text(text).split())
+    grams = []
+    for n in sizes:
+        grams.extend(text[i : i + n] for i in range(len(text) - n + 1))
+    if not grams and text:
+        grams.append(text)
+    return grams
+
+
+class NgramClassifier:
+    """多項分布のナイーブベイズ（ラプラス平滑化）"""
+
+    def __init__(self, sizes=NGRAM_SIZES):
+        self.sizes = tuple(sizes)
+        self.docs = {label: 0 for label in LABELS}
+        self.grams = {label: Counter() for label in LABELS}
+        # 判定のたびに全 n-gram を数え直さないように、集計値を覚えておく
+        self._denominators = None
+
+    @property
+    def is_trained(self):
+        # NG・OK の両方の例がないと確率を比べられない
+        return all(self.docs[label] > 0 for label in LABELS)
+
+    def train(self, samples):
+        """samples: (コメント, NGかどうか) の並び"""
+        for text, flagged in samples:
+            label = LABEL_NG if flagged else LABEL_OK
+            self.docs[label] += 1
+            self.grams[label].update(ngrams(text, self.sizes))
+        self._denominators = None
+        return self
+
+    def _get_denominators(self):
+        if self._denominators is None:
+            vocabulary = len(self.grams[LABEL_NG].keys() | self.grams[LABEL_OK].keys())
+            self._denominators = {
+                label: sum(self.grams[label].values()) + vocabulary for label in LABELS
+            }
+        return self._denominators
+
+    def probability(self, text):
+        """コメントが NG である確率（0〜1）。学習していなければ None"""
+        if not self.is_trained:
+            return None
+
+        denominators = self._get_denominators()
+        total_docs = sum(self.docs.values())
+        grams = ngrams(text, self.sizes)
+        scores = {}
+        for label in LABELS:
+            counts = self.grams[label]
+            denominator = denominators[label]
+            score = math.log(self.docs[label] / total_docs)
+            for gram in grams:
+                score += math.log((counts[gram] + 1) / denominator)
+            scores[label] = score
+
+        # log の差から NG の確率に戻す（大きな差でも溢れないように）
+        diff = scores[LABEL_OK] - scores[LABEL_NG]
+        if diff > 700:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(diff))
+
+    def to_dict(self):
+        return {
+            "version": 1,
+            "sizes": list(self.sizes),
+            "docs": self.docs,
+            "grams": {label: dict(self.grams[label]) for label in LABELS},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        model = cls(sizes=data["sizes"])
+        model.docs = {label: data["docs"][label] for label in LABELS}
+        model.grams = {label: Counter(data["grams"][label]) for label in LABELS}
+        model._denominators = None
+        return model
+
+    def save(self, path):
+        # 書きかけのファイルを読まれないように、別名で書いてから置き換える
+        tmp = Path(f"{path}.tmp")
+        tmp.write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
@@ -0,0 +1,270 @@
+# OpenAI API の代わりにローカルで動かすサーバー（負荷試験・レイテンシ計測用）
+# このアプリが使う次のエンドポイントだけを、それらしいレスポンスで返す
+#   POST /v1/moderations        : Moderation API
+#   POST /v1/chat/completions   : ChatGPT（stream=true ならストリーミング、
+#                                 response_format が json_object ならまとめて判定した結果の JSON）
+# 応答までの時間の分布・エラー率・判定結果を設定でき、有料の API やネットワークなしで
+# 同じ条件の計測を繰り返せる。起動は fake_openai_server コマンド、接続先は OPENAI_BASE_URL
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 判定結果を NG にする単語（コメントに含まれていれば NG）
+DEFAULT_NG_WORDS = ("無能", "ばか", "バカ", "死ね", "うざい")
+
+# 誹謗中傷チェック用のプロンプト（「OK」か「NG」だけを返させるもの）の見分け方
+_VERDICT_PROMPT = re.compile(r"「OK」か「NG」")
+# プロンプトの最後の「文章：」「元の文章：」の後ろが判定・書き換えの対象
+_TARGET_TEXT = re.compile(r"文章：\s*(.*)\s*$", re.S)
+
+
+class Latency:
+    """
+    応答までの時間（ミリ秒）の分布
+      fixed:200           : 常に 200ms
+      uniform:100,400     : 100〜400ms の一様分布
+      lognormal:200,0.5   : 中央値 200ms、ばらつき 0.5 の対数正規分布（裾の長い実際の API に近い）
+    """
+
+    def __init__(self, spec="fixed:0"):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(",") if arg]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"unknown latency distribution: {spec}")
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.args[0] if self.args else 0.0
+        if self.kind == "uniform":
+            return rng.uniform(self.args[0], self.args[1])
+        median, sigma = self.args
+        return rng.lognormvariate(0, sigma) * median
+
+
+class FakeOpenAIConfig:
+    def __init__(
+        self,
+        latency="fixed:0",
+        chunk_latency="fixed:0",
+        error_rate=0.0,
+        error_status=500,
+        flag_rate=0.0,
+        ng_words=DEFAULT_NG_WORDS,
+        chunk_size=4,
+        seed=None,
+    ):
+        # 最初の応答（ストリーミングなら最初の文字）までの時間
+        self.latency = Latency(latency)
+        # ストリーミングで次の文字が届くまでの時間
+        self.chunk_latency = Latency(chunk_latency)
+        # エラーを返す割合と、その時のステータスコード（429 なら混雑、500 なら障害）
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # NGワードを含まないコメントを NG にする割合
+        self.flag_rate = flag_rate
+        self.ng_words = tuple(ng_words)
+        # ストリーミングで1回に送る文字数
+        self.chunk_size = chunk_size
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def random(self):
+        with self._lock:
+            return self._rng.random()
+
+    def sample(self, latency):
+        with self._lock:
+            return max(latency.sample(self._rng), 0.0) / 1000
+
+    def is_flagged(self, text):
+        if any(word in text for word in self.ng_words):
+            return True
+        return self.flag_rate > 0 and self.random() < self.flag_rate
+
+
+def _target_text(prompt):
+    match = _TARGET_TEXT.search(prompt)
+    return match.group(1).strip() if match else prompt
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+    # keep-alive を使う（実際の API と同じく接続を使い回せるように）
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        # 負荷試験中に1リクエストごとのログを出さない
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self.send_json(400, {"error": {"message": "invalid JSON"}})
+
+        time.sleep(self.config.sample(self.config.latency))
+        if self.config.error_rate > 0 and self.config.random() < self.config.error_rate:
+            return self.send_json(
+                self.config.error_status,
+                {"error": {"message": "fake error", "type": "server_error"}},
+            )
+
+        path = self.path.rstrip("/")
+        if path.endswith("/moderations"):
+            return self.moderations(body)
+        if path.endswith("/chat/completions"):
+            return self.chat_completions(body)
+        return self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def moderations(self, body):
+        texts = body.get("input") or ""
+        # 配列で渡されたら、1件ずつの結果を同じ順番で返す
+        if not isinstance(texts, list):
+            texts = [texts]
+        results = []
+        for text in texts:
+            flagged = self.config.is_flagged(str(text))
+            results.append(
+                {
+                    "flagged": flagged,
+                    "categories": {"harassment": flagged},
+                    "category_scores": {"harassment": 0.99 if flagged else 0.01},
+                }
+            )
+        self.send_json(
+            200,
+            {
+                "id": f"modr-{uuid.uuid4().hex}",
+                "model": body.get("model", "omni-moderation-latest"),
+                "results": results,
+            },
+        )
+
+    def chat_completions(self, body):
+        prompt = "\n".join(
+            str(message.get("content", "")) for message in body.get("messages", [])
+        )
+        text = _target_text(prompt)
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            # 複数のコメントの誹謗中傷チェック（1行に1件の {"id", "text"}）
+            content = json.dumps({"results": self.batch_verdicts(prompt)})
+        elif _VERDICT_PROMPT.search(prompt):
+            # 誹謗中傷チェック
+            content = "NG" if self.config.is_flagged(text) else "OK"
+        else:
+            # コメントの書き換え（入力をそのまま少し柔らかくしたことにする）
+            content = f"{text} 😊"
+
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if body.get("stream"):
+            return self.stream(completion_id, model, content)
+
+        self.send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "total_tokens": 0,
+                },
+            },
+        )
+
+    def batch_verdicts(self, prompt):
+        verdicts = []
+        for line in prompt.splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(item, dict) and "id" in item:
+                flagged = self.config.is_flagged(str(item.get("text", "")))
+                verdicts.append(
+                    {"id": item["id"], "verdict": "NG" if flagged else "OK"}
+                )
+        return verdicts
+
+    def stream(self, completion_id, model, content):
+        """Server-Sent Events で chunk_size 文字ずつ送る"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # 長さが分からないので、送り終わったら接続を閉じる
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        size = max(self.config.chunk_size, 1)
+        parts = [content[i : i + size] for i in range(0, len(content), size)]
+        for index, part in enumerate(parts):
+            if index:
+                time.sleep(self.config.sample(self.config.chunk_latency))
+            self.send_event(self.chunk(completion_id, model, {"content": part}, None))
+        self.send_event(self.chunk(completion_id, model, {}, "stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def chunk(self, completion_id, model, delta, finish_reason):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def send_event(self, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config=None):
+        super().__init__(address, FakeOpenAIHandler)
+        self.config = config or FakeOpenAIConfig()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    """別スレッドでサーバーを起動して返す（port=0 なら空いているポート）。止める時は shutdown()"""
+    server = FakeOpenAIServer((host, port), config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
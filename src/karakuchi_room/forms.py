@@ -8,8 +8,13 @@ from django.contrib.auth import get_user_model, authenticate
 from django import forms
 from django.forms import inlineformset_factory, BaseInlineFormSet, HiddenInput
 from django.forms import ValidationError
-from .models import Survey, Option, Vote, Tag
-from .ai_filters import is_offensive
+from django.db import connections, router, transaction
+from django.utils.timezone import now
+from .models import Survey, Option, Vote, Tag, soft_delete_cascade
+from .ai_filters import ModerationUnavailable, fail_verdict, is_offensive
+from .moderation import is_deferred, needs_moderation, record_verdict
+from .ng_words import contains_ng_word
+from .tags import survey_tag_ids
 
 
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
@@ -372,18 +377,85 @@ class SurveyFormDraft(forms.ModelForm):
             # ここではSurveyモデル(self)のオブジェクト(tag=name)
             # pkはDBのプライマリキー
             # 「編集の時だけ、この中の処理を実行してください」というチェック
-            self.fields["tag_survey"].initial = self.instance.tag_survey.values_list(
-                "id", flat=True
-            )
+            self.fields["tag_survey"].initial = survey_tag_ids(self.instance)
             # これはそのSurveyが既に持っているタグのIDを初期値としてセットしている(アンケート新規作成画面で選択したタグID)
             # 。initial = ...は初期状態でどの値を選択済みにしておくかの設定
-            # self.instance.tag_survey → このアンケートに付いてるタグを全部取ってくる
-            # .values_list("id", flat=True)は編集しているアンケートに紐づいているタグIDだけを取り出す処理
+            # survey_tag_ids → このアンケートに付いてるタグのIDだけを取り出す処理
+            # （論理削除された紐付け(TagSurvey)やタグは含めない）
             # 編集画面を開いた時に、元々ついていたタグにチェックが入ってるようになる処理
 
 
+# 発行した SQL の本数を数える（connection.execute_wrapper に渡す）
+# SAVEPOINT / RELEASE などのトランザクション制御は、呼び出し側の atomic() の入れ子で
+# 本数が変わるので数えない（データを読み書きする SQL だけ数える）
+class StatementCounter:
+    TRANSACTION_STATEMENTS = ("SAVEPOINT", "RELEASE", "ROLLBACK", "COMMIT", "BEGIN")
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(self.TRANSACTION_STATEMENTS):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+# フォームセットの保存をまとめて行う
+# formset.save() は1件ずつ INSERT / UPDATE / delete() するので、選択肢の数だけ SQL が増える。
+# bulk_save() では
+#   - 新しく追加されたフォーム → bulk_create 1本
+#   - 変更されたフォーム       → bulk_update 1本
+#   - 削除マークが付いたフォーム → 論理削除の UPDATE 1本（soft_delete_cascade）
+# にまとめ、発行した SQL の本数を返す（テストで本数を確認できるように）
+class BulkSaveFormSetMixin:
+    def bulk_save(self):
+        model = self.model
+        db = router.db_for_write(model, instance=self.instance)
+        fields = [
+            name for name in self.form._meta.fields if name in self.form.base_fields
+        ]
+
+        new_objects = []
+        changed_objects = []
+        deleted_pks = []
+
+        for form in self.initial_forms:
+            obj = form.instance
+            if self.can_delete and self._should_delete_form(form):
+                deleted_pks.append(obj.pk)
+            elif form.has_changed() or obj.is_deleted:
+                obj.is_deleted = False  # 削除マークがないものは有効化
+                obj.updated_at = now()  # bulk_update では auto_now が効かない
+                changed_objects.append(obj)
+
+        for form in self.extra_forms:
+            if not form.has_changed():
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                continue
+            obj = form.instance
+            setattr(obj, self.fk.name, self.instance)
+            new_objects.append(obj)
+
+        counter = StatementCounter()
+        with connections[db].execute_wrapper(counter), transaction.atomic(using=db):
+            if deleted_pks:
+                soft_delete_cascade(
+                    model.all_objects.using(db).filter(pk__in=deleted_pks)
+                )
+            if changed_objects:
+                model.all_objects.using(db).bulk_update(
+                    changed_objects, fields + ["is_deleted", "updated_at"]
+                )
+            if new_objects:
+                model.all_objects.using(db).bulk_create(new_objects)
+
+        self.statement_count = counter.count
+        return counter.count
+
+
 # DELETEフィールドを隠しフィールドに書き換え、JSで操作する
-class MyInlineFormSet(BaseInlineFormSet):
+class MyInlineFormSet(BulkSaveFormSetMixin, BaseInlineFormSet):
     def add_fields(self, form, index):
         super().add_fields(form, index)
         if "DELETE" in form.fields:
@@ -520,6 +592,39 @@ OptionFormSetForPublished = inlineformset_factory(
 )
 
 
+# 投票作成・編集で共通のコメントチェック
+# vote は編集前の投票（前回審査したコメントから変わっていなければ審査しない）
+def clean_comment_text(comment, vote):
+    comment = (comment or "").strip()
+
+    if not needs_moderation(vote, comment):
+        # コメントが空、または審査済みのコメントのまま（選択肢だけ変えた時など）
+        # 非公開になったコメントも、書き換えるまでは非公開のまま残る
+        return comment
+
+    if is_deferred():
+        # 審査をバックグラウンドで行う設定の時は、ここでは手元の NGワード辞書だけ確認する
+        # （OpenAI への問い合わせは moderate_comments のワーカーが行う）
+        offensive = contains_ng_word(comment)
+    else:
+        # AIによる誹謗中傷チェック
+        try:
+            offensive = is_offensive(comment, fail_policy="raise")
+        except ModerationUnavailable:
+            # 判定できなかった時は設定(MODERATION_FAIL_POLICY)に従い、結果は記録しない
+            offensive = fail_verdict()
+        else:
+            # 審査結果を投票と一緒に保存する（次の編集でコメントが同じなら審査しない）
+            record_verdict(vote, comment, offensive)
+
+    if offensive:
+        raise forms.ValidationError(
+            "攻撃的・不適切な内容が含まれているため、投稿できません。"
+        )
+
+    return comment
+
+
 # ✅ 投票作成機能
 class VoteForm(forms.ModelForm):
     class Meta:
@@ -547,15 +652,7 @@ class VoteForm(forms.ModelForm):
             )
 
     def clean_comment(self):
-        comment = self.cleaned_data.get("comment", "").strip()
-
-        # AIによる誹謗中傷チェック
-        if is_offensive(comment):
-            raise forms.ValidationError(
-                "攻撃的・不適切な内容が含まれているため、投稿できません。"
-            )
-
-        return comment
+        return clean_comment_text(self.cleaned_data.get("comment", ""), self.instance)
 
 
 # ✅ 投票詳細機能
@@ -613,15 +710,7 @@ class VoteFormPublished(forms.ModelForm):
             )
 
     def clean_comment(self):
-        comment = self.cleaned_data.get("comment", "").strip()
-
-        # AIによる誹謗中傷チェック
-        if is_offensive(comment):
-            raise forms.ValidationError(
-                "攻撃的・不適切な内容が含まれているため、投稿できません。"
-            )
-
-        return comment
+        return clean_comment_text(self.cleaned_data.get("comment", ""), self.instance)
 
 
 # ユーザー編集機能
@@ -0,0 +1,159 @@
+# フォームの二重送信対策（冪等キー）
+# 投票・アンケート作成はコメント審査(OpenAI)で応答が遅く、待ちきれずにもう一度送信されることがある。
+# フォームにトークンを埋め込み、同じトークンの POST が来たら
+#   - 最初の POST が終わっていれば、その結果（リダイレクト先）をそのまま返す
+#   - まだ処理中なら「処理中」と返す（IDEMPOTENCY_WAIT 秒を設定すれば、その間だけ結果を待つ）
+# ようにして、審査や保存を2回行わないようにする
+import hashlib
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.shortcuts import redirect
+from django.utils.timezone import now
+
+from . import metrics
+from .models import IdempotencyKey
+
+# フォームの hidden フィールド名
+FIELD_NAME = "idempotency_key"
+
+_claims = 0
+
+
+def new_token():
+    """フォームに埋め込むトークン"""
+    return uuid4().hex
+
+
+def make_key(scope, user, token):
+    """用途(scope)・ユーザー・トークンからキーを作る（他人のトークンでは一致しない）"""
+    user_id = user.pk if user.is_authenticated else "anonymous"
+    return hashlib.sha256(f"{scope}:{user_id}:{token}".encode("utf-8")).hexdigest()
+
+
+def _ttl():
+    # トークンの有効期限（秒）。既定は10分
+    return getattr(settings, "IDEMPOTENCY_KEY_TTL", 600)
+
+
+def claim(key):
+    """
+    キーを「処理中」として登録する。
+    登録できたら None、既に登録されていれば（有効期限内の）その行を返す
+    """
+    global _claims
+    _claims += 1
+    if _claims % getattr(settings, "IDEMPOTENCY_PRUNE_EVERY", 100) == 0:
+        prune()
+
+    try:
+        # 同時に来た POST のうち INSERT できた1件だけが処理を進める
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                key=key, expires_at=now() + timedelta(seconds=_ttl())
+            )
+        return None
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(key=key).first()
+    if record is None or record.expires_at <= now():
+        # 期限切れのトークンは新しい送信として扱う
+        IdempotencyKey.objects.filter(key=key, expires_at__lte=now()).delete()
+        return claim(key)
+    return record
+
+
+def wait_for_result(key):
+    """
+    最初の POST が終わっていればリダイレクト先を返す（終わっていなければ None）
+    IDEMPOTENCY_WAIT（既定は 0 = 待たない）秒だけ、終わるのを待つ。
+    待つ間はこのリクエストのスレッドが塞がるので、増やす時は Gunicorn のスレッド数に注意する
+    """
+    wait = getattr(settings, "IDEMPOTENCY_WAIT", 0)
+    if wait <= 0:
+        # 呼び出し元は claim() で状態を読んだばかりなので、読み直さない
+        return None
+    deadline = time.monotonic() + wait
+    while True:
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            # 最初の POST が入力エラーなどで取り消された
+            return None
+        if record.status == IdempotencyKey.STATUS_DONE:
+            return record.redirect_url
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.2)
+
+
+def complete(key, redirect_url):
+    """処理済みにして結果（リダイレクト先）を保存する"""
+    IdempotencyKey.objects.filter(key=key).update(
+        status=IdempotencyKey.STATUS_DONE, redirect_url=redirect_url[:255]
+    )
+
+
+def release(key):
+    """入力エラーなどで保存しなかった時は登録を消し、同じトークンで送り直せるようにする"""
+    IdempotencyKey.objects.filter(key=key).delete()
+
+
+def prune():
+    """期限切れの行を消す"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now()).delete()
+    return deleted
+
+
+class IdempotentFormMixin:
+    """
+    CreateView などに付ける。テンプレートのフォームに
+    <input type="hidden" name="idempotency_key" value="{{ idempotency_key }}"> を入れて使う
+    """
+
+    # キーの用途（投票とアンケート作成でトークンが混ざらないように）
+    idempotency_scope = None
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx["idempotency_key"] = new_token()
+        return ctx
+
+    def post(self, request, *args, **kwargs):
+        token = request.POST.get(FIELD_NAME)
+        if not token:
+            # トークンのない古いフォームはこれまで通り処理する
+            return super().post(request, *args, **kwargs)
+
+        key = make_key(self.idempotency_scope, request.user, token)
+        record = claim(key)
+        if record is not None:
+            metrics.incr("idempotency.replayed")
+            redirect_url = (
+                record.redirect_url
+                if record.status == IdempotencyKey.STATUS_DONE
+                else wait_for_result(key)
+            )
+            if redirect_url:
+                return redirect(redirect_url)
+            messages.info(
+                request, "送信を処理中です。しばらくしてから確認してください。"
+            )
+            return redirect(request.path)
+
+        try:
+            response = super().post(request, *args, **kwargs)
+        except Exception:
+            release(key)
+            raise
+
+        if response.status_code in (301, 302, 303) and response.get("Location"):
+            complete(key, response["Location"])
+        else:
+            # 入力エラーでフォームを表示し直した（新しいトークンで送り直してもらう）
+            release(key)
+        return response
@@ -0,0 +1,61 @@
+# NGワード判定のマイクロベンチマーク
+# 単語ごとに re.search を回す旧方式と、Aho-Corasick の新方式の1件あたりの時間を比べる
+# 使い方: python manage.py benchmark_ng_words [--words 5000] [--length 200] [--comments 1000]
+import random
+import re
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from karakuchi_room.ng_words import AhoCorasick, normalize_text
+
+# コメントには「ん」を使わず、辞書の単語は必ず「ん」で終わらせる
+# → どのコメントもNGワードを含まず、辞書を最後まで調べる一番遅いケースになる
+HIRAGANA = [chr(code) for code in range(0x3041, 0x3097) if chr(code) != "ん"]
+
+
+def random_text(rng, length):
+    return "".join(rng.choice(HIRAGANA) for _ in range(length))
+
+
+class Command(BaseCommand):
+    help = "NGワード判定（正規表現のループ / Aho-Corasick）の速度を比べます。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--words", type=int, default=5000, help="辞書の単語数")
+        parser.add_argument(
+            "--length", type=int, default=200, help="コメント1件の文字数"
+        )
+        parser.add_argument(
+            "--comments", type=int, default=1000, help="判定するコメント数"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        words = [
+            random_text(rng, rng.randint(2, 5)) + "ん" for _ in range(options["words"])
+        ]
+        comments = [
+            random_text(rng, options["length"]) for _ in range(options["comments"])
+        ]
+
+        patterns = [re.compile(word) for word in words]
+
+        def regex_loop():
+            for text in comments:
+                any(p.search(text) for p in patterns)
+
+        matcher = AhoCorasick(words)
+
+        def automaton():
+            for text in comments:
+                matcher.find(normalize_text(text))
+
+        for name, func in (
+            ("re.search ループ", regex_loop),
+            ("Aho-Corasick", automaton),
+        ):
+            seconds = min(timeit.repeat(func, number=1, repeat=3))
+            per_comment = seconds / len(comments) * 1_000_000
+            self.stdout.write(f"{name}: {per_comment:.1f} µs/件")
@@ -0,0 +1,73 @@
+# OpenAI API の代わりのサーバーを起動するコマンド（負荷試験・レイテンシ計測用）
+# 使い方: python manage.py fake_openai_server [--port 8089] [--latency lognormal:300,0.6]
+#                                             [--error-rate 0.01] [--flag-rate 0.1]
+# アプリ側は OPENAI_BASE_URL=http://127.0.0.1:8089/v1 を設定して起動する
+from django.core.management.base import BaseCommand, CommandError
+
+from karakuchi_room.fake_openai import (
+    DEFAULT_NG_WORDS,
+    FakeOpenAIConfig,
+    FakeOpenAIServer,
+)
+
+
+class Command(BaseCommand):
+    help = "OpenAI API（Moderation / Chat Completions）の代わりのサーバーを起動します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8089)
+        parser.add_argument(
+            "--latency",
+            default="lognormal:300,0.5",
+            help="応答までの時間(ms)の分布 fixed:200 / uniform:100,400 / lognormal:中央値,ばらつき",
+        )
+        parser.add_argument(
+            "--chunk-latency",
+            default="fixed:30",
+            help="ストリーミングで次の文字を送るまでの時間(ms)の分布",
+        )
+        parser.add_argument(
+            "--error-rate", type=float, default=0.0, help="エラーを返す割合(0〜1)"
+        )
+        parser.add_argument(
+            "--error-status", type=int, default=500, help="エラーのステータスコード"
+        )
+        parser.add_argument(
+            "--flag-rate",
+            type=float,
+            default=0.0,
+            help="NGワードを含まないコメントを NG と判定する割合(0〜1)",
+        )
+        parser.add_argument(
+            "--ng-word",
+            action="append",
+            dest="ng_words",
+            help="NG と判定する単語（複数指定可。省略時は組み込みの単語）",
+        )
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            config = FakeOpenAIConfig(
+                latency=options["latency"],
+                chunk_latency=options["chunk_latency"],
+                error_rate=options["error_rate"],
+                error_status=options["error_status"],
+                flag_rate=options["flag_rate"],
+                ng_words=options["ng_words"] or DEFAULT_NG_WORDS,
+                seed=options["seed"],
+            )
+        except (ValueError, IndexError) as e:
+            raise CommandError(f"分布の指定が正しくありません: {e}")
+
+        server = FakeOpenAIServer((options["host"], options["port"]), config)
+        self.stdout.write(
+            self.style.SUCCESS(f"{server.base_url} で待ち受けています（Ctrl+C で終了）")
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,128 @@
+# 誹謗中傷チェック・コメントの書き換え(AI)の負荷試験
+# 同時に何件も呼び出し、1件あたりの時間の分布(p50/p95/p99)とエラー数を表示する
+# 本物の API を叩かないように、fake_openai_server を起動して OPENAI_BASE_URL を向けてから使う
+# 使い方: python manage.py loadtest_openai [--target moderation|soften|soften-stream]
+#                                          [--requests 500] [--concurrency 16]
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from karakuchi_room import metrics
+from karakuchi_room.ai_filters import is_offensive
+from karakuchi_room.soften import soften_text, stream_soften
+
+
+def percentile(sorted_values, p):
+    """昇順に並んだ値の p パーセンタイル（nearest-rank 法）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(len(sorted_values) * p / 100 + 0.999999), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def consume_stream(text):
+    # 最後の文字が届くまでを1件の時間とする（最初の文字までの時間は metrics に記録される）
+    for _ in stream_soften(text):
+        pass
+
+
+TARGETS = {
+    "moderation": lambda text: is_offensive(text, fail_policy="raise"),
+    "soften": soften_text,
+    "soften-stream": consume_stream,
+}
+
+
+class Command(BaseCommand):
+    help = "OpenAI を使う処理に同時にリクエストを送り、応答時間の分布を計測します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=sorted(TARGETS), default="moderation")
+        parser.add_argument("--requests", type=int, default=500, help="呼び出す回数")
+        parser.add_argument("--concurrency", type=int, default=16, help="同時実行数")
+        parser.add_argument(
+            "--repeat-text",
+            action="store_true",
+            help="毎回同じコメントを使う（キャッシュが効く場合の計測）",
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, "OPENAI_BASE_URL", None):
+            self.stdout.write(
+                self.style.WARNING(
+                    "OPENAI_BASE_URL が未設定のため、本物の OpenAI API を呼び出します。"
+                )
+            )
+
+        call = TARGETS[options["target"]]
+        total = options["requests"]
+        run_id = uuid4().hex[:8]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        counter = iter(range(total))
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    # キャッシュに当たらないように、既定では毎回違うコメントにする
+                    text = (
+                        "負荷試験のコメントです"
+                        if options["repeat_text"]
+                        else f"負荷試験のコメントです {run_id}-{i}"
+                    )
+                    started = time.monotonic()
+                    try:
+                        call(text)
+                    except Exception as e:
+                        with lock:
+                            errors.append(e.__class__.__name__)
+                        continue
+                    elapsed = (time.monotonic() - started) * 1000
+                    with lock:
+                        latencies.append(elapsed)
+            finally:
+                # スレッドごとに開いたDB接続（判定キャッシュの保存など）を閉じる
+                connection.close()
+
+        metrics.reset()
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=worker) for _ in range(options["concurrency"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        latencies.sort()
+        self.stdout.write(
+            f"{options['target']}: {total} 件 / 同時 {options['concurrency']} / "
+            f"{wall:.2f} 秒 ({total / wall:.1f} 件/秒)"
+        )
+        if latencies:
+            self.stdout.write(
+                "  成功 {} 件  p50={:.0f}ms  p95={:.0f}ms  p99={:.0f}ms  max={:.0f}ms".format(
+                    len(latencies),
+                    percentile(latencies, 50),
+                    percentile(latencies, 95),
+                    percentile(latencies, 99),
+                    latencies[-1],
+                )
+            )
+        if errors:
+            kinds = {name: errors.count(name) for name in sorted(set(errors))}
+            self.stdout.write(self.style.WARNING(f"  エラー {len(errors)} 件 {kinds}"))
+
+        # 処理の内訳（キャッシュのヒット数、最初の文字までの時間など）
+        for name, value in sorted(metrics.snapshot().items()):
+            self.stdout.write(f"  {name}: {value}")
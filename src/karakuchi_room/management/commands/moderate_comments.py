@@ -0,0 +1,44 @@
+# コメント審査ワーカー（COMMENT_MODERATION_MODE="deferred" の時に起動しておく）
+# 使い方: python manage.py moderate_comments [--once] [--batch-size 20] [--interval 2]
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from karakuchi_room.moderation import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "審査待ちのコメントを OpenAI で審査し、公開/非公開を反映します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="待機中のジョブを1回処理したら終了する",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="1回に取り出すジョブの件数",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="ジョブがない時に次に確認するまでの秒数",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # 長時間動かすので、切れたDB接続をループごとに片付ける
+            close_old_connections()
+            processed = process_pending_jobs(limit=options["batch_size"])
+            if processed:
+                self.stdout.write(f"{processed} 件のコメントを審査しました。")
+
+            if options["once"]:
+                break
+            if not processed:
+                time.sleep(options["interval"])
@@ -0,0 +1,37 @@
+# 投票数カウンター(Option.vote_count / Survey.vote_total)を votes テーブルから作り直すコマンド
+# 使い方: python manage.py rebuild_vote_counters [--dry-run]
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from karakuchi_room.votes import rebuild_vote_counters
+
+
+class Command(BaseCommand):
+    help = "投票数カウンターを votes テーブルから数え直し、ずれを報告・修正します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="ずれを報告するだけで修正しない",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+
+        with transaction.atomic():
+            drift = rebuild_vote_counters(dry_run=dry_run)
+
+        for model_name, pk, stored, actual in drift:
+            self.stdout.write(f"{model_name}(ID={pk}): 保存値={stored} 実際={actual}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("カウンターのずれはありません。"))
+        elif dry_run:
+            self.stdout.write(
+                self.style.WARNING(f"{len(drift)} 件のずれがあります（未修正）。")
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"{len(drift)} 件のずれを修正しました。")
+            )
@@ -0,0 +1,86 @@
+# 誹謗中傷チェックのローカル分類器を、判定キャッシュ(moderation_verdicts)から学習するコマンド
+# 使い方: python manage.py train_moderation_classifier [--output モデルのパス] [--holdout 0.2]
+# 学習したモデルは MODERATION_CLASSIFIER_FILE に置くと、各プロセスが次の判定時に読み込む
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from karakuchi_room.ai_filters import MODERATION_POLICY_VERSION
+from karakuchi_room.classifier import NgramClassifier
+from karakuchi_room.models import ModerationVerdict
+
+
+class Command(BaseCommand):
+    help = "OpenAI の判定結果から、誹謗中傷チェックのローカル分類器を学習します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="モデルの保存先（省略時は MODERATION_CLASSIFIER_FILE）",
+        )
+        parser.add_argument(
+            "--holdout",
+            type=float,
+            default=0.2,
+            help="精度の確認用に学習に使わない割合（保存するモデルは全件で学習する）",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        output = options["output"] or getattr(
+            settings, "MODERATION_CLASSIFIER_FILE", None
+        )
+        if not output:
+            raise CommandError(
+                "--output か MODERATION_CLASSIFIER_FILE を指定してください。"
+            )
+
+        # 今の判定ポリシーで OpenAI が判定したものだけを使う
+        samples = list(
+            ModerationVerdict.objects.filter(policy_version=MODERATION_POLICY_VERSION)
+            .exclude(text="")
+            .values_list("text", "flagged")
+        )
+        ng = sum(1 for _, flagged in samples if flagged)
+        self.stdout.write(f"学習データ: {len(samples)} 件（NG {ng} 件）")
+
+        model = NgramClassifier().train(samples)
+        if not model.is_trained:
+            raise CommandError("NG と OK の両方の判定結果が必要です。")
+
+        if options["holdout"] > 0:
+            self.evaluate(samples, options["holdout"], options["seed"])
+
+        model.save(output)
+        self.stdout.write(self.style.SUCCESS(f"{output} に保存しました。"))
+
+    def evaluate(self, samples, holdout, seed):
+        """一部を学習に使わずに判定させ、ローカルで判定できた割合と正解率を表示する"""
+        samples = samples[:]
+        random.Random(seed).shuffle(samples)
+        split = int(len(samples) * (1 - holdout))
+        model = NgramClassifier().train(samples[:split])
+        test = samples[split:]
+        if not model.is_trained or not test:
+            self.stdout.write("件数が少ないため精度の確認を省略します。")
+            return
+
+        confidence = getattr(settings, "MODERATION_CLASSIFIER_CONFIDENCE", 0.95)
+        decided = correct = 0
+        for text, flagged in test:
+            probability = model.probability(text)
+            if probability >= confidence:
+                predicted = True
+            elif probability <= 1 - confidence:
+                predicted = False
+            else:
+                continue
+            decided += 1
+            correct += predicted == flagged
+
+        self.stdout.write(
+            f"確認用 {len(test)} 件: ローカルで判定 {decided} 件"
+            f"（{decided / len(test):.0%}）、うち正解 {correct} 件"
+        )
@@ -0,0 +1,58 @@
+# プロセス内の簡易メトリクス（キャッシュのヒット数など）
+# Gunicorn のワーカーごとに別々に数えるので、値はそのワーカーが起動してからの累計になる
+# 管理者は /api/metrics/ で JSON として確認できる
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def incr(name, value=1):
+    """カウンターを加算する"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """所要時間などの値を記録する（件数・合計・最大と、平均を出す）"""
+    with _lock:
+        _counters[f"{name}.count"] = _counters.get(f"{name}.count", 0) + 1
+        _counters[f"{name}.sum"] = _counters.get(f"{name}.sum", 0) + value
+        _counters[f"{name}.max"] = max(_counters.get(f"{name}.max", value), value)
+        _counters[f"{name}.avg"] = round(
+            _counters[f"{name}.sum"] / _counters[f"{name}.count"], 1
+        )
+
+
+def get(name):
+    return _counters.get(name, 0)
+
+
+def gauge(name):
+    """呼び出した時点の値を返す関数をメトリクスとして登録するデコレーター"""
+
+    def register(func):
+        _gauges[name] = func
+        return func
+
+    return register
+
+
+def ratio(hits, total):
+    """ヒット率などの割合（total が 0 の時は None）"""
+    return round(hits / total, 4) if total else None
+
+
+def snapshot():
+    """現在の全メトリクスを辞書で返す"""
+    with _lock:
+        data = dict(_counters)
+    for name, func in _gauges.items():
+        data[name] = func()
+    return data
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,85 @@
+# Generated by Django 5.0 on 2026-10-17 19:24
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FULLTEXT_INDEX_NAME = "surveys_title_description_ngram"
+
+
+# search.ngrams() のこの時点の写し（search.py を変えてもこのマイグレーションの結果が変わらないように）
+def ngrams(text, n=2):
+    grams = set()
+    for token in unicodedata.normalize("NFKC", text or "").lower().split():
+        for i in range(len(token) - n + 1):
+            grams.add(token[i : i + n])
+    return grams
+
+
+def create_search_index(apps, schema_editor):
+    # MySQL: surveys に FULLTEXT(ngram) インデックスを追加（以降は InnoDB が自動更新）
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(
+            f"ALTER TABLE surveys ADD FULLTEXT INDEX {FULLTEXT_INDEX_NAME}"
+            " (title, description) WITH PARSER ngram"
+        )
+        return
+
+    # それ以外: 既存アンケートの n-gram を転置インデックスに登録する
+    Survey = apps.get_model("karakuchi_room", "Survey")
+    SurveySearchGram = apps.get_model("karakuchi_room", "SurveySearchGram")
+    rows = []
+    for survey in Survey.objects.filter(is_deleted=False).iterator():
+        for gram in ngrams(survey.title) | ngrams(survey.description):
+            rows.append(SurveySearchGram(survey_id=survey.pk, gram=gram))
+    SurveySearchGram.objects.bulk_create(rows, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(f"ALTER TABLE surveys DROP INDEX {FULLTEXT_INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0006_rename_tag_survey_tag_survey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SurveySearchGram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gram", models.CharField(max_length=10, verbose_name="n-gram")),
+                (
+                    "survey",
+                    models.ForeignKey(
+                        db_column="survey_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_grams",
+                        to="karakuchi_room.survey",
+                        verbose_name="アンケートID",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "survey_search_grams",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="surveysearchgram",
+            constraint=models.UniqueConstraint(
+                fields=("gram", "survey"), name="uq_search_gram_survey"
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
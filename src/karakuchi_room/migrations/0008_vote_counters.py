@@ -0,0 +1,51 @@
+# Generated by Django 5.0 on 2026-10-17 19:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_votes(Vote, field):
+    # field(option / survey) ごとの未削除投票数を返すサブクエリ
+    return Coalesce(
+        Subquery(
+            Vote.objects.filter(**{field: OuterRef("pk"), "is_deleted": False})
+            .values(field)
+            .annotate(n=Count("id"))
+            .values("n")
+        ),
+        0,
+    )
+
+
+def backfill_vote_counters(apps, schema_editor):
+    # 既存の投票からカウンターを UPDATE 1本ずつで埋める
+    Vote = apps.get_model("karakuchi_room", "Vote")
+    Option = apps.get_model("karakuchi_room", "Option")
+    Survey = apps.get_model("karakuchi_room", "Survey")
+    Option.objects.update(vote_count=count_votes(Vote, "option"))
+    Survey.objects.update(vote_total=count_votes(Vote, "survey"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0007_survey_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="option",
+            name="vote_count",
+            field=models.PositiveIntegerField(
+                db_default=models.Value(0), default=0, verbose_name="投票数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="survey",
+            name="vote_total",
+            field=models.PositiveIntegerField(
+                db_default=models.Value(0), default=0, verbose_name="投票総数"
+            ),
+        ),
+        migrations.RunPython(backfill_vote_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0 on 2026-10-17 19:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0008_vote_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SurveyResultSnapshot",
+            fields=[
+                (
+                    "survey",
+                    models.OneToOneField(
+                        db_column="survey_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="result_snapshot",
+                        serialize=False,
+                        to="karakuchi_room.survey",
+                        verbose_name="アンケートID",
+                    ),
+                ),
+                ("payload", models.JSONField(verbose_name="集計結果")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="作成日時"),
+                ),
+            ],
+            options={
+                "verbose_name": "集計結果",
+                "verbose_name_plural": "集計結果一覧",
+                "db_table": "survey_result_snapshots",
+            },
+        ),
+    ]
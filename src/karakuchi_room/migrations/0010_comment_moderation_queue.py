@@ -0,0 +1,100 @@
+# Generated by Django 5.0 on 2026-10-17 19:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0009_survey_result_snapshot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="moderation_status",
+            field=models.PositiveSmallIntegerField(
+                choices=[(0, "公開"), (1, "審査待ち"), (2, "非公開")],
+                db_default=models.Value(0),
+                default=0,
+                verbose_name="コメント審査状態",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ModerationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "status",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (0, "待機中"),
+                            (1, "実行中"),
+                            (2, "完了"),
+                            (3, "失敗"),
+                        ],
+                        db_default=models.Value(0),
+                        default=0,
+                        verbose_name="状態",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        db_default=models.Value(0), default=0, verbose_name="試行回数"
+                    ),
+                ),
+                (
+                    "run_after",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="実行予定日時"
+                    ),
+                ),
+                (
+                    "locked_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="取得日時"
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, default="", verbose_name="エラー内容"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="作成日時"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新日時"),
+                ),
+                (
+                    "vote",
+                    models.ForeignKey(
+                        db_column="vote_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="moderation_jobs",
+                        to="karakuchi_room.vote",
+                        verbose_name="投票ID",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "コメント審査ジョブ",
+                "verbose_name_plural": "コメント審査ジョブ一覧",
+                "db_table": "moderation_jobs",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "run_after"],
+                        name="moderation__status_af273e_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-17 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0010_comment_moderation_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ModerationVerdict",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="キー",
+                    ),
+                ),
+                ("flagged", models.BooleanField(verbose_name="NG判定")),
+                (
+                    "policy_version",
+                    models.CharField(max_length=100, verbose_name="判定バージョン"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="作成日時"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新日時"),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="有効期限"),
+                ),
+            ],
+            options={
+                "verbose_name": "判定キャッシュ",
+                "verbose_name_plural": "判定キャッシュ一覧",
+                "db_table": "moderation_verdicts",
+                "indexes": [
+                    models.Index(
+                        fields=["updated_at"], name="moderation__updated_9fa1d8_idx"
+                    )
+                ],
+            },
+        ),
+    ]
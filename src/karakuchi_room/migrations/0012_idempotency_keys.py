@@ -0,0 +1,53 @@
+# Generated by Django 5.0 on 2026-10-17 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0011_moderation_verdict_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="キー",
+                    ),
+                ),
+                (
+                    "status",
+                    models.PositiveSmallIntegerField(
+                        choices=[(0, "処理中"), (1, "処理済み")],
+                        default=0,
+                        verbose_name="状態",
+                    ),
+                ),
+                (
+                    "redirect_url",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="結果URL"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="作成日時"),
+                ),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="有効期限"),
+                ),
+            ],
+            options={
+                "verbose_name": "冪等キー",
+                "verbose_name_plural": "冪等キー一覧",
+                "db_table": "idempotency_keys",
+            },
+        ),
+    ]
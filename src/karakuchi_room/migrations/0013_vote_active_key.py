@@ -0,0 +1,96 @@
+# Generated by Django 5.0 on 2026-10-17 19:44
+
+from django.db import migrations, models
+
+OLD_CONSTRAINT_NAME = "uq_vote_user_survey_active"
+NEW_CONSTRAINT_NAME = "uq_vote_user_survey_active_key"
+
+
+def add_active_key_online(apps, schema_editor):
+    # MySQL: votes は行数が多いので、テーブルをロックしないオンラインDDLで変更する
+    #   - VIRTUAL の生成列の追加はメタデータの変更だけ(INSTANT)で、既存の行は書き換えない
+    #   - 一意インデックスは INPLACE で作る（作成中も投票の INSERT/UPDATE を止めない）
+    #   - 新しい制約ができてから古い制約を消す（その間も1人1票が保たれる）
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE votes ADD COLUMN active_key smallint"
+        " GENERATED ALWAYS AS (CASE WHEN is_deleted = 0 THEN 1 ELSE NULL END) VIRTUAL,"
+        " ALGORITHM=INSTANT"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE votes ADD CONSTRAINT {NEW_CONSTRAINT_NAME}"
+        " UNIQUE (user_id, survey_id, active_key), ALGORITHM=INPLACE, LOCK=NONE"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE votes DROP INDEX {OLD_CONSTRAINT_NAME},"
+        " ALGORITHM=INPLACE, LOCK=NONE"
+    )
+
+
+def drop_active_key_online(apps, schema_editor):
+    # 論理削除された票が2件以上ある組み合わせがあると、古い制約は作り直せない
+    if schema_editor.connection.vendor != "mysql":
+        return
+    schema_editor.execute(
+        f"ALTER TABLE votes ADD CONSTRAINT {OLD_CONSTRAINT_NAME}"
+        " UNIQUE (user_id, survey_id, is_deleted), ALGORITHM=INPLACE, LOCK=NONE"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE votes DROP INDEX {NEW_CONSTRAINT_NAME},"
+        " ALGORITHM=INPLACE, LOCK=NONE"
+    )
+    schema_editor.execute("ALTER TABLE votes DROP COLUMN active_key, ALGORITHM=INSTANT")
+
+
+class ExceptOnMySQL(migrations.SeparateDatabaseAndState):
+    """MySQL ではスキーマを変更せず（オンラインDDLで済ませる）、モデルの状態だけ進める"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "mysql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "mysql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def active_key_operations():
+    return [
+        migrations.RemoveConstraint(
+            model_name="vote",
+            name=OLD_CONSTRAINT_NAME,
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="active_key",
+            field=models.GeneratedField(
+                db_persist=False,
+                expression=models.Case(
+                    models.When(is_deleted=False, then=models.Value(1)), default=None
+                ),
+                output_field=models.SmallIntegerField(null=True),
+                verbose_name="有効な投票のキー",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="vote",
+            constraint=models.UniqueConstraint(
+                fields=("user", "survey", "active_key"), name=NEW_CONSTRAINT_NAME
+            ),
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0012_idempotency_keys"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_active_key_online, drop_active_key_online),
+        ExceptOnMySQL(
+            state_operations=active_key_operations(),
+            database_operations=active_key_operations(),
+        ),
+    ]
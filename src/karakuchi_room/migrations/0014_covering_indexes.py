@@ -0,0 +1,149 @@
+# Generated by Django 5.0 on 2026-10-17 19:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0013_vote_active_key"),
+    ]
+
+    operations = [
+        # 新しい複合インデックスを作ってから、不要になった単独のインデックスを消す
+        # （MySQL では外部キーの列が先頭のインデックスが残っていないと消せないため）
+        migrations.AddIndex(
+            model_name="option",
+            index=models.Index(
+                fields=["survey", "is_deleted", "id"], name="options_survey__a786f4_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="survey",
+            index=models.Index(
+                fields=["is_deleted", "is_public", "-id"],
+                name="surveys_is_dele_43a55b_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="survey",
+            index=models.Index(
+                fields=["user", "is_deleted", "-id"], name="surveys_user_id_fcd322_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tagsurvey",
+            index=models.Index(
+                fields=["tag", "is_deleted", "survey"],
+                name="tag_surveys_tag_id_b0ef40_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tagsurvey",
+            index=models.Index(
+                fields=["survey", "is_deleted", "tag"],
+                name="tag_surveys_survey__14d7e4_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(
+                fields=["survey", "is_deleted", "-created_at"],
+                name="votes_survey__fafcbe_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vote",
+            index=models.Index(
+                fields=["user", "survey", "is_deleted"], name="votes_user_id_98a8ea_idx"
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="option",
+            name="options_survey__37ad10_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="option",
+            name="options_is_dele_d114cf_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="tagsurvey",
+            name="tag_surveys_tag_id_76e5ec_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="tagsurvey",
+            name="tag_surveys_survey__7612c9_idx",
+        ),
+        migrations.AlterField(
+            model_name="option",
+            name="survey",
+            field=models.ForeignKey(
+                db_column="survey_id",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="options",
+                to="karakuchi_room.survey",
+                verbose_name="アンケートID",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="survey",
+            name="user",
+            field=models.ForeignKey(
+                db_column="user_id",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="surveys",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="tagsurvey",
+            name="survey",
+            field=models.ForeignKey(
+                db_column="survey_id",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tag_surveys",
+                to="karakuchi_room.survey",
+                verbose_name="アンケートID",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="tagsurvey",
+            name="tag",
+            field=models.ForeignKey(
+                db_column="tag_id",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tag_surveys",
+                to="karakuchi_room.tag",
+                verbose_name="タグID",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="survey",
+            field=models.ForeignKey(
+                db_column="survey_id",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="votes",
+                to="karakuchi_room.survey",
+                verbose_name="アンケートID",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="vote",
+            name="user",
+            field=models.ForeignKey(
+                db_column="user_id",
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="votes",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="ユーザーID",
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0 on 2026-10-17 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0014_covering_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vote",
+            name="moderated_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="審査日時"),
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="moderation_flagged",
+            field=models.BooleanField(
+                blank=True, null=True, verbose_name="審査結果(NG)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="moderation_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=64,
+                verbose_name="審査したコメントのハッシュ",
+            ),
+        ),
+        migrations.AddField(
+            model_name="vote",
+            name="moderation_policy",
+            field=models.CharField(
+                blank=True,
+                default="",
+                max_length=100,
+                verbose_name="審査した判定バージョン",
+            ),
+        ),
+    ]
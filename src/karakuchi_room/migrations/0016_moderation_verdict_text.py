@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-17 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0015_vote_moderation_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="moderationverdict",
+            name="text",
+            field=models.TextField(blank=True, default="", verbose_name="コメント"),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0 on 2026-10-17 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0016_moderation_verdict_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="survey",
+            name="results_version",
+            field=models.PositiveBigIntegerField(
+                db_default=models.Value(0),
+                default=0,
+                verbose_name="投票結果のバージョン",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-17 20:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("karakuchi_room", "0017_survey_results_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="option",
+            name="vote_count",
+            field=models.PositiveIntegerField(
+                db_default=models.Value(0),
+                default=0,
+                editable=False,
+                verbose_name="投票数",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="survey",
+            name="results_version",
+            field=models.PositiveBigIntegerField(
+                db_default=models.Value(0),
+                default=0,
+                editable=False,
+                verbose_name="投票結果のバージョン",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="survey",
+            name="vote_total",
+            field=models.PositiveIntegerField(
+                db_default=models.Value(0),
+                default=0,
+                editable=False,
+                verbose_name="投票総数",
+            ),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction
 from uuid import uuid4
 from django.conf import settings
 from django.utils.timezone import now
@@ -23,6 +25,10 @@ class SoftDeleteQuerySet(models.QuerySet):
     def deleted(self):
         return self.filter(is_deleted=True)
 
+    # 子のデータもまとめて論理削除する（SoftDeleteModel.delete() の一括版）
+    def soft_delete_cascade(self):
+        return soft_delete_cascade(self)
+
 
 # 「未削除データのみ」を扱うManager。
 class SoftDeleteManager(models.Manager):
@@ -32,26 +38,181 @@ class SoftDeleteManager(models.Manager):
 
 
 #  個別オブジェクトの delete() も論理削除に差し替え
+#  あわせて、DBから読み込んだ時の値を覚えておき、変更されたフィールドを調べられるようにする
+#  （更新前の値を知るためだけに SELECT し直さなくてよい）
 class SoftDeleteModel(models.Model):
     objects = SoftDeleteManager()
     all_objects = SoftDeleteQuerySet.as_manager()
 
+    # F() 式で +1 / -1 しているカウンター列（votes.py）。既存の行を save() する時は書き込まない
+    # （読み込んだ後に投票されると、古い値で上書きして票数が戻ってしまうため）
+    counter_fields = ()
+
+    # DBから読み込んだ時に呼ばれる。読み込んだ値を {attname: 値} で覚えておく
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def _remember_values(self, attnames=None):
+        # 保存した値を「DBにある値」として覚え直す
+        deferred = self.get_deferred_fields()
+        if attnames is None:
+            attnames = [f.attname for f in self._meta.concrete_fields]
+        loaded = self.__dict__.setdefault("_loaded_values", {})
+        for attname in attnames:
+            if attname not in deferred:
+                loaded[attname] = getattr(self, attname)
+
+    def save(self, *args, **kwargs):
+        if (
+            self.counter_fields
+            and not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and not args
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                f.name
+                for f in self._meta.concrete_fields
+                if not f.primary_key
+                and not f.generated
+                and f.name not in self.counter_fields
+                and f.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self._remember_values()
+        else:
+            self._remember_values(
+                [self._meta.get_field(name).attname for name in update_fields]
+            )
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None:
+            self._remember_values()
+        else:
+            self._remember_values(
+                [self._meta.get_field(name).attname for name in fields]
+            )
+
+    def load_saved_state(self, using=None):
+        """
+        DBにある値を覚えているかどうか。新規作成なら False。
+        覚えていない既存のインスタンス（読み込み方が特殊な場合）は、ここで一度だけDBから取得する
+        """
+        if "_loaded_values" in self.__dict__:
+            return True
+        if self._state.adding or self.pk is None:
+            return False
+        row = (
+            type(self)
+            .all_objects.using(using or self._state.db)
+            .filter(pk=self.pk)
+            .values(*[f.attname for f in self._meta.concrete_fields])
+            .first()
+        )
+        if row is None:
+            return False
+        self._loaded_values = row
+        return True
+
+    def loaded_value(self, field_name, default=None):
+        """DBから読み込んだ時（最後に保存した時）の値。読み込んでいなければ default"""
+        loaded = self.__dict__.get("_loaded_values", {})
+        return loaded.get(self._meta.get_field(field_name).attname, default)
+
+    @property
+    def changed_fields(self):
+        """読み込んだ時から値が変わったフィールド名の集合（新規作成なら全フィールド）"""
+        loaded = self.__dict__.get("_loaded_values")
+        if loaded is None:
+            return {f.name for f in self._meta.concrete_fields}
+        return {
+            f.name
+            for f in self._meta.concrete_fields
+            if f.attname in loaded
+            and f.attname in self.__dict__
+            and getattr(self, f.attname) != loaded[f.attname]
+        }
+
+    def has_changed(self, field_name):
+        return field_name in self.changed_fields
+
     #   この部分は命名を変えると物理削除なるので変更しない。
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.updated_at = now()
-        self.save(update_fields=["is_deleted", "updated_at"])
-        # 子も論理削除へ
-        for rel in self._meta.related_objects:
-            if rel.one_to_many or rel.one_to_one:
-                accessor = rel.get_accessor_name()
-                for obj in getattr(self, accessor).all():
-                    obj.delete()  # 子の SoftDelete.delete() が呼ばれる
+        # 子も論理削除へ（モデルごとにまとめて UPDATE する）
+        soft_delete_cascade(
+            type(self).all_objects.using(using or self._state.db).filter(pk=self.pk)
+        )
+        self._remember_values(["is_deleted", "updated_at"])
+
+    # 論理削除された直後に呼ばれる（pks は今回削除された行の ID）
+    # カウンターの更新など、削除に合わせて行う処理があるモデルで上書きする
+    @classmethod
+    def after_soft_delete(cls, pks):
+        pass
 
     class Meta:
         abstract = True
 
 
+def soft_delete_cascade(queryset):
+    """
+    queryset の行と、それにぶら下がる子・孫を論理削除する。削除した件数を {モデル名: 件数} で返す。
+    親から1階層ずつ子の ID を集め、モデルごとに UPDATE 1本で論理削除する（1行ずつ delete() しない）。
+      - 論理削除できる子(SoftDeleteModel)は未削除のものだけを論理削除し、さらにその子へ進む
+      - それ以外の子（検索インデックスなど）は物理削除する
+    """
+    db = queryset.db
+    deleted = defaultdict(int)
+    done = defaultdict(set)  # 処理済みの ID（同じ行を2回処理しない）
+
+    with transaction.atomic(using=db):
+        level = {
+            queryset.model: set(
+                queryset.filter(is_deleted=False).values_list("pk", flat=True)
+            )
+        }
+
+        while level:
+            next_level = defaultdict(set)
+
+            for model, pks in level.items():
+                pks -= done[model]
+                if not pks:
+                    continue
+                done[model] |= pks
+
+                model.all_objects.using(db).filter(pk__in=pks).soft_delete()
+                model.after_soft_delete(pks)
+                deleted[model._meta.label] += len(pks)
+
+                for rel in model._meta.related_objects:
+                    if not (rel.one_to_many or rel.one_to_one):
+                        continue
+                    child = rel.related_model
+                    lookup = {f"{rel.field.name}__in": pks}
+                    if issubclass(child, SoftDeleteModel):
+                        next_level[child] |= set(
+                            child.all_objects.using(db)
+                            .filter(is_deleted=False, **lookup)
+                            .values_list("pk", flat=True)
+                        )
+                    else:
+                        child._base_manager.using(db).filter(**lookup).delete()
+
+            level = next_level
+
+    return dict(deleted)
+
+
 # カスタムユーザのマネージャークラス（ユーザ作成用のロジックを提供）
 class UserManager(BaseUserManager):
     # 一般ユーザの作成
@@ -154,6 +315,8 @@ class User(AbstractBaseUser, PermissionsMixin, SoftDeleteModel):
 
 # Surveysテーブル
 class Survey(SoftDeleteModel):
+    counter_fields = ("vote_total", "results_version")
+
     id = models.AutoField(primary_key=True, verbose_name="ID")
 
     user = models.ForeignKey(
@@ -161,6 +324,8 @@ class Survey(SoftDeleteModel):
         on_delete=models.CASCADE,
         related_name="surveys",
         db_column="user_id",
+        # 単独のインデックスは作らず、この列が先頭の複合インデックス(Meta.indexes)で代用する
+        db_index=False,
         null=False,
         blank=False,
     )
@@ -172,27 +337,31 @@ class Survey(SoftDeleteModel):
     start_at = models.DateTimeField(null=True, blank=True, verbose_name="投票開始日時")
 
     def save(self, *args, **kwargs):
-        # 既存の値を DB から取得（更新時のみ）
-        if self.pk:
-            previous_state = Survey.objects.filter(pk=self.pk).first()
-        else:
-            previous_state = None
+        # 更新前の値は読み込んだ時に覚えている値を使う（DBに問い合わせない）
+        is_new = not self.load_saved_state(kwargs.get("using"))
+        changed = self.changed_fields
 
         # --- 新規作成時（pkなし）で公開の場合 ---
-        if previous_state is None:
+        if is_new:
             if self.is_public and self.start_at is None:
                 self.start_at = now()
 
         # --- 更新で非公開→公開に変わった瞬間 ---
         if (
-            previous_state
-            and previous_state.is_public is False
+            not is_new
+            and self.loaded_value("is_public") is False
             and self.is_public is True
         ):
             if self.start_at is None:
                 self.start_at = now()
         super().save(*args, **kwargs)
 
+        # --- 検索インデックスの更新（タイトル・詳細が変わった時と論理削除時のみ） ---
+        if is_new or self.is_deleted or {"title", "description"} & changed:
+            from .search import get_search_backend
+
+            get_search_backend(kwargs.get("using") or "default").index(self)
+
     end_at = models.DateTimeField(null=True, blank=True, verbose_name="投票終了日時")
     tag_survey = models.ManyToManyField(
         "Tag", through="TagSurvey", related_name="surveys", verbose_name="タグ"
@@ -224,6 +393,18 @@ class Survey(SoftDeleteModel):
         verbose_name="投票フラグ",
     )
 
+    # 論理削除されていない投票の総数（投票の作成・削除時に votes.py で更新する）
+    # 詳細画面で毎回 COUNT しないための非正規化カラム
+    # カウンターは save() では書かない(counter_fields)ので、管理画面などのフォームにも出さない
+    vote_total = models.PositiveIntegerField(
+        default=0, db_default=0, editable=False, verbose_name="投票総数"
+    )
+    # 票数が変わるたびに +1 する（votes.py で票数と同じ UPDATE で更新する）
+    # 詳細画面のリアルタイム更新で、集計し直さずにこの値だけ見て変化に気づくため
+    results_version = models.PositiveBigIntegerField(
+        default=0, db_default=0, editable=False, verbose_name="投票結果のバージョン"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
     is_deleted = models.BooleanField(
@@ -237,6 +418,11 @@ class Survey(SoftDeleteModel):
         # 検索を速くするためにインデックス(目次)を設定
         indexes = [
             models.Index(fields=["user", "-created_at"]),
+            # 一覧画面: 論理削除されていない公開アンケートを id の降順で読む
+            # (WHERE is_deleted=0 AND is_public=1 ORDER BY id DESC LIMIT n)
+            models.Index(fields=["is_deleted", "is_public", "-id"]),
+            # 一覧画面: 自分のアンケート（一時保存を含む・「自分のアンケートのみ」）
+            models.Index(fields=["user", "is_deleted", "-id"]),
         ]
 
     def __str__(self):
@@ -278,6 +464,8 @@ class TagSurvey(SoftDeleteModel):
         Tag,  # Tagモデル（親）
         on_delete=models.CASCADE,
         db_column="tag_id",
+        # 単独のインデックスは作らず、この列が先頭の複合インデックス(Meta.indexes)で代用する
+        db_index=False,
         related_name="tag_surveys",
         verbose_name="タグID",
         null=False,
@@ -288,6 +476,8 @@ class TagSurvey(SoftDeleteModel):
         Survey,  # Surveyモデル（親）
         on_delete=models.CASCADE,
         db_column="survey_id",
+        # 単独のインデックスは作らず、この列が先頭の複合インデックス(Meta.indexes)で代用する
+        db_index=False,
         related_name="tag_surveys",
         verbose_name="アンケートID",
         null=False,
@@ -304,7 +494,12 @@ class TagSurvey(SoftDeleteModel):
 
     class Meta:
         db_table = "tag_surveys"
-        indexes = [models.Index(fields=["tag"]), models.Index(fields=["survey"])]
+        indexes = [
+            # タグでの絞り込み: tag_id IN (...) AND is_deleted=0 → survey_id までインデックスだけで読む
+            models.Index(fields=["tag", "is_deleted", "survey"]),
+            # アンケートに付いているタグの取得・付け直し
+            models.Index(fields=["survey", "is_deleted", "tag"]),
+        ]
 
     def __str__(self):
         return f"タグ名: {self.tag.tag_name} / アンケートID: {self.survey.id}"
@@ -312,12 +507,16 @@ class TagSurvey(SoftDeleteModel):
 
 # Optionsテーブル
 class Option(SoftDeleteModel):
+    counter_fields = ("vote_count",)
+
     id = models.AutoField(primary_key=True, verbose_name="ID")
 
     survey = models.ForeignKey(
         Survey,  # Surveyモデル（親）
         on_delete=models.CASCADE,
         db_column="survey_id",
+        # 単独のインデックスは作らず、この列が先頭の複合インデックス(Meta.indexes)で代用する
+        db_index=False,
         related_name="options",
         verbose_name="アンケートID",
         null=False,
@@ -331,6 +530,15 @@ class Option(SoftDeleteModel):
         blank=False,
     )
 
+    # この選択肢への投票数（投票の作成・変更・削除時に votes.py で更新する）
+    # save() では書かない(counter_fields)ので、フォームにも出さない
+    vote_count = models.PositiveIntegerField(
+        default=0,
+        db_default=0,
+        editable=False,
+        verbose_name="投票数",
+    )
+
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name="作成日時",
@@ -352,8 +560,9 @@ class Option(SoftDeleteModel):
         verbose_name = "選択肢"
         verbose_name_plural = "選択肢一覧"
         indexes = [
-            models.Index(fields=["survey"]),
-            models.Index(fields=["is_deleted"]),
+            # アンケートの選択肢を id 順に読む（is_deleted 単独のインデックスは
+            # ほぼ全行が False で絞り込みに使われないので、survey と組み合わせる）
+            models.Index(fields=["survey", "is_deleted", "id"]),
         ]
 
     def __str__(self):
@@ -368,6 +577,8 @@ class Vote(SoftDeleteModel):
         settings.AUTH_USER_MODEL,  # Userモデル（親）
         on_delete=models.CASCADE,
         db_column="user_id",
+        # 単独のインデックスは作らず、この列が先頭の複合インデックス(Meta.indexes)で代用する
+        db_index=False,
         related_name="votes",
         verbose_name="ユーザーID",
         null=False,
@@ -378,6 +589,8 @@ class Vote(SoftDeleteModel):
         Survey,  # Surveyモデル（親）
         on_delete=models.CASCADE,
         db_column="survey_id",
+        # 単独のインデックスは作らず、この列が先頭の複合インデックス(Meta.indexes)で代用する
+        db_index=False,
         related_name="votes",  # option.votes.all()
         verbose_name="アンケートID",
         null=False,
@@ -400,6 +613,39 @@ class Vote(SoftDeleteModel):
         blank=True,
     )
 
+    # コメントの審査状態（詳細画面には「公開」のコメントだけを表示する）
+    # COMMENT_MODERATION_MODE="deferred" の時は「審査待ち」で保存し、
+    # バックグラウンドのワーカー(moderate_comments コマンド)が審査して公開/非公開にする
+    MODERATION_APPROVED = 0
+    MODERATION_PENDING = 1
+    MODERATION_REJECTED = 2
+    MODERATION_STATUS = (
+        (MODERATION_APPROVED, "公開"),
+        (MODERATION_PENDING, "審査待ち"),
+        (MODERATION_REJECTED, "非公開"),
+    )
+    moderation_status = models.PositiveSmallIntegerField(
+        choices=MODERATION_STATUS,
+        default=MODERATION_APPROVED,
+        db_default=MODERATION_APPROVED,
+        verbose_name="コメント審査状態",
+    )
+
+    # 最後に審査した時の結果（コメントを変えずに選択肢だけ変えた時は審査し直さない）
+    #   moderation_hash   : 審査したコメント(正規化後)のハッシュ
+    #   moderation_policy : 審査した時の判定ポリシーのバージョン(モデル名・プロンプト)
+    # どちらかが今と違う時だけ、もう一度 OpenAI に問い合わせる
+    moderation_flagged = models.BooleanField(
+        null=True, blank=True, verbose_name="審査結果(NG)"
+    )
+    moderation_hash = models.CharField(
+        max_length=64, blank=True, default="", verbose_name="審査したコメントのハッシュ"
+    )
+    moderation_policy = models.CharField(
+        max_length=100, blank=True, default="", verbose_name="審査した判定バージョン"
+    )
+    moderated_at = models.DateTimeField(null=True, blank=True, verbose_name="審査日時")
+
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name="作成日時",
@@ -416,6 +662,20 @@ class Vote(SoftDeleteModel):
         verbose_name="削除フラグ",
     )
 
+    # 有効な投票(is_deleted=False)の時だけ 1、論理削除された投票は NULL になる生成列
+    # 一意制約を (user, survey, active_key) にかけることで、
+    # 有効な投票は1人1票に保ちつつ、論理削除された投票はいくつでも残せる（NULL は重複扱いされない）
+    # VIRTUAL（保存しない列）なので、列の追加時に既存の行を書き換える必要がない
+    active_key = models.GeneratedField(
+        expression=models.Case(
+            models.When(is_deleted=False, then=models.Value(1)),
+            default=None,
+        ),
+        output_field=models.SmallIntegerField(null=True),
+        db_persist=False,
+        verbose_name="有効な投票のキー",
+    )
+
     class Meta:
         db_table = "votes"
         verbose_name = "投票"
@@ -424,13 +684,207 @@ class Vote(SoftDeleteModel):
         # 同じユーザーが同じアンケートに複数票を入れられないように実装。
         constraints = [
             # アクティブ票（is_deleted=False）は user×survey で1件だけ
+            # 論理削除された票は active_key が NULL になるので制約にかからない
             models.UniqueConstraint(
-                fields=["user", "survey", "is_deleted"],
-                name="uq_vote_user_survey_active",
+                fields=["user", "survey", "active_key"],
+                name="uq_vote_user_survey_active_key",
             ),
         ]
+        indexes = [
+            # 詳細画面のコメント一覧: アンケートの有効な投票を新しい順に読む
+            models.Index(fields=["survey", "is_deleted", "-created_at"]),
+            # 一覧画面の「投票済み」判定(has_voted)と詳細画面の自分の投票
+            # (user, survey, is_deleted) だけで判定でき、テーブル本体を読まない
+            models.Index(fields=["user", "survey", "is_deleted"]),
+        ]
+
+    # 論理削除された投票の分だけ、選択肢とアンケートの票数を減らす
+    @classmethod
+    def after_soft_delete(cls, pks):
+        from .votes import record_votes_deleted
+
+        record_votes_deleted(pks)
 
     def __str__(self):
         return (
             f"Vote(ID={self.id}, ユーザーID={self.user_id}, 選択項目={self.option_id})"
         )
+
+
+# アンケート検索用の n-gram 転置インデックス（MySQL 以外のDBで使用）
+# MySQL では surveys テーブルの FULLTEXT インデックスを使うので、このテーブルは空のまま
+class SurveySearchGram(models.Model):
+    survey = models.ForeignKey(
+        Survey,  # Surveyモデル（親）
+        on_delete=models.CASCADE,
+        db_column="survey_id",
+        related_name="search_grams",
+        verbose_name="アンケートID",
+    )
+
+    # タイトル・詳細を NFKC 正規化して n 文字ずつ切り出した文字列
+    gram = models.CharField(max_length=10, verbose_name="n-gram")
+
+    class Meta:
+        db_table = "survey_search_grams"
+        constraints = [
+            # gram で引いて survey_id を返すので (gram, survey) の順にする
+            models.UniqueConstraint(
+                fields=["gram", "survey"], name="uq_search_gram_survey"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} (アンケートID={self.survey_id})"
+
+
+# 受付終了したアンケートの集計結果（票数・円グラフ用データ・コメント一覧）
+# 受付終了後は結果が変わらないので、一度だけ集計して保存し詳細画面ではこれを読む
+class SurveyResultSnapshot(models.Model):
+    survey = models.OneToOneField(
+        Survey,  # Surveyモデル（親）
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_column="survey_id",
+        related_name="result_snapshot",
+        verbose_name="アンケートID",
+    )
+
+    # results.build_snapshot_payload() で作った JSON
+    payload = models.JSONField(verbose_name="集計結果")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+
+    class Meta:
+        db_table = "survey_result_snapshots"
+        verbose_name = "集計結果"
+        verbose_name_plural = "集計結果一覧"
+
+    def __str__(self):
+        return f"集計結果 (アンケートID={self.survey_id})"
+
+
+# コメント審査のジョブキュー（外部のメッセージブローカーを使わず DB のテーブルで管理する）
+# 投票時にジョブを積み、moderate_comments コマンドのワーカーが取り出して審査する
+class ModerationJob(models.Model):
+    STATUS_PENDING = 0
+    STATUS_RUNNING = 1
+    STATUS_DONE = 2
+    STATUS_FAILED = 3
+    STATUS = (
+        (STATUS_PENDING, "待機中"),
+        (STATUS_RUNNING, "実行中"),
+        (STATUS_DONE, "完了"),
+        (STATUS_FAILED, "失敗"),
+    )
+
+    id = models.BigAutoField(primary_key=True, verbose_name="ID")
+
+    vote = models.ForeignKey(
+        Vote,  # Voteモデル（親）
+        on_delete=models.CASCADE,
+        db_column="vote_id",
+        related_name="moderation_jobs",
+        verbose_name="投票ID",
+    )
+
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS,
+        default=STATUS_PENDING,
+        db_default=STATUS_PENDING,
+        verbose_name="状態",
+    )
+
+    # 失敗時の再試行回数と、次に実行してよい日時（再試行は間隔を空ける）
+    attempts = models.PositiveSmallIntegerField(
+        default=0, db_default=0, verbose_name="試行回数"
+    )
+    run_after = models.DateTimeField(default=now, verbose_name="実行予定日時")
+
+    # ワーカーが取り出した日時（ワーカーが落ちた時に取り戻すために使う）
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="取得日時")
+
+    last_error = models.TextField(blank=True, default="", verbose_name="エラー内容")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        db_table = "moderation_jobs"
+        verbose_name = "コメント審査ジョブ"
+        verbose_name_plural = "コメント審査ジョブ一覧"
+        indexes = [
+            # ワーカーは「待機中 かつ 実行予定日時を過ぎたもの」を古い順に取り出す
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"ModerationJob(ID={self.id}, 投票ID={self.vote_id}, 状態={self.status})"
+
+
+# 誹謗中傷チェック(OpenAI)の判定結果キャッシュ（verdict_cache.py で使用）
+class ModerationVerdict(models.Model):
+    # 正規化したコメントと判定ポリシーのバージョンから作った SHA-256
+    key = models.CharField(max_length=64, primary_key=True, verbose_name="キー")
+
+    flagged = models.BooleanField(verbose_name="NG判定")
+
+    # 判定に使ったモデル名・プロンプトのバージョン
+    policy_version = models.CharField(max_length=100, verbose_name="判定バージョン")
+
+    # 判定した（正規化後の）コメント。ローカルの分類器の学習データに使う
+    text = models.TextField(blank=True, default="", verbose_name="コメント")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    # 有効期限（期限切れの行は verdict_cache.prune() で削除する）
+    expires_at = models.DateTimeField(db_index=True, verbose_name="有効期限")
+
+    class Meta:
+        db_table = "moderation_verdicts"
+        verbose_name = "判定キャッシュ"
+        verbose_name_plural = "判定キャッシュ一覧"
+        indexes = [
+            # 上限件数を超えた時に古い順に消すため
+            models.Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.key[:12]}... ({'NG' if self.flagged else 'OK'})"
+
+
+# フォームの二重送信対策（冪等キー）
+# フォームに埋め込んだトークンごとに、最初の POST の結果（リダイレクト先）を短い期間だけ保存する
+class IdempotencyKey(models.Model):
+    STATUS_PROCESSING = 0  # 最初の POST を処理中
+    STATUS_DONE = 1  # 処理済み（redirect_url に結果がある）
+    STATUS_CHOICES = [
+        (STATUS_PROCESSING, "処理中"),
+        (STATUS_DONE, "処理済み"),
+    ]
+
+    # 用途・ユーザー・トークンから作った SHA-256
+    key = models.CharField(max_length=64, primary_key=True, verbose_name="キー")
+
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES,
+        default=STATUS_PROCESSING,
+        verbose_name="状態",
+    )
+
+    # 最初の POST が返したリダイレクト先（同じトークンの POST にはこれを返す）
+    redirect_url = models.CharField(max_length=255, blank=True, verbose_name="結果URL")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+
+    # 有効期限（期限切れの行は idempotency.prune() で削除する）
+    expires_at = models.DateTimeField(db_index=True, verbose_name="有効期限")
+
+    class Meta:
+        db_table = "idempotency_keys"
+        verbose_name = "冪等キー"
+        verbose_name_plural = "冪等キー一覧"
+
+    def __str__(self):
+        return f"{self.key[:12]}... ({self.get_status_display()})"
@@ -0,0 +1,196 @@
+# コメント審査（誹謗中傷チェック）の実行方法を切り替える処理
+#   - sync     : これまで通り、フォームの clean_comment で OpenAI に問い合わせてから保存する
+#   - deferred : 投票はすぐ保存し、コメントは「審査待ち」にしてジョブを積む
+#                moderate_comments コマンドのワーカーが OpenAI に問い合わせて公開/非公開にする
+# deferred にすると、OpenAI の応答待ち(数秒)で Gunicorn のワーカーが塞がらなくなる
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from . import metrics
+from .ai_filters import MODERATION_POLICY_VERSION, moderate_batch
+from .models import ModerationJob, Vote
+from .verdict_cache import content_hash
+
+logger = logging.getLogger(__name__)
+
+
+def is_deferred():
+    """コメント審査をバックグラウンドで行う設定かどうか"""
+    return getattr(settings, "COMMENT_MODERATION_MODE", "sync") == "deferred"
+
+
+def needs_moderation(vote, comment):
+    """
+    comment を審査する必要があるか。
+    前回審査したコメントと同じ内容(正規化後のハッシュが同じ)で、判定ポリシーも
+    変わっていなければ、前回の結果をそのまま使えるので審査しない
+    """
+    if not (comment or "").strip():
+        return False
+    return (
+        vote.moderation_hash != content_hash(comment)
+        or vote.moderation_policy != MODERATION_POLICY_VERSION
+    )
+
+
+# 審査結果として Vote に保存するフィールド（bulk_update の対象にも使う）
+VERDICT_FIELDS = (
+    "moderation_flagged",
+    "moderation_hash",
+    "moderation_policy",
+    "moderated_at",
+)
+
+
+def verdict_fields(comment, flagged):
+    """審査結果として Vote に保存する値（VERDICT_FIELDS の順）"""
+    values = (flagged, content_hash(comment), MODERATION_POLICY_VERSION, now())
+    return dict(zip(VERDICT_FIELDS, values))
+
+
+def record_verdict(vote, comment, flagged):
+    """審査結果を vote に書き込む（保存は呼び出し側の save で行う）"""
+    for name, value in verdict_fields(comment, flagged).items():
+        setattr(vote, name, value)
+
+
+def mark_pending(vote):
+    """
+    コメントを「審査待ち」にする（保存は呼び出し側の save で行う）
+    保存の前に呼ぶので、一度「公開」で書いてから直す UPDATE が要らない
+    """
+    vote.moderation_status = Vote.MODERATION_PENDING
+
+
+def enqueue_comment_moderation(vote):
+    """審査ジョブを積む（mark_pending して保存した投票について、同じトランザクションで呼ぶ）"""
+    return ModerationJob.objects.create(vote=vote)
+
+
+def claim_jobs(limit):
+    """実行できるジョブを最大 limit 件取り出して「実行中」にする"""
+    current = now()
+    lock_timeout = timedelta(
+        seconds=getattr(settings, "MODERATION_JOB_LOCK_TIMEOUT", 300)
+    )
+
+    with transaction.atomic():
+        # ワーカーが途中で落ちて「実行中」のまま残ったジョブは待機中に戻す
+        ModerationJob.objects.filter(
+            status=ModerationJob.STATUS_RUNNING,
+            locked_at__lt=current - lock_timeout,
+        ).update(status=ModerationJob.STATUS_PENDING, locked_at=None)
+
+        # skip_locked: 他のワーカーが取り出し中の行は待たずに飛ばす（MySQL 8 以降）
+        jobs = list(
+            ModerationJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ModerationJob.STATUS_PENDING, run_after__lte=current)
+            .order_by("id")[:limit]
+        )
+        ModerationJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ModerationJob.STATUS_RUNNING, locked_at=current
+        )
+    return jobs
+
+
+def finish_job(job, vote, flagged):
+    """
+    審査結果をコメントに反映してジョブを完了にする。
+    審査している間にコメントが編集されていたら結果は書かない
+    （新しいコメントは、編集時に積まれた別のジョブで審査する）
+    """
+    # 循環 import を避けるためここで import する
+    from .results import discard_snapshot
+
+    status = Vote.MODERATION_REJECTED if flagged else Vote.MODERATION_APPROVED
+    with transaction.atomic():
+        # 審査したコメントのままの時だけ更新する（古い結果で新しいコメントを公開しない）
+        updated = Vote.all_objects.filter(pk=vote.pk, comment=vote.comment).update(
+            moderation_status=status, **verdict_fields(vote.comment, flagged)
+        )
+        ModerationJob.objects.filter(pk=job.pk).update(
+            status=ModerationJob.STATUS_DONE, last_error=""
+        )
+        if not updated:
+            metrics.incr("moderation.stale_skipped")
+            return
+        # 受付終了後に審査が終わった場合は、コメント一覧のスナップショットを作り直させる
+        discard_snapshot(vote.survey_id)
+
+
+def fail_job(job, error):
+    """審査に失敗したジョブを、間隔を空けて再試行する（上限に達したら失敗にする）"""
+    max_attempts = getattr(settings, "MODERATION_JOB_MAX_ATTEMPTS", 5)
+    attempts = job.attempts + 1
+    if attempts >= max_attempts:
+        # 審査できなかったコメントは「審査待ち」のまま表示しない
+        status = ModerationJob.STATUS_FAILED
+    else:
+        status = ModerationJob.STATUS_PENDING
+    ModerationJob.objects.filter(pk=job.pk).update(
+        status=status,
+        attempts=attempts,
+        # 再試行の間隔は 2, 4, 8... 秒と伸ばしていく
+        run_after=now() + timedelta(seconds=2**attempts),
+        locked_at=None,
+        last_error=str(error)[:1000],
+    )
+
+
+def run_jobs(jobs):
+    """ジョブをまとめて実行する（審査が必要なコメントは OpenAI にまとめて問い合わせる）"""
+    votes = Vote.all_objects.in_bulk([job.vote_id for job in jobs])
+
+    to_check = []  # (ジョブ, 投票)
+    for job in jobs:
+        vote = votes.get(job.vote_id)
+        if vote is None or vote.is_deleted or not (vote.comment or "").strip():
+            # 投票が消された／コメントが空になった場合は審査不要
+            ModerationJob.objects.filter(pk=job.pk).update(
+                status=ModerationJob.STATUS_DONE
+            )
+        elif not needs_moderation(vote, vote.comment):
+            # 同じコメントを同じポリシーで審査済み（ジョブが重複して積まれた時など）
+            # 読んだ後に編集されていれば、finish_job は前回の結果を書かない
+            metrics.incr("moderation.unchanged_skipped")
+            finish_job(job, vote, vote.moderation_flagged)
+        else:
+            to_check.append((job, vote))
+
+    if not to_check:
+        return
+
+    try:
+        # OpenAI で判定できなかった時は例外にして、時間を空けて再試行する
+        verdicts = moderate_batch(
+            [vote.comment for _, vote in to_check], fail_policy="raise"
+        )
+    except Exception as e:
+        logger.warning(
+            "コメント審査に失敗しました (jobs=%s): %s",
+            [job.pk for job, _ in to_check],
+            e,
+        )
+        for job, _ in to_check:
+            fail_job(job, e)
+        return
+
+    for (job, vote), flagged in zip(to_check, verdicts):
+        finish_job(job, vote, flagged)
+
+
+def run_job(job):
+    """ジョブを1件実行する"""
+    run_jobs([job])
+
+
+def process_pending_jobs(limit=20):
+    """待機中のジョブをまとめて処理し、処理した件数を返す"""
+    jobs = claim_jobs(limit)
+    if jobs:
+        run_jobs(jobs)
+    return len(jobs)
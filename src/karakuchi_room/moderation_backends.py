@@ -0,0 +1,124 @@
+# 誹謗中傷チェックの判定方法（バックエンド）
+# settings.MODERATION_BACKENDS に並べた順に試し、最初に判定できたものの結果を使う
+#   DictionaryBackend : NGワード辞書（含まれていれば NG。含まれていなければ次へ）
+#   ClassifierBackend : ローカルの n-gram 分類器（自信がある時だけ判定。なければ次へ）
+#   OpenAIBackend     : OpenAI の Moderation API と ChatGPT（ネットワークに出る）
+# OpenAIBackend を外せば、ネットワークに出ずに判定できる（テスト・負荷試験用）
+import os
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .classifier import NgramClassifier
+from .ng_words import contains_ng_word
+
+DEFAULT_BACKENDS = [
+    "karakuchi_room.moderation_backends.DictionaryBackend",
+    "karakuchi_room.moderation_backends.ClassifierBackend",
+    "karakuchi_room.moderation_backends.OpenAIBackend",
+]
+
+_backends = None
+
+
+class ModerationBackend:
+    """check() は True=NG / False=問題なし / None=判定できない（次のバックエンドへ）を返す"""
+
+    name = None
+    # ネットワークに出るバックエンドの結果だけ判定キャッシュに保存する
+    remote = False
+
+    def check(self, text):
+        raise NotImplementedError
+
+    def check_batch(self, texts):
+        """複数のコメントを判定する（まとめて問い合わせられるバックエンドは上書きする）"""
+        return [self.check(text) for text in texts]
+
+
+class DictionaryBackend(ModerationBackend):
+    name = "dictionary"
+
+    def check(self, text):
+        # 辞書にない言葉でも NG のことはあるので、問題なしとは言い切らない
+        return True if contains_ng_word(text) else None
+
+
+class ClassifierBackend(ModerationBackend):
+    """
+    MODERATION_CLASSIFIER_FILE の学習済みモデルで判定する。
+    NG である確率が MODERATION_CLASSIFIER_CONFIDENCE 以上なら NG、
+    1 - MODERATION_CLASSIFIER_CONFIDENCE 以下なら問題なし、その間は判定しない
+    """
+
+    name = "classifier"
+
+    def __init__(self):
+        self._model = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get_model(self):
+        """学習済みモデル（ファイルが更新されたら読み込み直す）。なければ None"""
+        path = getattr(settings, "MODERATION_CLASSIFIER_FILE", None)
+        if not path:
+            return None
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._model = NgramClassifier.load(path)
+                    self._mtime = mtime
+        return self._model
+
+    def check(self, text):
+        model = self.get_model()
+        probability = model.probability(text) if model is not None else None
+        if probability is None:
+            return None
+
+        confidence = getattr(settings, "MODERATION_CLASSIFIER_CONFIDENCE", 0.95)
+        if probability >= confidence:
+            return True
+        if probability <= 1 - confidence:
+            return False
+        return None
+
+
+class OpenAIBackend(ModerationBackend):
+    name = "openai"
+    remote = True
+
+    def check(self, text):
+        # 循環 import を避けるためここで import する
+        from .ai_filters import check_remote
+
+        # 判定できなかった時は ModerationUnavailable が送出される
+        return check_remote(text)
+
+    def check_batch(self, texts):
+        from .ai_filters import check_remote_batch
+
+        return check_remote_batch(texts)
+
+
+def get_backends():
+    """settings.MODERATION_BACKENDS のバックエンドを順番に並べたもの（プロセスごとに一度だけ作る）"""
+    global _backends
+    if _backends is None:
+        _backends = [
+            import_string(path)()
+            for path in getattr(settings, "MODERATION_BACKENDS", DEFAULT_BACKENDS)
+        ]
+    return _backends
+
+
+def reset_backends():
+    """設定を変えた時に作り直させる（テスト用）"""
+    global _backends
+    _backends = None
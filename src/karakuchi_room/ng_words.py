@@ -0,0 +1,181 @@
+# NGワード辞書のチェック（OpenAI に問い合わせる前にローカルで判定する）
+# 辞書の全単語から Aho-Corasick のオートマトンを一度だけ作り、コメントを1回なぞるだけで判定する
+# 単語数が数千になっても、判定にかかる時間はコメントの長さにしか比例しない
+#
+# 辞書もコメントも同じ正規化をしてから比べるので、表記ゆれは辞書に書かなくてよい
+#   - NFKC（全角英数字・半角カタカナなどを揃える）
+#   - カタカナ → ひらがな（「バカ」「ﾊﾞｶ」も「ばか」で引っかかる）
+#   - 英字は小文字
+#
+# カタカナもひらがなに揃えるので、「シネマ」が「しね」に引っかかるような誤検出が起きる。
+# そうした普通の言葉は ALLOWED_WORDS に書いておき、コメント中のその部分はNGワードとして見ない
+from collections import deque
+from pathlib import Path
+import unicodedata
+
+from django.conf import settings
+
+# --------------------------
+# NGワード（弱攻撃含む）
+# カタカナ・全角/半角の書き分けは不要（正規化してから比べる）
+# --------------------------
+NG_WORDS = [
+    "むかつく",
+    "腹立つ",
+    "ばか",
+    "馬鹿",
+    "あほ",
+    "ぼけ",
+    "死ね",
+    "しね",
+    "殺す",
+    "ころす",
+]
+
+# NGワードを含むが問題のない言葉（この言葉の中で見つかったNGワードは無視する）
+ALLOWED_WORDS = [
+    "シネマ",
+    "シネコン",
+    "シネラマ",
+    "バカンス",
+    "アホウドリ",
+    "ころすけ",
+    # 「そればかり」「始めたばかり」
+    "ばかり",
+]
+
+# カタカナ(ァ〜ヶ)をひらがなにずらす変換表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+_matcher = None
+_allowed_matcher = None
+
+
+def normalize_text(text):
+    """NFKC → カタカナをひらがなに → 小文字"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return text.translate(_KATAKANA_TO_HIRAGANA).lower()
+
+
+class AhoCorasick:
+    """複数の単語を1回の走査で探すオートマトン"""
+
+    def __init__(self, words):
+        # 状態ごとに「次の文字 → 次の状態」「失敗時の戻り先」「ここで終わる単語の長さ」を持つ
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [0]
+
+        for word in words:
+            if word:
+                self._add(word)
+        self._build_fail()
+
+    def _add(self, word):
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+            state = next_state
+        self._output[state] = len(word)
+
+    def _build_fail(self):
+        # 浅い状態から順に（幅優先で）失敗時の戻り先を決める
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # 戻り先で終わる単語があれば、ここでも見つかったことにする
+                if not self._output[next_state]:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+
+    def spans(self, text):
+        """見つかった単語の (開始位置, 終了位置) を順に返す（text は正規化済みのもの）"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield end - output[state], end
+
+    def find(self, text):
+        """最初に見つかった単語を返す。なければ None（text は正規化済みのもの）"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return text[end - output[state] : end]
+        return None
+
+
+def load_words(words=NG_WORDS, setting="NG_WORDS_FILE"):
+    """組み込みの辞書と設定のファイル（1行1単語、# から後はコメント）の単語を正規化して重複を除く"""
+    words = list(words)
+
+    path = getattr(settings, setting, None)
+    if path:
+        for line in Path(path).read_text(encoding="utf-8").splitlines():
+            word = line.split("#", 1)[0].strip()
+            if word:
+                words.append(word)
+
+    return sorted({normalize_text(word) for word in words} - {""})
+
+
+def get_matcher():
+    """プロセスごとに一度だけオートマトンを作る"""
+    global _matcher
+    if _matcher is None:
+        _matcher = AhoCorasick(load_words())
+    return _matcher
+
+
+def get_allowed_matcher():
+    global _allowed_matcher
+    if _allowed_matcher is None:
+        _allowed_matcher = AhoCorasick(
+            load_words(ALLOWED_WORDS, "NG_WORDS_ALLOWED_FILE")
+        )
+    return _allowed_matcher
+
+
+def reset_matcher():
+    """辞書を変更した時に作り直させる"""
+    global _matcher, _allowed_matcher
+    _matcher = None
+    _allowed_matcher = None
+
+
+def mask_allowed_words(text):
+    """問題のない言葉の部分を、どの単語にも含まれない文字で塗りつぶす（text は正規化済みのもの）"""
+    chars = None
+    for start, end in get_allowed_matcher().spans(text):
+        if chars is None:
+            chars = list(text)
+        chars[start:end] = "\0" * (end - start)
+    return text if chars is None else "".join(chars)
+
+
+def find_ng_word(text):
+    """コメントに含まれるNGワード（正規化後の表記）を返す。なければ None"""
+    return get_matcher().find(mask_allowed_words(normalize_text(text)))
+
+
+def contains_ng_word(text):
+    """独自NGワードの検出"""
+    return find_ng_word(text) is not None
@@ -0,0 +1,59 @@
+# キーセット(カーソル)方式のページネーション
+# OFFSET を使うと「読み飛ばす行」もDBが毎回スキャンするため、ページが進むほど遅くなる
+# ここでは「前のページの最後の id より小さいもの」を WHERE で絞り込み、LIMIT だけで取得する
+from django.conf import settings
+
+
+class KeysetPage:
+    """キーセットページネーションの1ページ分（ListView の page_obj として使う）"""
+
+    def __init__(self, object_list, next_cursor, page_size):
+        self.object_list = object_list
+        # 次のページの先頭を表すトークン（最後の行の id）。次がなければ None
+        self.next_cursor = next_cursor
+        self.page_size = page_size
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def parse_cursor(value):
+    """GETパラメータのカーソルを id(正の整数) に変換する。不正な値は None（先頭ページ扱い）"""
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def get_page_size(value=None):
+    """?size= の値を 1〜SURVEY_LIST_MAX_PAGE_SIZE の範囲に丸める"""
+    default = getattr(settings, "SURVEY_LIST_PAGE_SIZE", 20)
+    maximum = getattr(settings, "SURVEY_LIST_MAX_PAGE_SIZE", 100)
+    try:
+        size = int(value) if value else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def keyset_paginate(queryset, cursor, page_size, key="id"):
+    """key の降順で cursor より後ろの行を page_size 件だけ取得する"""
+    if cursor is not None:
+        queryset = queryset.filter(**{f"{key}__lt": cursor})
+
+    # 1件多く取得して「次のページがあるか」を COUNT なしで判定する
+    rows = list(queryset.order_by(f"-{key}")[: page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = getattr(rows[-1], key)
+
+    return KeysetPage(rows, next_cursor, page_size)
@@ -0,0 +1,205 @@
+# アンケート詳細画面の票数をリアルタイムに届ける仕組み（Server-Sent Events 用）
+# 見ている人ごとに集計すると、人数分だけ同じクエリが流れる。そこでプロセス(Gunicorn のワーカー)ごとに
+#   - 見られているアンケートの results_version を1本のクエリでまとめて読み（RESULTS_STREAM_POLL_INTERVAL 秒ごと）
+#   - 変わったアンケートだけ票数を1回読み、見ている全員に同じ結果を配る
+# 同じプロセスで投票された時は、コミット直後の notify() で待たずに読み直す
+# （他のワーカーでの投票は、次のポーリングで気づく）
+# 1人の配信で Gunicorn のスレッドを1つ使うので、同時に配信する人数は RESULTS_STREAM_MAX_CONNECTIONS まで
+import logging
+import threading
+from queue import Full, Queue
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from . import metrics
+from .models import Option, Survey
+
+logger = logging.getLogger(__name__)
+
+# 1人あたりに溜めておくイベントの数（読み切れない人の分は捨てる。次のイベントに全体の票数が入っている）
+QUEUE_SIZE = 16
+
+
+def load_results(survey_id):
+    """配信する票数（results_version・総数・選択肢ごとの票数）"""
+    # バージョンを先に読む（票数を読む間に投票されても、次のポーリングで読み直される）
+    survey = (
+        Survey.all_objects.filter(pk=survey_id)
+        .values("results_version", "vote_total", "is_open", "end_at")
+        .first()
+    )
+    if survey is None:
+        return None
+    counts = dict(
+        Option.objects.filter(survey_id=survey_id, is_deleted=False)
+        .order_by("id")
+        .values_list("id", "vote_count")
+    )
+    metrics.incr("realtime.results_loaded")
+    return {
+        "version": survey["results_version"],
+        "vote_total": survey["vote_total"],
+        "counts": counts,
+        # 受付終了したら、これ以上は配信しない（results.is_closed と同じ判定）
+        "closed": survey["is_open"] == 1
+        or (survey["end_at"] is not None and now() >= survey["end_at"]),
+    }
+
+
+def make_event(old, new, resync=False):
+    """
+    配信するイベント。counts は全体の票数、changed は前回から変わった分(+1 / -1 など)
+    （途中のイベントを取りこぼしても、counts を表示すれば正しい票数になる）
+    resync=True は、バージョンに関係なくこの票数を表示し直させる（接続直後・バージョンが戻った時）
+    """
+    old_counts = old["counts"] if old else {}
+    changed = {
+        option_id: count - old_counts.get(option_id, 0)
+        for option_id, count in new["counts"].items()
+        if count != old_counts.get(option_id, 0)
+    }
+    return {**new, "changed": changed, "resync": resync}
+
+
+def mark_changed(survey_id):
+    """
+    票数以外で結果の表示が変わった時（受付終了・再開など）に results_version を進め、
+    見ている人に読み直させる
+    """
+    Survey.all_objects.filter(pk=survey_id).update(
+        results_version=F("results_version") + 1
+    )
+    transaction.on_commit(lambda: notify(survey_id))
+
+
+class ResultsHub:
+    """プロセス内の配信先（詳細画面を開いている人）をアンケートごとにまとめる"""
+
+    def __init__(self):
+        self._subscribers = {}  # survey_id → 配信先の Queue の集合
+        self._results = {}  # survey_id → 最後に配った票数
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, survey_id, limit=None):
+        """
+        配信先を登録して Queue を返す。最初のイベントは今の票数（なければ None）
+        既に limit 人に配信している時は登録せずに None を返す
+        """
+        queue = Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            if limit is not None and self._count() >= limit:
+                metrics.incr("realtime.rejected")
+                return None
+            self._subscribers.setdefault(survey_id, set()).add(queue)
+            results = self._results.get(survey_id)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="results-hub", daemon=True
+                )
+                self._thread.start()
+
+        if results is None:
+            # このプロセスで最初に見る人だけが集計する
+            results = load_results(survey_id)
+            if results is not None:
+                with self._lock:
+                    results = self._results.setdefault(survey_id, results)
+
+        queue.put(make_event(None, results, resync=True) if results else None)
+        return queue
+
+    def unsubscribe(self, survey_id, queue):
+        with self._lock:
+            queues = self._subscribers.get(survey_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    # 誰も見ていないアンケートは読まない
+                    del self._subscribers[survey_id]
+                    self._results.pop(survey_id, None)
+
+    def _count(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count()
+
+    def notify(self, *survey_ids):
+        """票数が変わったことを知らせる（このプロセスで見ている人がいれば、すぐ読み直す）"""
+        with self._lock:
+            watched = any(survey_id in self._subscribers for survey_id in survey_ids)
+        if watched:
+            self._wakeup.set()
+
+    def publish(self, survey_id, results):
+        """
+        新しい票数を見ている全員に配る（同じバージョンなら何もしない）
+        カウンターの作り直しなどでバージョンが戻った時は、表示し直させる(resync)
+        """
+        with self._lock:
+            old = self._results.get(survey_id)
+            if old is not None and results["version"] == old["version"]:
+                return
+            if survey_id not in self._subscribers:
+                return
+            self._results[survey_id] = results
+            queues = list(self._subscribers[survey_id])
+
+        resync = old is not None and results["version"] < old["version"]
+        event = make_event(old, results, resync=resync)
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except Full:
+                metrics.incr("realtime.dropped")
+        metrics.incr("realtime.published")
+
+    def poll(self):
+        """見られているアンケートのバージョンをまとめて読み、変わったものだけ集計して配る"""
+        with self._lock:
+            watched = {
+                survey_id: results["version"]
+                for survey_id, results in self._results.items()
+                if survey_id in self._subscribers
+            }
+        if not watched:
+            return
+
+        versions = Survey.all_objects.filter(pk__in=watched).values_list(
+            "id", "results_version"
+        )
+        for survey_id, version in versions:
+            if version != watched[survey_id]:
+                results = load_results(survey_id)
+                if results is not None:
+                    self.publish(survey_id, results)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(getattr(settings, "RESULTS_STREAM_POLL_INTERVAL", 1))
+            self._wakeup.clear()
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("投票結果の読み直しに失敗しました")
+            finally:
+                # リクエストの終わりと同じく、CONN_MAX_AGE を過ぎた接続を閉じる
+                connection.close_if_unusable_or_obsolete()
+
+
+hub = ResultsHub()
+
+
+@metrics.gauge("realtime.subscribers")
+def subscriber_count():
+    return hub.subscriber_count()
+
+
+def notify(*survey_ids):
+    hub.notify(*survey_ids)
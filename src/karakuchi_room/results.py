@@ -0,0 +1,148 @@
+# アンケート詳細画面に表示する「投票結果」（票数・円グラフ用データ・コメント一覧）を作る処理
+# 受付終了したアンケートは結果が変わらないため、終了後に一度だけ集計して
+# SurveyResultSnapshot に保存し、以降はそれを読むだけにする（集計クエリを0本にする）
+from django.utils.dateparse import parse_datetime
+
+from .models import Option, SurveyResultSnapshot, Vote
+
+# 円グラフと凡例の固定パレット（選択肢の並び順に割り当てる）
+COLOR_PALETTE = ["#34d399", "#f87171", "#60a5fa", "#fbbf24"]
+
+
+def is_closed(survey):
+    """受付終了（期限切れ or is_open=1）かどうか"""
+    return survey.is_expired or survey.is_open == 1
+
+
+def chart_context(options):
+    """選択肢の並びから Chart.js 用の配列と option_id → 色 のマップを作る"""
+    labels = []
+    vote_counts = []
+    colors = []
+    option_color_map = {}  # option_id → 色マップ
+
+    for idx, opt in enumerate(options):
+        labels.append(opt["label"])
+        vote_counts.append(opt["vote_count"])
+        color = COLOR_PALETTE[idx % len(COLOR_PALETTE)]
+        colors.append(color)
+        option_color_map[opt["id"]] = color
+
+    return {
+        "chart_labels": labels,
+        "chart_counts": vote_counts,
+        "chart_colors": colors,
+        "option_color_map": option_color_map,
+    }
+
+
+def comment_queryset(survey):
+    """コメント付きの投票(コメントなしの投票を除外)を新しい順に返す"""
+    return (
+        # 審査で「公開」になったコメントだけを表示する（審査待ち・非公開は出さない）
+        Vote.objects.filter(
+            survey=survey,
+            is_deleted=False,
+            moderation_status=Vote.MODERATION_APPROVED,
+        )
+        .exclude(comment__isnull=True)
+        .exclude(comment="")
+        .select_related("option")
+        .order_by("-created_at")
+    )
+
+
+def live_results(survey):
+    """受付中のアンケートの結果（毎回DBから読む）"""
+    # 票数は投票時に更新している option.vote_count をそのまま読む
+    options = list(
+        Option.objects.filter(survey=survey, is_deleted=False)
+        .order_by("id")
+        .values("id", "label", "vote_count")
+    )
+
+    ctx = chart_context(options)
+    ctx["option_vote_counts"] = options
+    ctx["vote_with_comment"] = comment_queryset(survey)
+    # 投票総数は COUNT せず、投票時に更新しているカウンターを使う
+    ctx["vote_total"] = survey.vote_total
+    return ctx
+
+
+def build_snapshot_payload(survey):
+    """スナップショットとして保存する JSON（票数・グラフ用データ・コメント一覧）を作る"""
+    options = list(
+        Option.objects.filter(survey=survey, is_deleted=False)
+        .order_by("id")
+        .values("id", "label", "vote_count")
+    )
+    chart = chart_context(options)
+    comments = [
+        {
+            "option": {"id": vote.option_id, "label": vote.option.label},
+            "comment": vote.comment,
+            "created_at": vote.created_at.isoformat(),
+        }
+        for vote in comment_queryset(survey)
+    ]
+    return {
+        "options": options,
+        "chart_labels": chart["chart_labels"],
+        "chart_counts": chart["chart_counts"],
+        "chart_colors": chart["chart_colors"],
+        "comments": comments,
+        "vote_total": survey.vote_total,
+    }
+
+
+def results_from_payload(payload):
+    """保存済みのスナップショットからテンプレート用のコンテキストを作る（DBアクセスなし）"""
+    comments = [
+        {**comment, "created_at": parse_datetime(comment["created_at"])}
+        for comment in payload["comments"]
+    ]
+    return {
+        "option_vote_counts": payload["options"],
+        "chart_labels": payload["chart_labels"],
+        "chart_counts": payload["chart_counts"],
+        "chart_colors": payload["chart_colors"],
+        # JSON のキーは文字列になるので、選択肢一覧から作り直す
+        "option_color_map": {
+            opt["id"]: color
+            for opt, color in zip(payload["options"], payload["chart_colors"])
+        },
+        "vote_with_comment": comments,
+        "vote_total": payload["vote_total"],
+    }
+
+
+def write_snapshot(survey):
+    """受付終了時に結果を保存する（既にあれば何もしない）"""
+    # defaults に関数を渡すと、まだ保存されていない時だけ集計が実行される
+    snapshot, _ = SurveyResultSnapshot.objects.get_or_create(
+        survey=survey, defaults={"payload": lambda: build_snapshot_payload(survey)}
+    )
+    return snapshot
+
+
+def discard_snapshot(survey):
+    """受付を再開した時などに保存済みの結果を破棄する"""
+    SurveyResultSnapshot.objects.filter(survey=survey).delete()
+
+
+def closed_results(survey):
+    """受付終了したアンケートの結果（スナップショットがなければここで一度だけ作る）"""
+    # SurveyDetailView では select_related("result_snapshot") で一緒に取得している
+    try:
+        snapshot = survey.result_snapshot
+    except SurveyResultSnapshot.DoesNotExist:
+        # 期限(end_at)を過ぎて初めて表示された時にここを通る
+        snapshot = write_snapshot(survey)
+    return results_from_payload(snapshot.payload)
+
+
+def survey_results(survey):
+    """詳細画面用の結果。受付終了ならスナップショット、受付中なら最新の値を返す"""
+    if is_closed(survey):
+        return closed_results(survey)
+    return live_results(survey)
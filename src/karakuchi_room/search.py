@@ -0,0 +1,128 @@
+# アンケート(タイトル・詳細)のキーワード検索
+# title__icontains / description__icontains は LIKE '%...%' になり、インデックスが効かず全件走査になる
+# 日本語は単語の区切り(空白)がないため、文字 n-gram(既定は2文字ずつ)で索引を作って検索する
+#   - MySQL      : InnoDB の FULLTEXT インデックス(WITH PARSER ngram)を MATCH ... AGAINST で使う
+#   - それ以外   : survey_search_grams テーブルに n-gram の転置インデックスを Python で作って使う
+import unicodedata
+
+from django.db import connections
+from django.db.models import BooleanField, Count, Q
+from django.db.models.expressions import RawSQL
+
+# MySQL の ngram_token_size の既定値(2)に合わせる
+NGRAM_SIZE = 2
+
+
+def normalize(text):
+    """全角/半角・大文字/小文字の揺れを吸収する（NFKC 正規化 + 小文字化）"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def split_terms(keyword):
+    """検索ワードを空白(全角スペース含む)で区切る。複数語は AND 検索になる"""
+    return (keyword or "").split()
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """文章を n 文字ずつずらして切り出した集合を返す（空白をまたぐ n-gram は作らない）"""
+    grams = set()
+    for token in normalize(text).split():
+        for i in range(len(token) - n + 1):
+            grams.add(token[i : i + n])
+    return grams
+
+
+def keyword_filter(term):
+    """n-gram では引けない短い語の部分一致条件（入力そのままと正規化後のどちらかで一致）"""
+    q = Q(title__icontains=term) | Q(description__icontains=term)
+    normalized = normalize(term)
+    if normalized != term:
+        q |= Q(title__icontains=normalized) | Q(description__icontains=normalized)
+    return q
+
+
+class NgramIndexBackend:
+    """survey_search_grams テーブルを転置インデックスとして使う検索（SQLite/テスト用）"""
+
+    def index(self, survey):
+        from .models import SurveySearchGram
+
+        # 論理削除済みのアンケートは索引から外す
+        SurveySearchGram.objects.filter(survey_id=survey.pk).delete()
+        if survey.is_deleted:
+            return
+        grams = ngrams(survey.title) | ngrams(survey.description)
+        SurveySearchGram.objects.bulk_create(
+            [SurveySearchGram(survey_id=survey.pk, gram=gram) for gram in grams]
+        )
+
+    def remove(self, survey_ids):
+        from .models import SurveySearchGram
+
+        SurveySearchGram.objects.filter(survey_id__in=survey_ids).delete()
+
+    def filter(self, queryset, keyword):
+        from .models import SurveySearchGram
+
+        for term in split_terms(keyword):
+            grams = ngrams(term)
+            if not grams:
+                # 1文字の語は n-gram で引けないので部分一致で探す
+                queryset = queryset.filter(keyword_filter(term))
+                continue
+
+            # 検索語の n-gram を「全て」持っているアンケートに絞る（サブクエリ1本）
+            # 索引は正規化済みなので、全角/半角・大文字/小文字の違いはここで吸収される。
+            # LIKE で確かめ直すと正規化前の文章と比べることになるので、確かめ直さない
+            # （n-gram の並び順までは見ないので、まれに語順の違うものも一致する）
+            matched = (
+                SurveySearchGram.objects.filter(gram__in=grams)
+                .values("survey_id")
+                .annotate(hits=Count("gram", distinct=True))
+                .filter(hits=len(grams))
+                .values("survey_id")
+            )
+            queryset = queryset.filter(id__in=matched)
+        return queryset
+
+
+class MySQLFulltextBackend:
+    """MySQL の FULLTEXT ngram インデックスを使う検索"""
+
+    def index(self, survey):
+        # InnoDB の FULLTEXT インデックスは INSERT/UPDATE で自動的に更新される
+        pass
+
+    def remove(self, survey_ids):
+        pass
+
+    def filter(self, queryset, keyword):
+        table = queryset.model._meta.db_table
+        for term in split_terms(keyword):
+            if len(term) < NGRAM_SIZE:
+                # ngram_token_size より短い語は FULLTEXT では引けないため部分一致で探す
+                queryset = queryset.filter(keyword_filter(term))
+                continue
+            # ダブルクォートで囲むとフレーズ検索（n-gram が連続して並ぶものだけ一致）になる
+            phrase = '"{}"'.format(term.replace('"', " "))
+            queryset = queryset.filter(
+                RawSQL(
+                    f"MATCH ({table}.title, {table}.description)"
+                    " AGAINST (%s IN BOOLEAN MODE)",
+                    [phrase],
+                    output_field=BooleanField(),
+                )
+            )
+        return queryset
+
+
+def get_search_backend(using="default"):
+    """DB の種類に応じて検索バックエンドを返す"""
+    if connections[using].vendor == "mysql":
+        return MySQLFulltextBackend()
+    return NgramIndexBackend()
+
+
+def search_surveys(queryset, keyword):
+    """アンケートの QuerySet をキーワードで絞り込む"""
+    return get_search_backend(queryset.db).filter(queryset, keyword)
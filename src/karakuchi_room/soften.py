@@ -0,0 +1,151 @@
+# コメントを柔らかい表現に書き換える処理（AI）
+#   soften_text   : 書き換え後の文章をまとめて返す（従来の JSON API 用）
+#   stream_soften : 生成された文字を届いた順に返す（ストリーミング API 用）
+# ボタンの連打などで同じ文章が何度も送られるので、
+#   - 書き換え結果はプロセス内の LRU キャッシュに保存して使い回す
+#   - 同じ文章の書き換えが実行中なら、新たに AI を呼ばずにその結果を待つ
+import hashlib
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .ai_client import get_client
+from .caching import LRUCache, SingleFlight
+from .verdict_cache import normalize_comment
+
+SOFTEN_MODEL = "gpt-4o-mini"
+
+SOFTEN_PROMPT = """
+以下のルールに従って、入力された文章のみを柔らかく書き換えてください。
+・回答文は書かないこと（「こんな感じで書き換えました！」などのコメント不要）
+・書き換え後の文章だけを出力すること
+・文章の意味や主張は変えないこと（内容を追加したり削除したりしない）
+・“柔らかくする” とは表現を少し優しくする程度にとどめること
+・絵文字を入れること
+・丁寧になりすぎて元の意図が失われるような完全書き換えは禁止
+・攻撃的・失礼な要素があればすべて取り除くこと
+・ネガティブな意見は相手が受け止めやすいように表現を書き換えてください。
+
+元の文章：
+{text}
+"""
+
+
+# プロンプトのバージョン（キャッシュのキーに含める。プロンプトを変えると自動で変わる）
+SOFTEN_PROMPT_VERSION = "1:{}:{}".format(
+    SOFTEN_MODEL, hashlib.sha256(SOFTEN_PROMPT.encode("utf-8")).hexdigest()[:8]
+)
+
+_cache = None
+_flight = SingleFlight()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = LRUCache(
+            maxsize=getattr(settings, "SOFTEN_CACHE_SIZE", 512),
+            ttl=getattr(settings, "SOFTEN_CACHE_TTL", 60 * 60),
+        )
+    return _cache
+
+
+def cache_key(text):
+    raw = f"{SOFTEN_PROMPT_VERSION}\n{normalize_comment(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached(key):
+    soft_text = _get_cache().get(key)
+    metrics.incr("soften.cache.hit" if soft_text is not None else "soften.cache.miss")
+    return soft_text
+
+
+def _messages(text):
+    return [{"role": "user", "content": SOFTEN_PROMPT.format(text=text)}]
+
+
+def _complete(text):
+    response = get_client().chat.completions.create(
+        model=SOFTEN_MODEL,
+        messages=_messages(text),
+    )
+    return response.choices[0].message.content
+
+
+def soften_text(text):
+    """書き換え後の文章を返す"""
+    key = cache_key(text)
+    soft_text = get_cached(key)
+    if soft_text is not None:
+        return soft_text
+
+    def complete():
+        soft_text = _complete(text)
+        _get_cache().set(key, soft_text)
+        return soft_text
+
+    return _flight.do(key, complete)
+
+
+def stream_soften(text):
+    """書き換え後の文章を、生成された分から順に返すジェネレーター"""
+    key = cache_key(text)
+    soft_text = get_cached(key)
+    if soft_text is not None:
+        # 書き換え済みの文章はまとめて返す
+        yield soft_text
+        return
+
+    call, leader = _flight.begin(key)
+    if not leader:
+        # 同じ文章を書き換え中なので、その結果をまとめて返す
+        metrics.incr("soften.coalesced")
+        yield call.result()
+        return
+
+    parts = []
+    try:
+        for delta in _stream_completion(text):
+            parts.append(delta)
+            yield delta
+    except BaseException:
+        # ブラウザの切断(GeneratorExit)も含め、待っている側には失敗として伝える
+        _flight.finish(key, call, error=RuntimeError("soften stream aborted"))
+        raise
+
+    soft_text = "".join(parts)
+    _get_cache().set(key, soft_text)
+    _flight.finish(key, call, value=soft_text)
+
+
+def _stream_completion(text):
+    """AI の生成結果を届いた順に返す"""
+    started = time.monotonic()
+    stream = get_client().chat.completions.create(
+        model=SOFTEN_MODEL,
+        messages=_messages(text),
+        stream=True,
+    )
+
+    first = True
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first:
+                # 最初の文字が届くまでの時間(TTFT)
+                metrics.observe(
+                    "soften.ttft_ms", int((time.monotonic() - started) * 1000)
+                )
+                first = False
+            yield delta
+    finally:
+        # 途中でブラウザが切断しても接続を残さない
+        stream.close()
+
+    metrics.observe("soften.total_ms", int((time.monotonic() - started) * 1000))
@@ -0,0 +1,66 @@
+# アンケートに付けるタグ（中間テーブル TagSurvey）の保存・取得処理
+# タグを付け直す時は、今付いているタグと選択されたタグの差分だけを反映する
+# （タグの数に関係なく、SELECT 1本 + UPDATE 1本 + INSERT 1本で済む）
+from django.db.models import Case, Value, When
+from django.utils.timezone import now
+
+from .models import Tag, TagSurvey
+
+
+def sync_survey_tags(survey, tags):
+    """
+    アンケートのタグを tags（Tag のインスタンスか ID）に揃える。
+      - 選択から外れたタグ → 論理削除
+      - 以前外したタグが再び選ばれた → 論理削除を取り消す
+      - 初めて選ばれたタグ → まとめて作成
+    """
+    desired = {getattr(tag, "pk", tag) for tag in tags}
+
+    active = {}  # tag_id → 有効な TagSurvey の ID
+    deleted = {}  # tag_id → 論理削除済みの TagSurvey の ID
+    to_delete = []
+    for pk, tag_id, is_deleted in TagSurvey.all_objects.filter(
+        survey=survey
+    ).values_list("id", "tag_id", "is_deleted"):
+        if is_deleted:
+            deleted.setdefault(tag_id, pk)
+        elif tag_id in desired and tag_id not in active:
+            active[tag_id] = pk
+        else:
+            # 選択から外れたタグ（同じタグの重複行もここで消す）
+            to_delete.append(pk)
+
+    to_restore = [
+        deleted[tag_id] for tag_id in desired - active.keys() if tag_id in deleted
+    ]
+    to_create = desired - active.keys() - deleted.keys()
+
+    # 論理削除と取り消しを UPDATE 1本で行う
+    if to_delete or to_restore:
+        TagSurvey.all_objects.filter(pk__in=to_delete + to_restore).update(
+            is_deleted=Case(
+                When(pk__in=to_restore, then=Value(False)), default=Value(True)
+            ),
+            updated_at=now(),
+        )
+
+    if to_create:
+        TagSurvey.objects.bulk_create(
+            [TagSurvey(survey=survey, tag_id=tag_id) for tag_id in sorted(to_create)]
+        )
+
+
+def survey_tag_ids(survey):
+    """アンケートに付いているタグの ID（論理削除された紐付け・タグは除く）"""
+    return list(
+        TagSurvey.objects.filter(survey=survey, tag__is_deleted=False)
+        .order_by("tag_id")
+        .values_list("tag_id", flat=True)
+    )
+
+
+def survey_tags(survey):
+    """アンケートに付いているタグ（論理削除された紐付け・タグは除く）"""
+    return Tag.objects.filter(
+        tag_surveys__survey=survey, tag_surveys__is_deleted=False
+    ).order_by("id")
@@ -1,3 +1,825 @@
-# from django.test import TestCase
+import asyncio
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from karakuchi_room import ai_filters, verdict_cache
+from karakuchi_room.ai_client import close_client
+from karakuchi_room.ai_filters import check_remote, check_remote_batch
+from karakuchi_room.ai_filters import is_offensive
+from karakuchi_room.caching import Batcher
+from karakuchi_room.classifier import NgramClassifier
+from karakuchi_room.fake_openai import FakeOpenAIConfig, start_server
+from karakuchi_room.forms import OptionFormSetForDraft
+from karakuchi_room.idempotency import make_key
+from karakuchi_room.models import (
+    IdempotencyKey,
+    ModerationJob,
+    Option,
+    Survey,
+    Tag,
+    TagSurvey,
+    User,
+    Vote,
+)
+from karakuchi_room.moderation import claim_jobs, finish_job, run_jobs
+from karakuchi_room.moderation_backends import reset_backends
+from karakuchi_room.ng_words import find_ng_word
+from karakuchi_room.realtime import ResultsHub, mark_changed
+from karakuchi_room.results import comment_queryset
+from karakuchi_room.search import search_surveys
+from karakuchi_room.soften import soften_text, stream_soften
+from karakuchi_room.views import SurveyListView, VoteCreateView
+from karakuchi_room.votes import (
+    create_vote,
+    record_vote_created,
+    record_vote_option_changed,
+)
+
+
+# アンケート一覧画面のクエリ数（N+1問題の回帰テスト）
+class SurveyListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("テスト", "test@example.com", "pw")
+        cls.other = User.objects.create_user("他人", "other@example.com", "pw")
+        cls.tags = [Tag.objects.create(tag_name=f"タグ{i}") for i in range(3)]
+
+    def create_surveys(self, count):
+        for i in range(count):
+            owner = self.user if i % 2 else self.other
+            survey = Survey.objects.create(
+                user=owner, title=f"アンケート{i}", is_public=True
+            )
+            option = Option.objects.create(survey=survey, label="はい")
+            Option.objects.create(survey=survey, label="いいえ")
+            for tag in self.tags:
+                TagSurvey.objects.create(tag=tag, survey=survey)
+            if i % 3 == 0:
+                Vote.objects.create(user=self.user, survey=survey, option=option)
+
+    def count_list_queries(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("survey-list"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_query_count_does_not_depend_on_number_of_surveys(self):
+        self.create_surveys(2)
+        few = self.count_list_queries()
+
+        self.create_surveys(10)
+        many = self.count_list_queries()
+
+        self.assertEqual(few, many)
+
+    def test_deleted_tags_are_not_rendered(self):
+        self.create_surveys(1)
+        TagSurvey.all_objects.filter(tag=self.tags[0]).soft_delete()
+        Tag.all_objects.filter(pk=self.tags[1].pk).soft_delete()
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("survey-list"))
+
+        badge = '<span class="badge bg-secondary">{}</span>'
+        self.assertNotContains(response, badge.format("タグ0"))
+        self.assertNotContains(response, badge.format("タグ1"))
+        self.assertContains(response, badge.format("タグ2"))
+
+
+# 論理削除の一括カスケード（件数に関係なくクエリ数が一定になること）
+class SoftDeleteCascadeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("作成者", "owner@example.com", "pw")
+        cls.tag = Tag.objects.create(tag_name="タグ")
+
+    def create_survey(self, voters):
+        survey = Survey.objects.create(user=self.owner, title="アンケート")
+        option = Option.objects.create(survey=survey, label="はい")
+        Option.objects.create(survey=survey, label="いいえ")
+        TagSurvey.objects.create(tag=self.tag, survey=survey)
+        for voter in voters:
+            vote = Vote.objects.create(user=voter, survey=survey, option=option)
+            record_vote_created(vote)
+        return survey
+
+    def count_delete_queries(self, survey_count):
+        user = User.objects.create_user(
+            f"削除{survey_count}", f"delete{survey_count}@example.com", "pw"
+        )
+        voters = [
+            User.objects.create_user(
+                f"投票者{survey_count}-{i}", f"v{survey_count}-{i}@example.com", "pw"
+            )
+            for i in range(survey_count)
+        ]
+        for _ in range(survey_count):
+            survey = self.create_survey(voters)
+            survey.user = user
+            survey.save()
+        # 他人のアンケートへの投票
+        self.create_survey([user])
+
+        with CaptureQueriesContext(connection) as ctx:
+            user.delete()
+        return len(ctx), user
+
+    def test_user_delete_query_count_does_not_depend_on_rows(self):
+        few, _ = self.count_delete_queries(1)
+        many, user = self.count_delete_queries(5)
+
+        # 削除する行が増えても1行ずつ UPDATE しない
+        self.assertEqual(few, many)
+        self.assertFalse(Survey.objects.filter(user=user).exists())
+        self.assertFalse(Option.objects.filter(survey__user=user).exists())
+        self.assertFalse(Vote.objects.filter(survey__user=user).exists())
+        self.assertFalse(Vote.objects.filter(user=user).exists())
+
+    def test_survey_delete_soft_deletes_children(self):
+        voter = User.objects.create_user("投票者", "voter@example.com", "pw")
+        survey = self.create_survey([voter])
+
+        survey.delete()
+
+        self.assertTrue(Survey.all_objects.get(pk=survey.pk).is_deleted)
+        self.assertEqual(Option.all_objects.filter(survey=survey).count(), 2)
+        self.assertFalse(Option.objects.filter(survey=survey).exists())
+        self.assertFalse(TagSurvey.objects.filter(survey=survey).exists())
+        self.assertFalse(Vote.objects.filter(survey=survey).exists())
+        # 投票の論理削除に合わせて票数も減る
+        self.assertEqual(Survey.all_objects.get(pk=survey.pk).vote_total, 0)
+        self.assertEqual(
+            sorted(
+                Option.all_objects.filter(survey=survey).values_list(
+                    "vote_count", flat=True
+                )
+            ),
+            [0, 0],
+        )
+        self.assertTrue(User.objects.get(pk=voter.pk))
+
+
+# 下書き編集の選択肢フォームセット（bulk_save の SQL 本数）
+class OptionFormSetBulkSaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("作成者", "owner@example.com", "pw")
+
+    def build_formset(self, labels, changes, deletes, new_labels):
+        survey = Survey.objects.create(user=self.user, title="下書き")
+        options = [
+            Option.objects.create(survey=survey, label=label) for label in labels
+        ]
+
+        data = {
+            "options-TOTAL_FORMS": str(len(options) + len(new_labels)),
+            "options-INITIAL_FORMS": str(len(options)),
+            "options-MIN_NUM_FORMS": "0",
+            "options-MAX_NUM_FORMS": "4",
+        }
+        for i, option in enumerate(options):
+            data[f"options-{i}-id"] = str(option.pk)
+            data[f"options-{i}-survey"] = str(survey.pk)
+            data[f"options-{i}-label"] = changes.get(i, option.label)
+            if i in deletes:
+                data[f"options-{i}-DELETE"] = "on"
+        for j, label in enumerate(new_labels, start=len(options)):
+            data[f"options-{j}-survey"] = str(survey.pk)
+            data[f"options-{j}-label"] = label
+
+        formset = OptionFormSetForDraft(data, instance=survey, prefix="options")
+        self.assertTrue(formset.is_valid(), formset.errors)
+        return survey, formset
+
+    def test_statement_count_does_not_depend_on_number_of_options(self):
+        _, formset = self.build_formset(["A", "B"], {0: "A2"}, {1}, ["C"])
+        few = formset.bulk_save()
+
+        survey, formset = self.build_formset(
+            ["A", "B", "C", "D"], {0: "A2", 1: "B2"}, {2, 3}, ["E", "F"]
+        )
+        many = formset.bulk_save()
+
+        self.assertEqual(few, many)
+        self.assertEqual(
+            list(
+                Option.objects.filter(survey=survey)
+                .order_by("id")
+                .values_list("label", flat=True)
+            ),
+            ["A2", "B2", "E", "F"],
+        )
+        self.assertEqual(Option.all_objects.filter(survey=survey).count(), 6)
+
+    def test_statement_count_excludes_savepoints(self):
+        _, formset = self.build_formset(["A", "B"], {0: "A2"}, {1}, ["C"])
+        with CaptureQueriesContext(connection) as ctx:
+            count = formset.bulk_save()
+
+        statements = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+        ]
+        self.assertEqual(count, len(statements))
+        self.assertLess(count, len(ctx.captured_queries))
+
+
+# 二重投票は DB の一意制約で弾く（事前の exists() なし）
+class VoteCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("投票者", "voter@example.com", "pw")
+        cls.survey = Survey.objects.create(
+            user=cls.user, title="アンケート", is_public=True
+        )
+        cls.option = Option.objects.create(survey=cls.survey, label="はい")
+        Option.objects.create(survey=cls.survey, label="いいえ")
+
+    def test_second_vote_is_rejected_by_constraint(self):
+        self.client.force_login(self.user)
+        url = reverse("vote-create", args=[self.survey.pk])
+        data = {"option": self.option.pk, "comment": ""}
+
+        self.client.post(url, data)
+        response = self.client.post(url, data)
+
+        self.assertRedirects(response, reverse("survey-detail", args=[self.survey.pk]))
+        self.assertEqual(Vote.objects.filter(survey=self.survey).count(), 1)
+        self.assertEqual(Survey.objects.get(pk=self.survey.pk).vote_total, 1)
+
+    def test_vote_can_be_deleted_again_after_revoting(self):
+        # 論理削除された票は一意制約にかからないので、投票→削除を繰り返せる
+        self.client.force_login(self.user)
+        url = reverse("vote-create", args=[self.survey.pk])
+        data = {"option": self.option.pk, "comment": ""}
+
+        for _ in range(2):
+            self.client.post(url, data)
+            vote = Vote.objects.get(user=self.user, survey=self.survey)
+            self.client.post(reverse("vote-delete", args=[vote.pk]))
+
+        self.assertFalse(Vote.objects.filter(survey=self.survey).exists())
+        self.assertEqual(Vote.all_objects.filter(survey=self.survey).count(), 2)
+        self.assertEqual(Survey.objects.get(pk=self.survey.pk).vote_total, 0)
+
+    def test_replayed_post_does_not_wait_for_first_one(self):
+        # 最初の POST がまだ処理中なら、待たずに「処理中」と返す（スレッドを塞がない）
+        self.client.force_login(self.user)
+        url = reverse("vote-create", args=[self.survey.pk])
+        IdempotencyKey.objects.create(
+            key=make_key(VoteCreateView.idempotency_scope, self.user, "token"),
+            expires_at=now() + timedelta(minutes=10),
+        )
+
+        with mock.patch("karakuchi_room.idempotency.time.sleep") as sleep:
+            response = self.client.post(
+                url,
+                {"option": self.option.pk, "comment": "", "idempotency_key": "token"},
+            )
+
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        sleep.assert_not_called()
+        self.assertFalse(Vote.objects.filter(survey=self.survey).exists())
+
+    def test_saving_stale_instances_keeps_vote_counters(self):
+        # 編集画面で読み込んだ後に投票されても、編集の保存で票数を古い値に戻さない
+        survey = Survey.objects.get(pk=self.survey.pk)
+        option = Option.objects.get(pk=self.option.pk)
+        with transaction.atomic():
+            create_vote(Vote(user=self.user, survey=self.survey, option=self.option))
+
+        survey.title = "タイトルを変更"
+        survey.save()
+        option.label = "はい（変更）"
+        option.save()
+
+        survey.refresh_from_db()
+        option.refresh_from_db()
+        self.assertEqual(survey.title, "タイトルを変更")
+        self.assertEqual(survey.vote_total, 1)
+        self.assertEqual(survey.results_version, 1)
+        self.assertEqual(option.vote_count, 1)
+
+
+# NGワード辞書（カタカナ・半角の表記ゆれと、普通の言葉の誤検出）
+class NgWordTests(TestCase):
+    def test_variants_are_detected(self):
+        for text in ["バカじゃないの", "ﾊﾞｶ", "シネ", "お前なんか死ね"]:
+            with self.subTest(text=text):
+                self.assertIsNotNone(find_ng_word(text))
+
+    def test_common_words_are_not_detected(self):
+        for text in [
+            "シネマが好き",
+            "駅前のシネコンで観た",
+            "夏のバカンス",
+            "アホウドリの写真",
+            "始めたばかりです",
+        ]:
+            with self.subTest(text=text):
+                self.assertIsNone(find_ng_word(text))
+
+    def test_ng_word_outside_allowed_word_is_detected(self):
+        self.assertEqual(find_ng_word("シネマを観たけど、しね"), "しね")
+
+
+# キーワード検索（索引と同じ正規化で、全角/半角・大文字/小文字の違いを吸収する）
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("テスト", "test@example.com", "pw")
+        cls.wide = Survey.objects.create(user=cls.user, title="ＡＢＣ定食の感想")
+        cls.other = Survey.objects.create(user=cls.user, title="カレーの感想")
+
+    def search(self, keyword):
+        return set(search_surveys(Survey.objects.all(), keyword))
+
+    def test_full_width_title_is_found_by_half_width_keyword(self):
+        self.assertEqual(self.search("abc定食"), {self.wide})
+        self.assertEqual(self.search("ABC"), {self.wide})
+
+    def test_only_matching_surveys_are_found(self):
+        self.assertEqual(self.search("感想"), {self.wide, self.other})
+        self.assertEqual(self.search("ＡＢＣ　カレー"), set())
+
+    def test_search_is_one_query(self):
+        # 一致したアンケートの ID を Python に読み出さず、サブクエリで絞る
+        with self.assertNumQueries(1):
+            self.search("定食 感想")
+
+
+# 一覧・詳細画面のクエリがインデックスを使っているか（EXPLAIN でフルスキャンを検出する）
+class HotQueryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("テスト", "test@example.com", "pw")
+        cls.tag = Tag.objects.create(tag_name="タグ")
+        cls.survey = Survey.objects.create(
+            user=cls.user, title="アンケート", is_public=True
+        )
+        option = Option.objects.create(survey=cls.survey, label="はい")
+        TagSurvey.objects.create(tag=cls.tag, survey=cls.survey)
+        Vote.objects.create(user=cls.user, survey=cls.survey, option=option)
+
+    def full_scans(self, queryset):
+        """EXPLAIN の結果からフルスキャンしている行を返す"""
+        if connection.vendor == "mysql":
+            plan = queryset.explain(format="json")
+            return ['access_type "ALL"'] if '"access_type": "ALL"' in plan else []
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN の確認は MySQL と SQLite のみ")
+
+        lines = queryset.explain().splitlines()
+        # ORDER BY の順に読んで LIMIT 件で止まる走査（一覧の1ページ目の id 降順）はフルスキャンではない
+        ordered_limit = queryset.query.high_mark is not None and not any(
+            "TEMP B-TREE FOR ORDER BY" in line for line in lines
+        )
+        return [
+            line
+            for line in lines
+            if " SCAN " in f" {line.split(maxsplit=3)[-1]}"
+            and " INDEX " not in line
+            and not ordered_limit
+        ]
+
+    def list_queryset(self, **params):
+        view = SurveyListView()
+        view.request = RequestFactory().get(reverse("survey-list"), params)
+        view.request.user = self.user
+        view.kwargs = {}
+        # keyset_paginate と同じ形（id の降順で1ページ + 1件）
+        return view.get_queryset().order_by("-id")[:21]
+
+    def test_list_queries_use_indexes(self):
+        for params in [{}, {"open_only": "1"}, {"own_only": "1"}, {"tag": self.tag.pk}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.full_scans(self.list_queryset(**params)), [])
+
+    def test_detail_queries_use_indexes(self):
+        queries = {
+            "user_vote": Vote.objects.filter(
+                survey=self.survey, user=self.user, is_deleted=False
+            )[:1],
+            "comments": comment_queryset(self.survey),
+            "options": Option.objects.filter(survey=self.survey, is_deleted=False)
+            .order_by("id")
+            .values("id", "label", "vote_count"),
+        }
+        for name, queryset in queries.items():
+            with self.subTest(query=name):
+                self.assertEqual(self.full_scans(queryset), [])
+
+
+# 投票編集: コメントを変えていなければ審査(OpenAI)をやり直さない
+class VoteModerationReuseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("投票者", "voter@example.com", "pw")
+        cls.survey = Survey.objects.create(
+            user=cls.user, title="アンケート", is_public=True
+        )
+        cls.yes = Option.objects.create(survey=cls.survey, label="はい")
+        cls.no = Option.objects.create(survey=cls.survey, label="いいえ")
+
+    def setUp(self):
+        verdict_cache.clear_memory()
+        self.client.force_login(self.user)
+        patcher = mock.patch(
+            "karakuchi_room.ai_filters.check_remote", return_value=False
+        )
+        self.check_remote = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client.post(
+            reverse("vote-create", args=[self.survey.pk]),
+            {"option": self.yes.pk, "comment": "良いと思います"},
+        )
+        self.vote = Vote.objects.get(user=self.user, survey=self.survey)
+        self.check_remote.reset_mock()
+
+    def edit(self, option, comment):
+        self.client.post(
+            reverse("vote-edit", args=[self.vote.pk]),
+            {"option": option.pk, "comment": comment},
+        )
+        return Vote.objects.get(pk=self.vote.pk)
+
+    def test_verdict_is_stored_on_vote(self):
+        self.assertIs(self.vote.moderation_flagged, False)
+        self.assertEqual(
+            self.vote.moderation_hash, verdict_cache.content_hash("良いと思います")
+        )
+        self.assertIsNotNone(self.vote.moderated_at)
+
+    def test_option_only_edit_skips_moderation(self):
+        with mock.patch("karakuchi_room.forms.is_offensive") as is_offensive:
+            # 前後の空白の違いは同じコメントとして扱う
+            vote = self.edit(self.no, " 良いと思います ")
+        is_offensive.assert_not_called()
+        self.assertEqual(vote.option_id, self.no.pk)
+
+    def test_comment_or_policy_change_runs_moderation(self):
+        self.edit(self.yes, "とても良いと思います")
+        self.check_remote.assert_called_once()
+
+        with (
+            mock.patch("karakuchi_room.moderation.MODERATION_POLICY_VERSION", "2"),
+            mock.patch(
+                "karakuchi_room.forms.is_offensive", return_value=False
+            ) as is_offensive,
+        ):
+            vote = self.edit(self.no, "とても良いと思います")
+        is_offensive.assert_called_once()
+        self.assertEqual(vote.moderation_policy, "2")
+
+
+# バックグラウンドでのコメント審査（審査中にコメントが編集された時）
+@override_settings(COMMENT_MODERATION_MODE="deferred")
+class DeferredModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("投票者", "voter@example.com", "pw")
+        cls.survey = Survey.objects.create(
+            user=cls.user, title="アンケート", is_public=True
+        )
+        cls.yes = Option.objects.create(survey=cls.survey, label="はい")
+
+    def setUp(self):
+        verdict_cache.clear_memory()
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(
+                reverse("vote-create", args=[self.survey.pk]),
+                {"option": self.yes.pk, "comment": "良いと思います"},
+            )
+        self.vote_writes = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if query["sql"].startswith(('INSERT INTO "votes"', 'UPDATE "votes"'))
+        ]
+        self.vote = Vote.objects.get(user=self.user, survey=self.survey)
+
+    def test_vote_is_saved_as_pending_in_one_write(self):
+        self.assertEqual(self.vote.moderation_status, Vote.MODERATION_PENDING)
+        self.assertEqual(len(self.vote_writes), 1)
+        self.assertTrue(self.vote_writes[0].startswith("INSERT"))
+
+    def edit_comment(self, comment):
+        self.client.post(
+            reverse("vote-edit", args=[self.vote.pk]),
+            {"option": self.yes.pk, "comment": comment},
+        )
+
+    def test_verdict_for_old_comment_is_not_applied_to_edited_comment(self):
+        self.assertEqual(self.vote.moderation_status, Vote.MODERATION_PENDING)
+        (job,) = claim_jobs(10)
+        # OpenAI の応答を待っている間にコメントが編集された
+        self.edit_comment("やっぱり悪いと思います")
+        finish_job(job, self.vote, False)
+
+        vote = Vote.objects.get(pk=self.vote.pk)
+        self.assertEqual(vote.moderation_status, Vote.MODERATION_PENDING)
+        self.assertIsNone(vote.moderated_at)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ModerationJob.STATUS_DONE)
+        # 新しいコメントのジョブは残っている
+        self.assertEqual(len(claim_jobs(10)), 1)
+
+    def test_previous_verdict_is_not_reused_for_edited_comment(self):
+        def edited_while_checking(vote, comment):
+            # 審査済みか確かめた直後にコメントが編集された
+            Vote.objects.filter(pk=vote.pk).update(
+                comment="やっぱり悪いと思います",
+                moderation_status=Vote.MODERATION_PENDING,
+            )
+            return False
+
+        with mock.patch(
+            "karakuchi_room.moderation.needs_moderation",
+            side_effect=edited_while_checking,
+        ):
+            run_jobs(claim_jobs(10))
+
+        vote = Vote.objects.get(pk=self.vote.pk)
+        self.assertEqual(vote.moderation_status, Vote.MODERATION_PENDING)
+        self.assertIsNone(vote.moderated_at)
+
+
+# 誹謗中傷チェックの判定方法（ローカルの分類器で判定できれば OpenAI を呼ばない）
+class ModerationBackendTests(TestCase):
+    SAMPLES = [
+        ("お前は本当に無能だ", True),
+        ("無能すぎて話にならない", True),
+        ("こんなの作るやつは無能", True),
+        ("良いと思います", False),
+        ("とても良いアンケートだと思います", False),
+        ("改善の余地があると思います", False),
+    ]
+
+    def setUp(self):
+        verdict_cache.clear_memory()
+        reset_backends()
+        self.addCleanup(reset_backends)
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.model_file = Path(tmpdir.name) / "classifier.json"
+        NgramClassifier().train(self.SAMPLES).save(self.model_file)
+
+        patcher = mock.patch(
+            "karakuchi_room.ai_filters.check_remote", return_value=False
+        )
+        self.check_remote = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_confident_local_verdict_skips_openai(self):
+        with override_settings(
+            MODERATION_CLASSIFIER_FILE=str(self.model_file),
+            MODERATION_CLASSIFIER_CONFIDENCE=0.9,
+        ):
+            self.assertTrue(is_offensive("あなたは無能だ"))
+            self.assertFalse(is_offensive("良いアンケートだと思います"))
+            self.check_remote.assert_not_called()
+
+            # 学習データに似ていないコメントは OpenAI に問い合わせる
+            self.assertFalse(is_offensive("明日は晴れるらしい"))
+            self.check_remote.assert_called_once()
+
+    def test_offline_backends_never_call_openai(self):
+        with override_settings(
+            MODERATION_BACKENDS=[
+                "karakuchi_room.moderation_backends.DictionaryBackend",
+                "karakuchi_room.moderation_backends.ClassifierBackend",
+            ],
+            MODERATION_CLASSIFIER_FILE=str(self.model_file),
+        ):
+            self.assertTrue(is_offensive("ばか"))
+            self.assertFalse(is_offensive("明日は晴れるらしい"))
+        self.check_remote.assert_not_called()
+
+
+# OpenAI の代わりのサーバー（負荷試験用）に、実際のクライアントで繋がるか
+class FakeOpenAIServerTests(TestCase):
+    def setUp(self):
+        server = start_server(config=FakeOpenAIConfig(ng_words=["無能"], seed=0))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        close_client()
+        self.addCleanup(close_client)
+        settings_override = override_settings(OPENAI_BASE_URL=server.base_url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_moderation_and_chat_endpoints(self):
+        self.assertTrue(check_remote("お前は無能だ"))
+        self.assertFalse(check_remote("良いと思います"))
+
+    def test_losing_request_is_cancelled(self):
+        # Moderation API が先に NG と返したら、応答を待っている ChatGPT の呼び出しは取り消す
+        cancelled = threading.Event()
+
+        async def slow_chat(text, timeout):
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with mock.patch.object(ai_filters, "chat_flagged_async", slow_chat):
+            started = time.monotonic()
+            self.assertTrue(ai_filters.check_concurrent("お前は無能だ", 10))
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(cancelled.wait(5))
+
+    def test_soften_with_and_without_streaming(self):
+        self.assertIn("ありがとう", soften_text("ありがとう"))
+        self.assertIn("また来ます", "".join(stream_soften("また来ます")))
+
+
+# 誹謗中傷チェックをまとめて問い合わせる
+class BatchModerationTests(TestCase):
+    def setUp(self):
+        server = start_server(config=FakeOpenAIConfig(ng_words=["無能"], seed=0))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        close_client()
+        self.addCleanup(close_client)
+        settings_override = override_settings(
+            OPENAI_BASE_URL=server.base_url,
+            MODERATION_BATCH_SIZE=20,
+            MODERATION_BATCH_CHAT_SIZE=10,
+            MODERATION_BATCH_CHAT_MAX_CHARS=50,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_batch_returns_verdict_per_comment_in_few_calls(self):
+        texts = [f"良い質問{i}です" for i in range(12)]
+        texts[3] = "お前は無能だ"
+        texts.append("長いコメント" * 10 + "無能")
+
+        with (
+            mock.patch.object(
+                ai_filters,
+                "moderation_flagged_batch",
+                wraps=ai_filters.moderation_flagged_batch,
+            ) as moderation,
+            mock.patch.object(
+                ai_filters, "chat_flagged_batch", wraps=ai_filters.chat_flagged_batch
+            ) as chat,
+        ):
+            flagged = check_remote_batch(texts)
+
+        self.assertEqual(flagged, [i in (3, 12) for i in range(13)])
+        # Moderation API は1回、ChatGPT は短いコメント12件を10件ずつの2回
+        self.assertEqual(moderation.call_count, 1)
+        self.assertEqual(chat.call_count, 2)
+
+    def test_batcher_collects_concurrent_submissions(self):
+        batches = []
+
+        def func(values):
+            batches.append(values)
+            return [value * 2 for value in values]
+
+        batcher = Batcher(func, batch_size=3, max_wait=5)
+        futures = [batcher.submit(i) for i in range(3)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 2, 4])
+        # 3件集まった時点で、待たずにまとめて処理される
+        self.assertEqual(batches, [[0, 1, 2]])
+
+
+# 詳細画面の票数のリアルタイム更新（見ている人数に関係なく集計は1回）
+class RealtimeResultsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("作成者", "owner@example.com", "pw")
+        cls.voter = User.objects.create_user("投票者", "voter@example.com", "pw")
+        cls.survey = Survey.objects.create(
+            user=cls.owner, title="アンケート", is_public=True
+        )
+        cls.yes = Option.objects.create(survey=cls.survey, label="はい")
+        cls.no = Option.objects.create(survey=cls.survey, label="いいえ")
+
+    def setUp(self):
+        # ポーリングのスレッドは動かさず、poll() を直接呼ぶ
+        patcher = mock.patch.object(ResultsHub, "_run")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.hub = ResultsHub()
+
+    def test_votes_are_published_once_to_every_subscriber(self):
+        first = self.hub.subscribe(self.survey.pk)
+        # 2人目以降は、既に読んだ票数を使う
+        with self.assertNumQueries(0):
+            second = self.hub.subscribe(self.survey.pk)
+        initial = first.get_nowait()
+        self.assertEqual(initial["counts"], {self.yes.pk: 0, self.no.pk: 0})
+        self.assertEqual(second.get_nowait(), initial)
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            vote = create_vote(
+                Vote(user=self.voter, survey=self.survey, option=self.yes)
+            )
+        # バージョン確認1本 + 集計2本（見ている人数に関係なく1回）
+        with self.assertNumQueries(3):
+            self.hub.poll()
+        for queue in (first, second):
+            event = queue.get_nowait()
+            self.assertEqual(event["vote_total"], 1)
+            self.assertEqual(event["changed"], {self.yes.pk: 1})
+
+        vote.option = self.no
+        vote.save()
+        record_vote_option_changed(self.survey.pk, self.yes.pk, self.no.pk)
+        self.hub.poll()
+        self.assertEqual(
+            first.get_nowait()["changed"], {self.yes.pk: -1, self.no.pk: 1}
+        )
+
+        vote.delete()
+        self.hub.poll()
+        event = first.get_nowait()
+        self.assertEqual(event["vote_total"], 0)
+        self.assertEqual(event["counts"], {self.yes.pk: 0, self.no.pk: 0})
+
+        # 変わっていなければ何も送らない
+        self.hub.poll()
+        self.assertTrue(first.empty())
+
+    def test_stream_sends_current_results(self):
+        self.client.force_login(self.voter)
+        with (
+            mock.patch("karakuchi_room.views.hub", self.hub),
+            override_settings(
+                RESULTS_STREAM_MAX_SECONDS=0.1, RESULTS_STREAM_KEEPALIVE=0.05
+            ),
+        ):
+            response = self.client.get(
+                reverse("survey-results-stream", kwargs={"pk": self.survey.pk})
+            )
+            body = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        self.assertIn("event: results\nid: 0\n", body)
+        # 接続が終わったら配信先から外れる
+        self.assertEqual(self.hub.subscriber_count(), 0)
+
+    def test_stream_is_refused_past_the_limit_and_poll_is_used(self):
+        self.client.force_login(self.voter)
+        self.hub.subscribe(self.survey.pk)
+        with (
+            mock.patch("karakuchi_room.views.hub", self.hub),
+            override_settings(RESULTS_STREAM_MAX_CONNECTIONS=1),
+        ):
+            response = self.client.get(
+                reverse("survey-results-stream", kwargs={"pk": self.survey.pk})
+            )
+        # 204 を受け取った EventSource は繋ぎ直さず、ポーリングに切り替える
+        self.assertEqual(response.status_code, 204)
+
+        url = reverse("survey-results-poll", kwargs={"pk": self.survey.pk})
+        response = self.client.get(url, {"version": 0})
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(url, {"version": -1})
+        self.assertEqual(
+            response.json()["counts"], {str(self.yes.pk): 0, str(self.no.pk): 0}
+        )
+
+    def test_stream_stops_when_survey_is_closed(self):
+        queue = self.hub.subscribe(self.survey.pk)
+        queue.get_nowait()
+        Survey.all_objects.filter(pk=self.survey.pk).update(is_open=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_changed(self.survey.pk)
+        self.hub.poll()
+        self.assertTrue(queue.get_nowait()["closed"])
+
+    def test_lower_version_is_resynced_not_dropped(self):
+        queue = self.hub.subscribe(self.survey.pk)
+        queue.get_nowait()
+        Survey.all_objects.filter(pk=self.survey.pk).update(results_version=5)
+        self.hub.poll()
+        self.assertFalse(queue.get_nowait()["resync"])
+
+        # ロールバックやカウンターの作り直しでバージョンが戻っても、表示し直させる
+        Survey.all_objects.filter(pk=self.survey.pk).update(results_version=2)
+        self.hub.poll()
+        event = queue.get_nowait()
+        self.assertEqual(event["version"], 2)
+        self.assertTrue(event["resync"])
@@ -1,7 +1,15 @@
 from django.urls import path
 
 from django.contrib.auth.views import LogoutView
-from .views import survey_delete, vote_delete, soften_comment
+from .views import (
+    survey_delete,
+    vote_delete,
+    soften_comment,
+    soften_comment_stream,
+    survey_results_stream,
+    survey_results_poll,
+    metrics_view,
+)
 
 from karakuchi_room.views import MyLoginView, SignUpView
 
@@ -32,6 +40,18 @@ urlpatterns = [
     path("surveys/create/", SurveyCreateView.as_view(), name="survey-create"),
     # アンケート詳細
     path("surveys/detail/<int:pk>", SurveyDetailView.as_view(), name="survey-detail"),
+    # アンケートの票数のリアルタイム更新（Server-Sent Events）
+    path(
+        "surveys/<int:pk>/results/stream/",
+        survey_results_stream,
+        name="survey-results-stream",
+    ),
+    # アンケートの票数（リアルタイム更新を使えない時の定期取得）
+    path(
+        "surveys/<int:pk>/results/",
+        survey_results_poll,
+        name="survey-results-poll",
+    ),
     # アンケート削除
     path("surveys/delete/<int:pk>", survey_delete, name="survey-delete"),
     # アンケート編集(一時保存)
@@ -64,4 +84,12 @@ urlpatterns = [
     path("users/edit/<uuid:pk>", UserUpdateView.as_view(), name="user-edit"),
     # コメント生成AI機能
     path("api/comment/soften/", soften_comment, name="soften-comment"),
+    # コメント生成AI機能（ストリーミング版）
+    path(
+        "api/comment/soften/stream/",
+        soften_comment_stream,
+        name="soften-comment-stream",
+    ),
+    # メトリクス（管理者のみ）
+    path("api/metrics/", metrics_view, name="metrics"),
 ]
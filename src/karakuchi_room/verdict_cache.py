@@ -0,0 +1,128 @@
+# 誹謗中傷チェック(OpenAI)の判定結果キャッシュ
+# フォームエラー後の再送信や「良いと思います」のような同じ短いコメントで、
+# 毎回 OpenAI に問い合わせないようにする
+#   1段目: プロセス内の LRU キャッシュ（ネットワークもDBも使わない）
+#   2段目: moderation_verdicts テーブル（ワーカー間・再起動後も共有）
+# キーは「正規化したコメント」と「判定ポリシーのバージョン(モデル名・プロンプト)」のハッシュ
+import hashlib
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.timezone import now
+
+from . import metrics
+from .caching import LRUCache
+from .models import ModerationVerdict
+
+_memory = None
+_writes = 0
+
+
+def normalize_comment(text):
+    """NFKC 正規化し、前後の空白を除いて連続する空白を1つにまとめる"""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+def content_hash(text):
+    """正規化したコメントのハッシュ（審査したコメントから変わったかの判定用）"""
+    return hashlib.sha256(normalize_comment(text).encode("utf-8")).hexdigest()
+
+
+def cache_key(text, policy_version):
+    """判定ポリシーが変わったら別のキーになるようにバージョンも含める"""
+    raw = f"{policy_version}\n{normalize_comment(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _ttl():
+    # 有効期限（秒）。既定は7日
+    return getattr(settings, "MODERATION_CACHE_TTL", 60 * 60 * 24 * 7)
+
+
+def _memory_cache():
+    global _memory
+    if _memory is None:
+        _memory = LRUCache(
+            maxsize=getattr(settings, "MODERATION_CACHE_MEMORY_SIZE", 1024),
+            ttl=_ttl(),
+        )
+    return _memory
+
+
+def get_verdict(text, policy_version):
+    """キャッシュ済みの判定(True=NG / False=OK)を返す。なければ None"""
+    key = cache_key(text, policy_version)
+
+    verdict = _memory_cache().get(key)
+    if verdict is not None:
+        metrics.incr("moderation.cache.memory_hit")
+        return verdict
+
+    verdict = (
+        ModerationVerdict.objects.filter(key=key, expires_at__gt=now())
+        .values_list("flagged", flat=True)
+        .first()
+    )
+    if verdict is not None:
+        metrics.incr("moderation.cache.db_hit")
+        _memory_cache().set(key, verdict)
+        return verdict
+
+    metrics.incr("moderation.cache.miss")
+    return None
+
+
+def set_verdict(text, policy_version, flagged):
+    """判定結果を両方のキャッシュに保存する"""
+    global _writes
+    key = cache_key(text, policy_version)
+    _memory_cache().set(key, flagged)
+    ModerationVerdict.objects.update_or_create(
+        key=key,
+        defaults={
+            "flagged": flagged,
+            "policy_version": policy_version,
+            "text": normalize_comment(text),
+            "expires_at": now() + timedelta(seconds=_ttl()),
+        },
+    )
+
+    # 書き込みのたびに掃除すると重いので、一定回数ごとにまとめて行う
+    _writes += 1
+    if _writes % getattr(settings, "MODERATION_CACHE_PRUNE_EVERY", 100) == 0:
+        prune()
+
+
+def prune():
+    """期限切れの行を消し、上限件数を超えた分は古いものから消す。消した件数を返す"""
+    deleted, _ = ModerationVerdict.objects.filter(expires_at__lte=now()).delete()
+
+    max_rows = getattr(settings, "MODERATION_CACHE_MAX_ROWS", 100_000)
+    # 新しい順に max_rows 件目より古いものを消す
+    cutoff = list(
+        ModerationVerdict.objects.order_by("-updated_at").values_list(
+            "updated_at", flat=True
+        )[max_rows : max_rows + 1]
+    )
+    if cutoff:
+        evicted, _ = ModerationVerdict.objects.filter(
+            updated_at__lte=cutoff[0]
+        ).delete()
+        deleted += evicted
+
+    metrics.incr("moderation.cache.evicted", deleted)
+    return deleted
+
+
+def clear_memory():
+    """プロセス内キャッシュを空にする（テスト用）"""
+    _memory_cache().clear()
+
+
+@metrics.gauge("moderation.cache.hit_rate")
+def hit_rate():
+    hits = metrics.get("moderation.cache.memory_hit") + metrics.get(
+        "moderation.cache.db_hit"
+    )
+    return metrics.ratio(hits, hits + metrics.get("moderation.cache.miss"))
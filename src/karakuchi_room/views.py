@@ -29,6 +29,27 @@ from .models import Tag, TagSurvey
 
 # タグを表示、選択するためにmodels.pyから中間テーブルとそれに紐づいているテーブルをインポート
 
+# アンケート一覧をキーセット方式(OFFSETなし)でページ分割するためのヘルパー
+from .pagination import get_page_size, keyset_paginate, parse_cursor
+from . import metrics
+from .idempotency import IdempotentFormMixin
+from .realtime import hub, load_results, make_event, mark_changed
+from .moderation import (
+    enqueue_comment_moderation,
+    is_deferred,
+    mark_pending,
+    needs_moderation,
+)
+from .results import discard_snapshot, is_closed, survey_results, write_snapshot
+from .search import search_surveys
+from .tags import survey_tags, sync_survey_tags
+from .soften import soften_text, stream_soften
+from .votes import (
+    AlreadyVoted,
+    create_vote,
+    record_vote_option_changed,
+)
+
 # from django.shortcuts import render
 from django.shortcuts import get_object_or_404, redirect
 
@@ -45,24 +66,34 @@ from .forms import (
     UserFormPublished,
 )
 from django.utils import timezone
-from django.db import transaction
-from karakuchi_room.models import User, Survey, Vote, Option
+from django.db import connection, transaction
+from karakuchi_room.models import User, Survey, Vote
 from django.contrib.auth import get_user_model, update_session_auth_hash
 from django.contrib import messages
 import logging
-import os
 import json
-from openai import OpenAI
-from django.http import JsonResponse
+import time
+from queue import Empty
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-
-from django.db.models import Count, Exists, OuterRef, Q
+from django.contrib.admin.views.decorators import staff_member_required
+
+from django.db.models import (
+    BooleanField,
+    Exists,
+    ExpressionWrapper,
+    OuterRef,
+    Prefetch,
+    Q,
+)
 
 """
-Count    : レコードの件数を数える
 Exists   : サブクエリで「該当するレコードが存在するか」を調べる
 OuterRef : サブクエリの中で外側のクエリ（親クエリ）の値を参照する
 Q        : 複雑な条件を OR / AND / NOT で組み合わせる
+Prefetch : prefetch_related で関連データをまとめて取得する時の条件を指定する
 """
 
 
@@ -104,8 +135,32 @@ class SurveyListView(LoginRequiredMixin, ListView):
         # タグで絞り込みを行った時ににUIで再描写した時に選んだタグをチェック状態で残す
         # これがないと再描写した時にチェックが外れてしまう
         # getlist("tag")：ユーザが選択したタグのIDのリストを取得
+
+        # 次のページ／最初のページへのリンク用クエリ文字列
+        # q / tag / own_only / open_only などの絞り込み条件はそのまま引き継ぐ
+        params = self.request.GET.copy()
+        params.pop("cursor", None)
+        context["first_page_query"] = params.urlencode()
+        page = context["page_obj"]
+        if page.has_next:
+            params["cursor"] = page.next_cursor
+            context["next_page_query"] = params.urlencode()
+        context["is_first_page"] = parse_cursor(self.request.GET.get("cursor")) is None
         return context
 
+    # ページ分割は常に行う（件数は ?size= または settings.SURVEY_LIST_PAGE_SIZE）
+    def get_paginate_by(self, queryset):
+        return get_page_size(self.request.GET.get("size"))
+
+    # ListView 標準の Paginator は OFFSET を使うため、キーセット方式に差し替える
+    # ?cursor=<前ページ最後のid> より小さい id だけを WHERE で絞り込んで LIMIT で取得する
+    def paginate_queryset(self, queryset, page_size):
+        cursor = parse_cursor(self.request.GET.get("cursor"))
+        page = keyset_paginate(queryset, cursor, page_size)
+        # (paginator, page_obj, object_list, is_paginated) の順で返す
+        is_paginated = page.has_next or cursor is not None
+        return (None, page, page.object_list, is_paginated)
+
     def get_queryset(self):
         user = self.request.user
         # 現在ログイン中のユーザーを取得
@@ -138,20 +193,12 @@ class SurveyListView(LoginRequiredMixin, ListView):
         if keyword:
             # 検索ワードが入力されていたら検索条件で絞り込みを行う
             # 検索フォームが空の場合はフィルターをかけずにスルー
-            surveys = surveys.filter(
-                # ↑surveysのオブジェクトの中から、この条件に合うものだけを残して！という命令文
-                # フィールド名　= フィールド名.filter(...条件)
-                Q(title__icontains=keyword) | Q(description__icontains=keyword)
-            )
-            # そもそもQオブジェクトとは？
-            # Qオブジェクトを使うとOR条件や複雑な条件が書けるようになる
-            # 例：AかBのどちらか、Aかつ(BかC)、NOT A、みたいなSQLのWHERE条件を自由に組み立てたもの
-
-            # title__icontainsの意味
-            # title→モデルのフィールド名（Surveyモデルのtitleフィールド(アンケートタイトル))
-            # __(ダブルアンダースコア)はDjangoのフィルタのルール指定
-            # icontains(アイコンテインズ)→大文字、小文字を区別しない部分一致検索
-            # description→説明文にキーワードが一致していたらヒットする
+            surveys = search_surveys(surveys, keyword)
+            # ↑surveysのオブジェクトの中から、キーワードがタイトルか詳細に含まれるものだけを残す
+            # 以前は title__icontains | description__icontains (LIKE '%...%') で全件走査していたので、
+            # n-gram インデックスで絞り込む search.py に切り替えた
+            # MySQL では FULLTEXT(ngram)、SQLite などでは survey_search_grams テーブルを使う
+            # 空白で区切ると複数キーワードの AND 検索になる
 
         # しほ：タグ検索
         tag_ids = self.request.GET.getlist("tag")
@@ -159,8 +206,11 @@ class SurveyListView(LoginRequiredMixin, ListView):
         # get()は1つしか取れないけど、タグは複数選ばれる可能性があるのでgetlist()を使う
         if tag_ids:
             # タグが選ばれていたら絞り込みを行う
-            surveys = surveys.filter(tag_survey__in=tag_ids).distinct()
-            # tag_survey(アンケートに紐付くタグ)の中に、選択されたタグID(tag_ids)が含まれているアンケートだけを残す
+            surveys = surveys.filter(
+                tag_surveys__tag_id__in=tag_ids, tag_surveys__is_deleted=False
+            ).distinct()
+            # tag_surveys(アンケートに紐付くタグ)の中に、選択されたタグID(tag_ids)が含まれているアンケートだけを残す
+            # 論理削除された紐付けは対象外にするため、中間テーブル(TagSurvey)を直接条件にしている
             # .distinct()をつけることで同じアンケートがヒットしないようにしている
             #  models.ManyToManyField(多対多)ではアンケートが重複して返ることがあるので
             # distinct()をつけることで重複を防ぐ
@@ -208,6 +258,23 @@ class SurveyListView(LoginRequiredMixin, ListView):
                     is_deleted=False,
                     # 論理削除されていない投票だけを取得
                 )
+            ),
+            # 作成者本人かどうかも SQL 側で判定する
+            # テンプレートで survey.user == request.user と書くと、アンケートごとに
+            # users テーブルへの SELECT が走ってしまう(N+1問題)ため
+            is_owner=ExpressionWrapper(Q(user=user), output_field=BooleanField()),
+        )
+
+        # カードに表示するタグは、ページ内の全アンケート分を1回のクエリでまとめて取得する
+        # survey.tag_survey.all だとアンケートごとに SELECT が走る上、
+        # 論理削除された中間テーブル(TagSurvey)やタグ(Tag)まで表示されてしまう
+        surveys = surveys.prefetch_related(
+            Prefetch(
+                "tag_surveys",
+                queryset=TagSurvey.objects.filter(tag__is_deleted=False)
+                .select_related("tag")
+                .order_by("tag_id"),
+                to_attr="active_tag_surveys",
             )
         )
 
@@ -225,6 +292,10 @@ class SurveyDetailView(LoginRequiredMixin, DetailView):
     ## テンプレート変数名を指定
     context_object_name = "survey"
 
+    # 受付終了後の集計結果(スナップショット)もアンケートと一緒に1回のクエリで取得する
+    def get_queryset(self):
+        return super().get_queryset().select_related("result_snapshot")
+
     ## アンケートに紐づく選択肢（Option)や投票(Votes)を取得する。
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -235,6 +306,8 @@ class SurveyDetailView(LoginRequiredMixin, DetailView):
 
         # 選択肢（Option）一覧はそのまま
         ctx["option_list"] = self.object.options.filter(is_deleted=False)
+        # タグ一覧（論理削除された紐付け・タグは表示しない）
+        ctx["tags"] = survey_tags(survey)
 
         # 投票（Vote）をテンプレに渡す（未ログインなら None）
         user_vote = None
@@ -246,61 +319,22 @@ class SurveyDetailView(LoginRequiredMixin, DetailView):
 
         ctx["vote"] = user_vote  # ← これまでの ctx["vote"] と同じ意味
 
-        # # これまでの投票一覧（このアンケートの全投票）
-        ctx["vote_list"] = (
-            Vote.objects.filter(survey=survey, is_deleted=False)
-            .select_related("user", "option")
-            .order_by("-created_at")
-        )
-
-        # # 選択項目ごとの票数（このアンケート内）
-        # ctx["option_vote_counts"] = (
-        #     Vote.objects.filter(survey=survey, is_deleted=False)
-        #     .values("option__id", "option__label")
-        #     .annotate(vote_count=Count("id"))
-        #     .order_by("option__id")
-        # )
-
-        # 選択項目ごとの票数（このアンケート内）Option を起点に、すべての選択肢を取得しつつ投票数（0票も含む）を集計
-        ctx["option_vote_counts"] = (
-            Option.objects.filter(
-                survey=survey, is_deleted=False
-            )  # 論理削除されていないオプションを取得
-            .annotate(
-                vote_count=Count("votes", filter=Q(votes__is_deleted=False))
-            )  # 投票数を集計（論理削除されていないもの）
-            .order_by("id")  # オプションIDで並び替え
-        )
-
-        # コメント付きの投票を取得(コメントなしの投票を除外)
-        ctx["vote_with_comment"] = (
-            Vote.objects.filter(survey=survey, is_deleted=False)
-            .exclude(comment__isnull=True)
-            .exclude(comment="")
-            .select_related("option")
-            .order_by("-created_at")
-        )
-
-        # Chart.js 用の配列を作る 選択肢と凡例の色を対応付ける
-        labels = []
-        vote_counts = []
-        colors = []
-        # 固定パレット
-        COLOR_PALETTE = ["#34d399", "#f87171", "#60a5fa", "#fbbf24"]
-
-        option_color_map = {}  # option_id → 色マップ
-
-        for idx, opt in enumerate(ctx["option_vote_counts"]):
-            labels.append(opt.label)
-            vote_counts.append(opt.vote_count)
-            color = COLOR_PALETTE[idx % len(COLOR_PALETTE)]
-            colors.append(color)
-            option_color_map[opt.id] = color
-
-        ctx["chart_labels"] = labels
-        ctx["chart_counts"] = vote_counts
-        ctx["chart_colors"] = colors
-        ctx["option_color_map"] = option_color_map
+        # 票数・円グラフ用データ・コメント一覧（results.py）
+        # 受付中     : 投票時に更新している option.vote_count などから毎回作る
+        # 受付終了後 : 結果は変わらないので、一度だけ作って保存したスナップショットを読む
+        ctx.update(survey_results(survey))
+        # 受付中なら、票数をリアルタイムに更新する（survey_results_stream）
+        if not is_closed(survey):
+            ctx["results_stream_url"] = reverse_lazy(
+                "survey-results-stream", kwargs={"pk": survey.pk}
+            )
+            # 配信の人数が上限に達した時などは、この URL を定期的に呼ぶ
+            ctx["results_poll_url"] = reverse_lazy(
+                "survey-results-poll", kwargs={"pk": survey.pk}
+            )
+            ctx["results_poll_interval"] = getattr(
+                settings, "RESULTS_POLL_INTERVAL", 10
+            )
 
         return ctx
 
@@ -316,8 +350,10 @@ def get_guest_user():
 
 
 # アンケート新規作成
-class SurveyCreateView(LoginRequiredMixin, CreateView):
+class SurveyCreateView(LoginRequiredMixin, IdempotentFormMixin, CreateView):
     model = Survey
+    # 二重送信で同じアンケートが2つ作られないようにする
+    idempotency_scope = "survey-create"
     # ModelForm を使う
     form_class = SurveyCreateForm
     template_name = "karakuchi_room/surveys_create.html"
@@ -355,14 +391,8 @@ class SurveyCreateView(LoginRequiredMixin, CreateView):
                 selected_tags = form.cleaned_data.get("tag_survey", [])
                 # フォームの入力チェック（バリデーション）
                 # tag_surveyのフォームが空の場合は[]を返す
-                # []を返すことでループのエラーを防ぐ
-                for tag in selected_tags:
-                    # フォームでユーザーが選択したTag(タグ)モデルのそのものの(インスタンス)のリストを取り出している
-                    TagSurvey.objects.get_or_create(survey=survey, tag=tag)
-                    # 中間テーブル(TagSurvey)に同じ組み合わせデータがすでにあるかを確認している
-                    # 例えばsurvey=アンケート１＋tag=雑談
-                    # 同じ組み合わせデータが中間テーブル(TagSurvey)にない場合は新規作成される。(True)
-                    # 既に同じデータがある場合は新規作成されない(False)
+                # 選択されたタグを中間テーブル(TagSurvey)にまとめて作成する（タグの数に関係なくINSERT 1本）
+                sync_survey_tags(survey, selected_tags)
 
             messages.success(self.request, "アンケートを作成しました。")
             return redirect("survey-list")
@@ -419,41 +449,18 @@ class SurveyTemporaryUpdateView(LoginRequiredMixin, UpdateView):
 
             formset.instance = self.object
 
-            # commit=False にして、削除対象・更新対象を分ける
-            opts = formset.save(commit=False)
-
-            # 削除マークが付いたものを論理削除
-            for obj in formset.deleted_objects:
-                obj.is_deleted = True
-                obj.save()
-
-            # 更新／新規のものを保存
-            for opt in opts:
-                opt.is_deleted = False  # 削除マークがないものは有効化
-                opt.survey = self.object
-                opt.save()
+            # 選択肢の追加・更新・論理削除を、種類ごとに SQL 1本ずつにまとめて保存する
+            # （以前は1件ずつ save() した後に formset.save() でもう一度保存していた）
+            formset.bulk_save()
 
             # しほ：ここからタグの追加、削除
             # 選択されたタグを再保存
             selected_tags = form.cleaned_data.get("tag_survey", [])
             # フォームの入力チェック（バリデーション）
             # tag_surveyのフォームが空の場合は[]を返す
-            # []を返すことでループのエラーを防ぐ
-            TagSurvey.objects.filter(survey=self.object).delete()
-            # 中間テーブル(TagSurvey)から今編集しているアンケート(self.object)に紐づくタグを全て取得している
-            # .delete()で検索したアンケートに紐づいているタグを削除している
-            # アンケート＋タグでセットになって保存しているので紐づいているタグを一旦クリアにすることでタグの追加、削除することができる
-            for tag in selected_tags:
-                # `tag` にはユーザーが選んだ Tag モデルのインスタンス
-                # （例：<Tag id=1 name="雑談">）がそのまま入っている
-                TagSurvey.objects.get_or_create(survey=self.object, tag=tag)
-                # これは追加、削除があった場合の保存処理
-                # 中間テーブル(TagSurvey)に同じレコード(組み合わせ)がないかを確認(survey=self.object, tag=tag)
-                # 存在しなければ新しく作成、存在すれば作らない(get_or_create)
-
-            # 　フォームセット(選択肢)も再保存
-            formset.instance = self.object
-            formset.save()
+            # 以前は紐づいているタグを一旦全て削除してから1件ずつ作り直していたが、
+            # 今付いているタグとの差分（追加・削除・削除の取り消し）だけをまとめて反映する
+            sync_survey_tags(self.object, selected_tags)
 
             messages.success(self.request, "アンケートを作成しました。")
             return redirect("survey-detail", pk=self.object.pk)
@@ -482,6 +489,7 @@ class SurveyUpdateView(LoginRequiredMixin, UpdateView):
         for f in formset.forms:
             f.fields["label"].disabled = True  # ← 選択項目の編集：無効化
         ctx["formset"] = formset
+        ctx["tags"] = survey_tags(self.object)
         return ctx
 
     # 公開済みは常に公開のままに固定するなら明示しておく
@@ -505,6 +513,14 @@ class SurveyUpdateView(LoginRequiredMixin, UpdateView):
             formset.instance = survey  # Option の親を設定
             formset.save()
 
+            # 受付終了にしたらこの時点の結果を保存し、受付を再開したら破棄する
+            if is_closed(survey):
+                write_snapshot(survey)
+            else:
+                discard_snapshot(survey)
+            # 詳細画面を見ている人に、受付終了・期限の変更を知らせる
+            mark_changed(survey.pk)
+
             messages.success(self.request, "アンケートを作成しました。")
             return redirect("survey-detail", pk=self.object.pk)
 
@@ -512,6 +528,7 @@ class SurveyUpdateView(LoginRequiredMixin, UpdateView):
 # アンケート削除(DeleteViewは別途削除用のページが必要なので、今回は別の方法で実装)
 def survey_delete(request, pk):
     survey = get_object_or_404(Survey, pk=pk)
+    # 選択肢・投票・タグの紐付けもまとめて論理削除する（モデルごとに UPDATE 1本）
     survey.delete()
 
     messages.success(request, "削除しました。")
@@ -550,17 +567,19 @@ class VoteDetailView(DetailView):
 
 
 # 投票作成画面
-class VoteCreateView(CreateView):
+class VoteCreateView(IdempotentFormMixin, CreateView):
     model = Vote
+    # 再送信されてもコメント審査と保存をやり直さない
+    idempotency_scope = "vote-create"
     template_name = "karakuchi_room/votes_create.html"
     form_class = VoteForm
 
     def dispatch(self, request, *args, **kwargs):
         survey = get_object_or_404(Survey, pk=self.kwargs["survey_id"])
 
-        # end_at を使って受付終了を判定
-        now = timezone.now()
-        if survey.end_at and survey.end_at <= now:
+        # end_at と is_open(受付停止) を使って受付終了を判定
+        # 受付終了後は結果をスナップショットで固定しているので、投票させない
+        if is_closed(survey):
             return redirect("survey-detail", pk=survey.pk)
 
         self.survey = survey
@@ -579,23 +598,28 @@ class VoteCreateView(CreateView):
         return ctx
 
     def form_valid(self, form):
-        # ここで「すでに有効な投票があるか」をチェック
-        already_voted = Vote.objects.filter(
-            user=self.request.user,
-            survey=self.survey,
-            is_deleted=False,
-        ).exists()
-
-        # すでに投票している場合
-        if already_voted:
-            messages.error(self.request, "このアンケートには既に投票済みです。")
-            return redirect("survey-detail", pk=self.survey.pk)
-
-        # まだ投票していない場合だけ保存
         # 作成するVoteにsurveyを紐づけ
         form.instance.user = self.request.user
         form.instance.survey = self.survey
-        return super().form_valid(form)
+        # 投票の保存と票数カウンターの更新をまとめて行う（どちらか失敗すればロールバック）
+        # 「すでに有効な投票があるか」は事前に確認せず、保存時に DB の一意制約で判定する
+        # （二重送信が同時に来ても、2票目はここで弾かれる）
+        vote = form.save(commit=False)
+        # コメントの審査をバックグラウンドで行う設定なら、審査待ちで保存してジョブを積む
+        deferred = is_deferred() and bool(vote.comment)
+        if deferred:
+            mark_pending(vote)
+        try:
+            with transaction.atomic():
+                self.object = create_vote(vote)
+                if deferred:
+                    enqueue_comment_moderation(self.object)
+        except AlreadyVoted:
+            # すでに投票している場合
+            messages.error(self.request, "このアンケートには既に投票済みです。")
+            return redirect("survey-detail", pk=self.survey.pk)
+
+        return redirect(self.get_success_url())
 
     def get_success_url(self):
         return reverse_lazy("survey-detail", kwargs={"pk": self.object.survey.pk})
@@ -614,13 +638,37 @@ class VoteUpdateView(LoginRequiredMixin, UpdateView):
         survey = vote.survey
 
         # 受付終了なら編集させずにアンケート詳細画面へ
-        if survey.end_at and survey.end_at <= timezone.now():
+        if is_closed(survey):
             return redirect("survey-detail", pk=survey.pk)
 
         # あとで使いたければ保持しておく
         self.survey = survey
         return super().dispatch(request, *args, **kwargs)
 
+    def form_valid(self, form):
+        # 保存すると変更前の値が上書きされるので、先に変更されたフィールドを調べておく
+        # （form.instance は読み込んだ時の値を覚えている）
+        original_option_id = form.instance.loaded_value("option")
+        # 前回審査したコメントから変わった（または判定ポリシーが変わった）時だけ審査し直す
+        # 同期審査の時はフォームで審査済みなので False になる
+        comment_needs_moderation = needs_moderation(
+            form.instance, form.instance.comment
+        )
+        # バックグラウンド審査の設定時は、審査待ちで保存してジョブを積む
+        deferred = is_deferred() and comment_needs_moderation
+        if deferred:
+            mark_pending(form.instance)
+
+        # 投票の保存と票数カウンターの付け替えをまとめて行う
+        with transaction.atomic():
+            response = super().form_valid(form)
+            record_vote_option_changed(
+                self.survey.pk, original_option_id, self.object.option_id
+            )
+            if deferred:
+                enqueue_comment_moderation(self.object)
+        return response
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx["survey"] = self.survey
@@ -635,17 +683,12 @@ class VoteUpdateView(LoginRequiredMixin, UpdateView):
 def vote_delete(request, pk):
     vote = get_object_or_404(Vote, pk=pk)
 
-    # ソフトデリートではなく「物理削除」にする
-    """
-    物理削除にした理由
-    
-    ソフトデリートだと以下のパターンでエラーが出るから
-    • 投票
-	• その投票を削除（/votes/delete/ or 画面の削除ボタン）
-	• 再度投票
-	• もう一度削除 ←ここでエラーが出る。
-    """
-    Vote.objects.filter(pk=vote.pk).delete()
+    # 論理削除（UPDATE 1本）。票数は論理削除の後処理(Vote.after_soft_delete)で減らす
+    # 削除済みの票は一意制約の対象外(active_key が NULL)なので、再投票→再削除もできる
+    with transaction.atomic():
+        vote.delete()
+        # 受付終了後に削除された場合は、保存済みの結果を作り直させる
+        discard_snapshot(vote.survey)
 
     messages.success(request, "削除しました。")
     return redirect("survey-list")
@@ -694,8 +737,6 @@ class UserUpdateView(LoginRequiredMixin, UpdateView):
 def soften_comment(request):
     """コメントを柔らかい表現に変換し、誹謗中傷をチェックする"""
 
-    client = OpenAI(api_key=os.environ["API_KEY"])
-
     data = json.loads(request.body)
     text = data.get("text", "")
 
@@ -705,26 +746,151 @@ def soften_comment(request):
     # -----------------------------
     # 柔らかい表現への書き換え（GPT）
     # -----------------------------
-    prompt = f"""
-以下のルールに従って、入力された文章のみを柔らかく書き換えてください。
-・回答文は書かないこと（「こんな感じで書き換えました！」などのコメント不要）
-・書き換え後の文章だけを出力すること
-・文章の意味や主張は変えないこと（内容を追加したり削除したりしない）
-・“柔らかくする” とは表現を少し優しくする程度にとどめること
-・絵文字を入れること
-・丁寧になりすぎて元の意図が失われるような完全書き換えは禁止
-・攻撃的・失礼な要素があればすべて取り除くこと 
-・ネガティブな意見は相手が受け止めやすいように表現を書き換えてください。
-
-元の文章：
-{text}
-"""
+    soft_text = soften_text(text)
+
+    return JsonResponse({"soft_text": soft_text})
+
+
+# コメント生成AI機能（ストリーミング版）
+# 生成された文字を届いた順に NDJSON（1行1つの JSON）で返す
+#   {"delta": "..."} を何行か返し、最後に {"done": true, "soft_text": "全文"}
+#   失敗した時は {"error": "..."} を返して終わる
+@csrf_exempt
+def soften_comment_stream(request):
+    """コメントを柔らかい表現に変換し、生成された分から順に返す"""
+
+    data = json.loads(request.body)
+    text = data.get("text", "")
+
+    if not text.strip():
+        return JsonResponse({"error": "文章が入力されていません。"}, status=400)
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+    def ndjson(payload):
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    def generate():
+        parts = []
+        try:
+            for delta in stream_soften(text):
+                parts.append(delta)
+                yield ndjson({"delta": delta})
+        except Exception:
+            logger.exception("コメントの書き換えに失敗しました")
+            yield ndjson({"error": "書き換えに失敗しました。"})
+            return
+        yield ndjson({"done": True, "soft_text": "".join(parts)})
+
+    response = StreamingHttpResponse(
+        generate(), content_type="application/x-ndjson; charset=utf-8"
     )
+    # nginx などのプロキシでまとめて送られないようにする
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
-    soft_text = response.choices[0].message.content
 
-    return JsonResponse({"soft_text": soft_text})
+def sse_event(name, data, event_id=None):
+    """Server-Sent Events の1イベント分の文字列"""
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ResultsStream:
+    """
+    survey_results_stream のレスポンス本体。
+    close() は Django が接続の終わりに呼ぶので、途中で切られても配信先から外れる
+    """
+
+    def __init__(self, survey, queue):
+        self.survey = survey
+        self.queue = queue
+        self.closed = False
+
+    def __iter__(self):
+        # 最初の票数は subscribe 済み。配信中は DB を使わないので接続を返しておく
+        # （CONN_MAX_AGE の間、1人1本の接続を持ち続けないように）
+        if not connection.in_atomic_block:
+            connection.close()
+
+        keepalive = getattr(settings, "RESULTS_STREAM_KEEPALIVE", 15)
+        deadline = time.monotonic() + getattr(
+            settings, "RESULTS_STREAM_MAX_SECONDS", 300
+        )
+        # 切れた時に繋ぎ直すまでの時間（ミリ秒）
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            # 期限(end_at)を過ぎたら終わる（受付終了の操作は results の closed で届く）
+            if self.survey.is_expired:
+                yield sse_event("closed", {})
+                return
+            try:
+                results = self.queue.get(timeout=keepalive)
+            except Empty:
+                # プロキシに接続を切られないよう、何もなくても時々送る
+                yield ": keepalive\n\n"
+                continue
+            if results is None:
+                continue
+            yield sse_event("results", results, results["version"])
+            if results["closed"]:
+                yield sse_event("closed", {})
+                return
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            hub.unsubscribe(self.survey.pk, self.queue)
+
+
+# アンケート詳細画面の票数のリアルタイム更新（Server-Sent Events）
+# 票数が変わるたびに "results" イベントで次の JSON を送る（id は results_version）
+#   {"version": 3, "vote_total": 10, "counts": {"選択肢ID": 票数}, "changed": {"選択肢ID": +1 など},
+#    "closed": false, "resync": false}
+# 接続は RESULTS_STREAM_MAX_SECONDS 秒で切り、ブラウザ(EventSource)に繋ぎ直してもらう
+# 受付終了したアンケートは "closed" イベントを送って終わる（結果はもう変わらない）
+# 同時に配信する人数が RESULTS_STREAM_MAX_CONNECTIONS に達していたら 204 を返す
+# （EventSource は繋ぎ直さなくなるので、ブラウザは survey_results_poll で定期的に取得する）
+@login_required
+def survey_results_stream(request, pk):
+    survey = get_object_or_404(Survey, pk=pk)
+    if is_closed(survey):
+        return StreamingHttpResponse(
+            [sse_event("closed", {})], content_type="text/event-stream; charset=utf-8"
+        )
+
+    queue = hub.subscribe(
+        survey.pk, limit=getattr(settings, "RESULTS_STREAM_MAX_CONNECTIONS", 16)
+    )
+    if queue is None:
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(
+        ResultsStream(survey, queue), content_type="text/event-stream; charset=utf-8"
+    )
+    # nginx などのプロキシでまとめて送られないようにする
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# 票数の取得（Server-Sent Events を使えない時に、ブラウザが定期的に呼ぶ）
+# ?version= に表示中の results_version を付けると、変わっていなければ 204 を返す（クエリ1本）
+@login_required
+def survey_results_poll(request, pk):
+    version = (
+        Survey.objects.filter(pk=pk).values_list("results_version", flat=True).first()
+    )
+    if version is None:
+        return JsonResponse({"error": "not found"}, status=404)
+    if request.GET.get("version") == str(version):
+        return HttpResponse(status=204)
+    return JsonResponse(make_event(None, load_results(pk), resync=True))
+
+
+# メトリクス（判定キャッシュのヒット率など）を JSON で返す（管理者のみ）
+@staff_member_required
+def metrics_view(request):
+    return JsonResponse(metrics.snapshot())
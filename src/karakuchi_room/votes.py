@@ -0,0 +1,148 @@
+# 投票数カウンター(Option.vote_count / Survey.vote_total)の更新処理
+# 詳細画面で毎回 votes テーブルを COUNT するのをやめ、投票の作成・変更・削除の時に
+# F() 式で +1 / -1 する（UPDATE 1本で済み、同時に投票されても数がずれない）
+# 呼び出し側は投票の保存と同じ transaction.atomic() の中で呼ぶこと
+# 票数が変わったアンケートは results_version も +1 し、コミット後に詳細画面へ知らせる(realtime.py)
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from . import realtime
+from .models import Option, Survey, Vote
+
+
+def _notify(survey_ids):
+    # ロールバックされた投票は知らせない
+    transaction.on_commit(lambda: realtime.notify(*survey_ids))
+
+
+def _add(option_id, survey_id, delta):
+    # 論理削除済みの選択肢でも票は残っているので all_objects で更新する
+    Option.all_objects.filter(pk=option_id).update(vote_count=F("vote_count") + delta)
+    Survey.all_objects.filter(pk=survey_id).update(
+        vote_total=F("vote_total") + delta,
+        results_version=F("results_version") + 1,
+    )
+    _notify([survey_id])
+
+
+class AlreadyVoted(Exception):
+    """同じアンケートに有効な投票が既にある"""
+
+
+def create_vote(vote):
+    """
+    投票を INSERT して票数を +1 する。
+    「既に投票済みか」を事前に SELECT せず、DB の一意制約(uq_vote_user_survey_active_key)に任せる。
+    二重送信が同時に来ても片方だけが保存され、もう片方は AlreadyVoted になる。
+    呼び出し側の transaction.atomic() の中で呼ぶこと（AlreadyVoted の時はロールバックされる）
+    """
+    try:
+        vote.save(force_insert=True)
+    except IntegrityError as e:
+        # votes テーブルの一意制約はこれだけ（選択肢・アンケートの存在はフォームで確認済み）
+        raise AlreadyVoted from e
+    record_vote_created(vote)
+    return vote
+
+
+def record_vote_created(vote):
+    """投票が作成された時に選択肢とアンケートの票数を +1 する"""
+    _add(vote.option_id, vote.survey_id, 1)
+
+
+def _subtract_counts(model, field, counts, **extra):
+    # {ID: 減らす数} をまとめて UPDATE 1本で反映する
+    # 管理画面で直接作った投票などでカウンターが足りない時は 0 で止める（マイナスにしない）
+    if not counts:
+        return
+    whens = []
+    for pk, n in counts.items():
+        whens.append(When(pk=pk, **{f"{field}__gte": n}, then=F(field) - n))
+        whens.append(When(pk=pk, then=Value(0)))
+    model.all_objects.filter(pk__in=counts).update(
+        **{field: Case(*whens, default=F(field), output_field=IntegerField())},
+        **extra,
+    )
+
+
+def record_votes_deleted(vote_ids):
+    """複数の投票がまとめて論理削除された時に、選択肢とアンケートの票数を減らす"""
+    votes = Vote.all_objects.filter(pk__in=vote_ids)
+    _subtract_counts(
+        Option,
+        "vote_count",
+        dict(
+            votes.values("option_id")
+            .annotate(n=Count("id"))
+            .values_list("option_id", "n")
+        ),
+    )
+    survey_counts = dict(
+        votes.values("survey_id").annotate(n=Count("id")).values_list("survey_id", "n")
+    )
+    _subtract_counts(
+        Survey,
+        "vote_total",
+        survey_counts,
+        results_version=F("results_version") + 1,
+    )
+    _notify(list(survey_counts))
+
+
+def record_vote_option_changed(survey_id, old_option_id, new_option_id):
+    """投票編集で選択肢が変わった時に票を付け替える（アンケートの総数は変わらない）"""
+    if old_option_id == new_option_id:
+        return
+    Option.all_objects.filter(pk=old_option_id).update(vote_count=F("vote_count") - 1)
+    Option.all_objects.filter(pk=new_option_id).update(vote_count=F("vote_count") + 1)
+    Survey.all_objects.filter(pk=survey_id).update(
+        results_version=F("results_version") + 1
+    )
+    _notify([survey_id])
+
+
+def rebuild_vote_counters(dry_run=False):
+    """
+    votes テーブルから票数を数え直し、カウンターとずれている行を修正する。
+    ずれていた行を (モデル名, ID, 保存値, 実際の値) のリストで返す。
+    管理画面から Vote を直接編集した場合などはカウンターがずれるので、このコマンドで直す。
+    """
+    drift = []
+
+    # 論理削除されていない投票だけを数える（Vote.objects は未削除のみ）
+    option_actual = dict(
+        Vote.objects.values("option_id")
+        .annotate(n=Count("id"))
+        .values_list("option_id", "n")
+    )
+    survey_actual = dict(
+        Vote.objects.values("survey_id")
+        .annotate(n=Count("id"))
+        .values_list("survey_id", "n")
+    )
+
+    options = []
+    for option in Option.all_objects.only("id", "vote_count").iterator():
+        actual = option_actual.get(option.id, 0)
+        if option.vote_count != actual:
+            drift.append(("Option", option.id, option.vote_count, actual))
+            option.vote_count = actual
+            options.append(option)
+
+    surveys = []
+    for survey in Survey.all_objects.only("id", "vote_total").iterator():
+        actual = survey_actual.get(survey.id, 0)
+        if survey.vote_total != actual:
+            drift.append(("Survey", survey.id, survey.vote_total, actual))
+            survey.vote_total = actual
+            survey.results_version = F("results_version") + 1
+            surveys.append(survey)
+
+    if not dry_run:
+        # Survey.save() は通さず(公開日時の判定や検索インデックスの更新は不要)、まとめて UPDATE する
+        Option.all_objects.bulk_update(options, ["vote_count"], batch_size=500)
+        Survey.all_objects.bulk_update(
+            surveys, ["vote_total", "results_version"], batch_size=500
+        )
+
+    return drift
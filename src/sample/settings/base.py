@@ -88,6 +88,96 @@ LOGIN_REDIRECT_URL = "survey-list"
 # ログアウトしたらログインページにリダイレクト
 LOGOUT_REDIRECT_URL = "login"
 
+# アンケート一覧の1ページあたりの件数（キーセット方式のページネーション）
+SURVEY_LIST_PAGE_SIZE = 20
+# ?size= で指定できる1ページあたりの件数の上限
+SURVEY_LIST_MAX_PAGE_SIZE = 100
+
+# コメントの誹謗中傷チェックの実行方法
+#   sync     : 投稿時に OpenAI へ問い合わせ、NGならフォームエラーにする
+#   deferred : 投稿はすぐ保存して「審査待ち」にし、moderate_comments ワーカーが審査する
+COMMENT_MODERATION_MODE = os.getenv("COMMENT_MODERATION_MODE", "sync")
+# 審査ジョブの再試行回数の上限と、ワーカーが落ちた時に取り戻すまでの秒数
+MODERATION_JOB_MAX_ATTEMPTS = 5
+MODERATION_JOB_LOCK_TIMEOUT = 300
+# 組み込みのNGワードに追加する辞書ファイル（1行1単語、未指定なら組み込みのみ）
+NG_WORDS_FILE = os.getenv("NG_WORDS_FILE") or None
+# NGワードを含むが問題のない言葉を追加する辞書ファイル（「シネマ」など。書式は NG_WORDS_FILE と同じ）
+NG_WORDS_ALLOWED_FILE = os.getenv("NG_WORDS_ALLOWED_FILE") or None
+# フォームの二重送信対策（冪等キー）
+#   トークンの有効期限（秒）、処理中の送信の結果を待つ秒数、何回ごとに期限切れを掃除するか
+#   （待つ間はスレッドが塞がるので 0 = 待たずに「処理中」と返す）
+IDEMPOTENCY_KEY_TTL = 600
+IDEMPOTENCY_WAIT = 0
+IDEMPOTENCY_PRUNE_EVERY = 100
+# OpenAI クライアント（Gunicorn のワーカーごとに1つ作って使い回す）
+#   タイムアウト（秒）、同時接続数、keep-alive で残しておく接続数と時間、再試行回数
+OPENAI_TIMEOUT = 30
+OPENAI_CONNECT_TIMEOUT = 5
+OPENAI_MAX_CONNECTIONS = 20
+OPENAI_MAX_KEEPALIVE = 10
+OPENAI_KEEPALIVE_EXPIRY = 30
+OPENAI_MAX_RETRIES = 2
+# OpenAI の接続先（未指定なら本物の API。負荷試験では fake_openai_server の URL を指定する）
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# コメント書き換え(AI)の結果キャッシュ（プロセス内に持つ件数と有効期限（秒））
+SOFTEN_CACHE_SIZE = 512
+SOFTEN_CACHE_TTL = 60 * 60
+# OpenAI での誹謗中傷チェック
+#   MODERATION_EXECUTION   : concurrent=Moderation API と ChatGPT を同時に呼ぶ / sequential=順番に呼ぶ
+#   MODERATION_DEADLINE    : 判定全体の期限（秒）
+#   MODERATION_FAIL_POLICY : 期限切れ・エラーの時に open=通す / closed=NGにする
+#   MODERATION_CIRCUIT_*   : 連続で何回失敗したら、何秒間 OpenAI を呼ばないようにするか
+MODERATION_EXECUTION = os.getenv("MODERATION_EXECUTION", "concurrent")
+MODERATION_DEADLINE = 10
+MODERATION_FAIL_POLICY = os.getenv("MODERATION_FAIL_POLICY", "closed")
+# 同時に OpenAI に問い合わせる誹謗中傷チェックの数（ワーカーごと。超えた分は空くまで待つ）
+MODERATION_MAX_CONCURRENCY = 8
+MODERATION_CIRCUIT_FAILURES = 5
+MODERATION_CIRCUIT_RESET = 30
+# 誹謗中傷チェックの判定キャッシュ
+#   有効期限（秒）、プロセス内に持つ件数、DBに残す件数の上限、何回書き込むごとに掃除するか
+MODERATION_CACHE_TTL = 60 * 60 * 24 * 7
+MODERATION_CACHE_MEMORY_SIZE = 1024
+MODERATION_CACHE_MAX_ROWS = 100_000
+MODERATION_CACHE_PRUNE_EVERY = 100
+# 誹謗中傷チェックの判定方法（上から順に試し、最初に判定できたものを使う）
+#   MODERATION_OFFLINE=1 にすると OpenAI を使わない（テスト・負荷試験用）
+#   MODERATION_CLASSIFIER_FILE       : train_moderation_classifier で作った学習済みモデル
+#   MODERATION_CLASSIFIER_CONFIDENCE : 分類器の結果を使う確率（これ未満なら次の判定方法へ）
+MODERATION_BACKENDS = [
+    "karakuchi_room.moderation_backends.DictionaryBackend",
+    "karakuchi_room.moderation_backends.ClassifierBackend",
+    "karakuchi_room.moderation_backends.OpenAIBackend",
+]
+if os.getenv("MODERATION_OFFLINE") == "1":
+    MODERATION_BACKENDS = MODERATION_BACKENDS[:2]
+MODERATION_CLASSIFIER_FILE = os.getenv("MODERATION_CLASSIFIER_FILE") or None
+MODERATION_CLASSIFIER_CONFIDENCE = 0.95
+# 誹謗中傷チェックをまとめて OpenAI に問い合わせる（審査ワーカー・管理画面の審査し直し）
+#   MODERATION_BATCH_SIZE           : Moderation API に1回で渡すコメントの数
+#   MODERATION_BATCH_CHAT_SIZE      : ChatGPT の1つのプロンプトに入れるコメントの数
+#   MODERATION_BATCH_CHAT_MAX_CHARS : これより長いコメントは ChatGPT に1件ずつ問い合わせる
+#   MODERATION_BATCH_MAX_WAIT       : フォームからの審査を、他のリクエストとまとめるために待つ秒数
+#                                     （0 なら待たない。待つ分だけ投稿の応答が遅くなる）
+MODERATION_BATCH_SIZE = 20
+MODERATION_BATCH_CHAT_SIZE = 10
+MODERATION_BATCH_CHAT_MAX_CHARS = 200
+MODERATION_BATCH_MAX_WAIT = float(os.getenv("MODERATION_BATCH_MAX_WAIT", "0"))
+
+# アンケート詳細画面の票数のリアルタイム更新（Server-Sent Events）
+#   RESULTS_STREAM_POLL_INTERVAL : 他のワーカーでの投票に気づくまでの間隔（秒）
+#   RESULTS_STREAM_KEEPALIVE     : 票数が変わらない時に、接続を保つために何か送る間隔（秒）
+#   RESULTS_STREAM_MAX_SECONDS   : 1回の接続を保つ時間（秒）。過ぎたらブラウザが繋ぎ直す
+#   RESULTS_STREAM_MAX_CONNECTIONS : ワーカーごとに同時に配信する人数の上限
+#                                    （1人でスレッドを1つ使うので、Gunicorn の --threads より小さくする）
+#   RESULTS_POLL_INTERVAL        : 上限を超えた人が、票数を取りに来る間隔（秒）
+RESULTS_STREAM_POLL_INTERVAL = 1
+RESULTS_STREAM_KEEPALIVE = 15
+RESULTS_STREAM_MAX_SECONDS = 300
+RESULTS_STREAM_MAX_CONNECTIONS = 16
+RESULTS_POLL_INTERVAL = 10
+
 # テンプレ/静的の共通
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
@@ -29,6 +29,96 @@ function getCookie(name) {
 
 
 
+// ------------------------------------------------------------
+// 書き換え完了メッセージを表示する関数
+// ------------------------------------------------------------
+function showSoftenResult(message, color) {
+    const result = document.getElementById("ai_result");
+    result.style.color = color;
+    result.innerText = message;
+}
+
+
+
+// ------------------------------------------------------------
+// 従来の API（/api/comment/soften/）で書き換える関数
+// ------------------------------------------------------------
+// 全文ができあがってからまとめて返ってくる。
+// ストリーミングが使えないブラウザではこちらを使う。
+// ------------------------------------------------------------
+function softenWithJson(text, textarea) {
+    return fetch("/api/comment/soften/", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json", // JSON形式で送信
+            "X-CSRFToken": getCookie("csrftoken"), // CSRFトークンをヘッダーにセット
+        },
+        body: JSON.stringify({ text: text }), // 「text: 入力内容」を送る
+    })
+        // レスポンス（APIから返ってきたデータ）を JSON として読み込む
+        .then(res => res.json())
+        .then(data => {
+            // AI が柔らかく書き換えた文章を textarea に反映
+            textarea.value = data.soft_text;
+        });
+}
+
+
+
+// ------------------------------------------------------------
+// ストリーミング API（/api/comment/soften/stream/）で書き換える関数
+// ------------------------------------------------------------
+// 1行に1つの JSON が届く（NDJSON）。
+//   {"delta": "..."}                    → 生成された文字を textarea に追記
+//   {"done": true, "soft_text": "..."}  → 完了（全文で置き換える）
+//   {"error": "..."}                    → 失敗
+// ------------------------------------------------------------
+async function softenWithStream(text, textarea) {
+    const res = await fetch("/api/comment/soften/stream/", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": getCookie("csrftoken"),
+        },
+        body: JSON.stringify({ text: text }),
+    });
+    if (!res.ok) throw new Error("soften failed");
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let started = false;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        // 改行までを1つの JSON として読み、残りは次に持ち越す
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const data = JSON.parse(line);
+
+            if (data.error) throw new Error(data.error);
+            if (data.done) {
+                textarea.value = data.soft_text;
+                return;
+            }
+            // 最初の文字が届いたら元の文章を消して書き始める
+            if (!started) {
+                textarea.value = "";
+                started = true;
+            }
+            textarea.value += data.delta;
+        }
+    }
+}
+
+
+
 // ------------------------------------------------------------
 // 「AIで柔らかくする」ボタンが押された時の処理
 // ------------------------------------------------------------
@@ -40,34 +130,30 @@ document.addEventListener("DOMContentLoaded", function () {
     softenBtn.addEventListener("click", function () {
 
         // textarea（コメント入力欄）の中身を取得
-        const text = document.getElementById("comment_input").value;
-
-        // --------------------------------------------------------
-        // Django の API（/api/comment/soften/）に入力文章を送る
-        // --------------------------------------------------------
-        fetch("/api/comment/soften/", {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json", // JSON形式で送信
-                "X-CSRFToken": getCookie("csrftoken"), // CSRFトークンをヘッダーにセット
-            },
-            body: JSON.stringify({ text: text }), // 「text: 入力内容」を送る
-        })
-            // レスポンス（APIから返ってきたデータ）を JSON として読み込む
-            .then(res => res.json())
-
-            // 読み込んだ JSON データで次の処理を行う
-            .then(data => {
-
-                // ----------------------------------------------------
-                // AI が柔らかく書き換えた文章を textarea に反映
-                // ----------------------------------------------------
-                document.getElementById("comment_input").value = data.soft_text;
-
-                // 変換完了メッセージを画面に表示
-                const result = document.getElementById("ai_result");
-                result.style.color = "#007700";   // ← 緑色にする
-                result.innerText = "文章を書き換えました！こちらの文章でいかがでしょうか？";
+        const textarea = document.getElementById("comment_input");
+        const text = textarea.value;
+
+        // 書き換え中はボタンを押せないようにする
+        softenBtn.disabled = true;
+        showSoftenResult("AIが書き換えています…", "#555555");
+
+        // ストリーミングが使えるブラウザでは、生成された文字から順に表示する
+        const soften = (window.ReadableStream && window.TextDecoder)
+            ? softenWithStream(text, textarea)
+            : softenWithJson(text, textarea);
+
+        soften
+            .then(() => {
+                // 変換完了メッセージを画面に表示（緑色）
+                showSoftenResult("文章を書き換えました！こちらの文章でいかがでしょうか？", "#007700");
+            })
+            .catch(() => {
+                // 途中で失敗したら元の文章に戻す
+                textarea.value = text;
+                showSoftenResult("書き換えに失敗しました。時間をおいてもう一度お試しください。", "#cc0000");
+            })
+            .finally(() => {
+                softenBtn.disabled = false;
             });
-        });
-});
\ No newline at end of file
+    });
+});
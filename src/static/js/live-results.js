@@ -0,0 +1,99 @@
+// アンケート詳細画面の票数をリアルタイムに更新する
+// サーバーから Server-Sent Events で届く票数で、投票総数・票数の表・円グラフを書き換える
+// 配信の人数が上限に達していた時などは、一定間隔で票数を取りに行く（ポーリング）
+document.addEventListener("DOMContentLoaded", function() {
+
+    // 受付中のアンケートの詳細画面にだけある要素
+    const $liveResults = document.getElementById("live-results");
+    if (!$liveResults) {
+        return;
+    }
+
+    const $voteTotal = document.getElementById("vote-total");
+    // 表の並び（選択肢ID順）がグラフの並びと同じ
+    const $rows = Array.from(document.querySelectorAll("tr[data-option-id]"));
+
+    let version = -1;
+    let source = null;
+    let pollTimer = null;
+    // 受付終了で止めたかどうか
+    let finished = false;
+
+    function stop() {
+        finished = true;
+        if (source) {
+            source.close();
+        }
+        if (pollTimer) {
+            clearInterval(pollTimer);
+        }
+    }
+
+    // 届いた票数を表示する
+    function render(results) {
+        // 古い票数は無視する（カウンターの作り直しなどでバージョンが戻った時は resync で届く）
+        if (!results.resync && results.version <= version) {
+            return;
+        }
+        version = results.version;
+
+        // 選択肢が増えた・減った時（アンケートが編集された）は画面ごと読み直す
+        const optionIds = Object.keys(results.counts);
+        if (optionIds.length !== $rows.length
+            || $rows.some($row => !(String($row.dataset.optionId) in results.counts))) {
+            window.location.reload();
+            return;
+        }
+
+        $voteTotal.textContent = results.vote_total;
+        const counts = $rows.map($row => {
+            const count = results.counts[$row.dataset.optionId];
+            $row.querySelector(".vote-count").textContent = count;
+            return count;
+        });
+        if (window.updatePieChart) {
+            window.updatePieChart(counts);
+        }
+
+        // 受付が終了したら、これ以上は変わらないので止める
+        if (results.closed) {
+            stop();
+        }
+    }
+
+    // ポーリング（表示中のバージョンを送り、変わっていなければ 204 が返る）
+    function startPolling() {
+        if (pollTimer) {
+            return;
+        }
+        const interval = Number($liveResults.dataset.pollInterval) * 1000;
+        pollTimer = setInterval(async function() {
+            try {
+                const url = `${$liveResults.dataset.pollUrl}?version=${version}`;
+                const response = await fetch(url, { credentials: "same-origin" });
+                if (response.status === 200) {
+                    render(await response.json());
+                }
+            } catch (e) {
+                // 通信エラーは次の回に取り直す
+            }
+        }, interval);
+    }
+
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    source = new EventSource($liveResults.dataset.streamUrl);
+    source.addEventListener("results", function(e) {
+        render(JSON.parse(e.data));
+    });
+    source.addEventListener("closed", stop);
+    source.addEventListener("error", function() {
+        // 204（配信の人数が上限）やエラーで繋ぎ直さなくなったら、ポーリングに切り替える
+        if (source.readyState === EventSource.CLOSED && !finished) {
+            startPolling();
+        }
+    });
+});
@@ -16,24 +16,26 @@ document.addEventListener("DOMContentLoaded", function() {
     // canvas要素に対して呼び出すメソッド。描画コンテキストを取得
     const ctx = $chart.getContext("2d");
 
-    let data;
-
-    // 合計を計算（reduce を使う）
-    const totalCount = counts.reduce((sum, count) => sum + count, 0);
-    // ここで `0` は初期値。配列が空でも安全に合計を取るため。
-
-    if(totalCount === 0) {
-        data ={
-            labels: ["まだ投票がありません"],
-            datasets: [{
-                data: [1],
-                backgroundColor: [
-                    "#9ca3af"
-                ],
-            }]
+    let totalCount;
+
+    // 票数からグラフのデータを作る（票数のリアルタイム更新でも使う）
+    function buildData(counts) {
+        // 合計を計算（reduce を使う）
+        totalCount = counts.reduce((sum, count) => sum + count, 0);
+        // ここで `0` は初期値。配列が空でも安全に合計を取るため。
+
+        if(totalCount === 0) {
+            return {
+                labels: ["まだ投票がありません"],
+                datasets: [{
+                    data: [1],
+                    backgroundColor: [
+                        "#9ca3af"
+                    ],
+                }]
+            }
         }
-    } else {
-        data = {
+        return {
             labels: labels,
             datasets: [{
                 data: counts,
@@ -42,6 +44,8 @@ document.addEventListener("DOMContentLoaded", function() {
         }
     }
 
+    const data = buildData(counts);
+
     // プラグイン登録
     Chart.register(ChartDataLabels);
     
@@ -107,7 +111,7 @@ document.addEventListener("DOMContentLoaded", function() {
     };
 
 
-    new Chart(ctx, {
+    const chart = new Chart(ctx, {
         type: 'pie',
         data: data,
         options: {
@@ -146,4 +150,15 @@ document.addEventListener("DOMContentLoaded", function() {
         },
         plugins: [htmlLegendPlugin, ChartDataLabels]
     });
+
+    // 票数が変わった時に描き直す（live-results.js から呼ぶ）
+    window.updatePieChart = function(newCounts) {
+        const wasEmpty = totalCount === 0;
+        chart.data = buildData(newCounts);
+        // 「まだ投票がありません」から切り替わった時は凡例も作り直す
+        if (wasEmpty !== (totalCount === 0)) {
+            chart._legendBuilt = false;
+        }
+        chart.update();
+    };
 });
\ No newline at end of file